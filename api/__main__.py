@@ -0,0 +1,74 @@
+"""
+Run the API, or report what importing it costs
+
+Uso:
+    python -m api                      # uvicorn api.app:app na porta $PORT
+    python -m api --import-time        # resumo de `python -X importtime -c "import api.app"`
+    python -m api --import-time --top 30 --module api.prediction_utils
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """``(module, self_us, cumulative_us)`` for every line of ``-X importtime`` output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = [part.strip() for part in line.split(":", 1)[1].split("|")]
+        rows.append((module, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def import_report(module: str, top: int = 20) -> str:
+    """Import ``module`` in a fresh interpreter and summarize where the time goes"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [os.getcwd(), os.getenv("PYTHONPATH")]))}
+    )
+    rows = parse_importtime(proc.stderr)
+    if proc.returncode != 0 or not rows:
+        return f"Falha ao importar {module}:\n{proc.stderr[-2000:]}"
+
+    total = next((cumulative for name, _, cumulative in rows if name == module), sum(r[1] for r in rows))
+    by_package: Dict[str, int] = defaultdict(int)
+    for name, self_us, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+
+    lines = [f"import {module}: {total / 1e6:.3f}s ({len(rows)} módulos)", "", "Pacotes (tempo próprio somado):"]
+    for package, us in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+        lines.append(f"  {us / 1e6:8.3f}s  {us / total * 100:5.1f}%  {package}")
+    lines += ["", "Módulos mais lentos (acumulado):"]
+    for name, _, cumulative in sorted(rows, key=lambda r: -r[2])[:top]:
+        lines.append(f"  {cumulative / 1e6:8.3f}s  {name}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m api", description="Stock LSTM Predictor API")
+    parser.add_argument("--import-time", action="store_true", help="Report import cost instead of serving")
+    parser.add_argument("--module", default="api.app", help="Module measured by --import-time")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    args = parser.parse_args()
+
+    if args.import_time:
+        print(import_report(args.module, args.top))
+        return
+
+    import uvicorn
+
+    uvicorn.run("api.app:app", host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,185 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.routing import Match
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
+import numpy as np
+from typing import Dict, List, Optional
+import asyncio
+import base64
+import json
 import time
 import os
-from .prediction_utils import load_model_and_scaler, predict_stock
+from contextlib import asynccontextmanager
+from .forecast_utils import ForecastService, compute_forecasts
+from .horizon_utils import MAX_HORIZON
+from .registry_utils import ModelRegistry
+from .cache_utils import LRUCache, SingleFlight, create_result_cache
+from .pipeline_utils import StageOverloaded, create_stages
 from .log_utils import PredictionLogger
-from .dashboard_utils import (
-    get_dashboard_data,
-    create_ticker_distribution_chart,
-    create_daily_predictions_chart,
-    create_execution_time_chart,
-    create_r2_distribution_chart
+from .metrics_utils import (
+    ERRORS, REQUEST_SECONDS, REQUESTS_IN_FLIGHT, collector, metrics_response, request_spans, span,
+    start_request_spans
 )
+from .session_utils import get_session_store
 
 # ==================== LOAD MODEL ====================
-MODEL_PATH = "/app/models/stock_lstm.pt"
-SCALER_PATH = "/app/models/scaler.joblib"
+# Versões em MODEL_REGISTRY_DIR (ou os artefatos de /app/models); pesos mapeados em memória.
+# A carga roda em segundo plano a partir do lifespan: o processo aceita conexões em segundos.
+registry = ModelRegistry()
+STARTED_AT = time.time()
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def predictions():
+    """``prediction_utils`` (torch, sklearn, matplotlib), imported on first use"""
+    from . import prediction_utils
+    return prediction_utils
 
-try:
-    model, scaler = load_model_and_scaler(MODEL_PATH, SCALER_PATH)
-except Exception as e:
-    print(f"Error loading model: {e}")
-    model = None
-    scaler = None
+
+def active_model():
+    """Model version serving this request (fixed for the whole request)"""
+    active = registry.current()
+    if active is None:
+        if registry.state == "loading":
+            raise HTTPException(
+                status_code=503,
+                detail="Modelo carregando. Tente novamente em instantes.",
+                headers={"Retry-After": "2"}
+            )
+        raise HTTPException(status_code=500, detail="Model not loaded")
+    return active
 
 try:
     logger = PredictionLogger()
 except ValueError as e:
     logger = None
 
+MAX_BATCH_TICKERS = int(os.getenv("MAX_BATCH_TICKERS", "100"))
+
+# ==================== PIPELINE STAGES ====================
+stages = create_stages()
+
+
+def warm_pipeline(active):
+    """Exercise the CPU and render paths once so the first request pays no imports"""
+    import pandas as pd
+    
+    closes = 100 + np.cumsum(np.random.default_rng(0).normal(0, 1, 120))
+    df = pd.DataFrame({"Close": closes}, index=pd.bdate_range("2020-01-01", periods=len(closes), name="Date"))
+    _, series = predictions().run_prediction(df, "WARMUP", "2020-01-01", "2020-07-01", active.model)
+    stages["render"].submit(predictions().generate_plot_png, *series, "WARMUP", "2020-01-01", "2020-07-01")
+
+# ==================== PLOT CACHE ====================
+# plot_id -> (ticker, start_date, end_date, horizon, model_version): pequeno, permite re-gerar o gráfico
+plot_specs = LRUCache(maxsize=int(os.getenv("PLOT_SPEC_CACHE_SIZE", "10000")))
+# plot_id -> (y_true, y_pred) em float32
+plot_series = LRUCache(maxsize=int(os.getenv("PLOT_SERIES_CACHE_SIZE", "256")))
+# plot_id -> PNG
+plot_images = LRUCache(
+    maxsize=int(os.getenv("PLOT_CACHE_SIZE", "128")),
+    ttl=float(os.getenv("PLOT_CACHE_TTL", "3600"))
+)
+
+
+def register_plot(
+    ticker: str, start_date: str, end_date: str, series, model_version: str, horizon: int = 1
+) -> str:
+    """Remember what is needed to render a prediction plot later"""
+    pid = predictions().plot_id(ticker, start_date, end_date, model_version, horizon)
+    plot_specs.set(pid, (ticker, start_date, end_date, horizon, model_version))
+    plot_series.set(pid, tuple(np.asarray(s, dtype=np.float32) for s in series))
+    return pid
+
+# versão dos dados do dashboard -> gráficos renderizados
+chart_cache = LRUCache(
+    maxsize=int(os.getenv("DASHBOARD_CHART_CACHE_SIZE", "8")),
+    ttl=float(os.getenv("DASHBOARD_CHART_TTL", "300"))
+)
+
+# ==================== RESULT CACHE ====================
+# (ticker, start_date, end_date, horizon, model_version) -> (resultado sem gráfico, (y_true, y_pred) em float32)
+result_cache = create_result_cache()
+inflight = SingleFlight()
+
+# Expostos em /metrics (hits/misses, tarefas pendentes por pool)
+collector.caches.update({"plot_images": plot_images, "plot_series": plot_series, "dashboard_charts": chart_cache})
+if result_cache is not None:
+    collector.caches["results"] = result_cache
+collector.pools.update(stages)
+collector.gauges["singleflight_inflight"] = ("Distinct computations in flight", lambda: inflight.inflight)
+
+# ==================== UNIVERSE FORECASTS ====================
+# Tabela pré-calculada (FORECAST_SCHEDULE ou `python -m api.forecast_utils run` via cron)
+forecasts = ForecastService()
+
+
+def compute_universe_forecasts():
+    active = active_model()
+    return compute_forecasts(active.model, active.version)
+
+
+def result_key(ticker: str, start_date: str, end_date: str, horizon: int, model_version: str) -> tuple:
+    return (ticker.strip().upper(), start_date, end_date, horizon, model_version)
+
+
+def cache_result(key: tuple, result: dict, series) -> tuple:
+    entry = (dict(result), tuple(np.asarray(s, dtype=np.float32) for s in series))
+    if result_cache is not None:
+        result_cache.set(key, entry)
+    return entry
+
+
+async def compute_prediction(active, ticker: str, start_date: str, end_date: str, horizon: int = 1) -> tuple:
+    df = await stages["io"].run(predictions().load_stock_data, ticker, start_date, end_date)
+    result, series = await stages["cpu"].run(
+        predictions().run_prediction, df, ticker, start_date, end_date, active.model, horizon
+    )
+    return cache_result(result_key(ticker, start_date, end_date, horizon, active.version), result, series)
+
+
+async def get_prediction(active, ticker: str, start_date: str, end_date: str, horizon: int = 1) -> tuple:
+    """
+    Cached prediction for one ticker: ``(result, (y_true, y_pred))``
+
+    Identical requests arriving while the first one is still computing
+    wait on that computation instead of downloading and running the model again.
+    """
+    key = result_key(ticker, start_date, end_date, horizon, active.version)
+    entry = result_cache.get(key) if result_cache is not None else None
+    if entry is None:
+        entry = await inflight.do(key, lambda: compute_prediction(active, ticker, start_date, end_date, horizon))
+    result, series = entry
+    return dict(result), series
+
+# ==================== SESSIONS ====================
+sessions = get_session_store()
+
 # ==================== TEMPLATES ====================
 templates = Jinja2Templates(directory="/app/api/templates")
 
 
 # ==================== FASTAPI APP ====================
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    registry.load_in_background(warmup=warm_pipeline)
+    forecasts.start(compute_universe_forecasts, ready=lambda: registry.state == "ready")
+    yield
+    forecasts.stop()
+    if logger:
+        logger.close()
+    for stage in stages.values():
+        stage.shutdown(wait=False)
+
+
 app = FastAPI(
     title="Stock LSTM Predictor",
     description="API para previsão de preços de ações usando LSTM",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -51,6 +190,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def route_template(request: Request) -> str:
+    """Path template of the matched route (bounded label set for metrics)"""
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", request.url.path)
+    return "unmatched"
+
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    start_request_spans()
+    route = route_template(request)
+    in_flight = REQUESTS_IN_FLIGHT.labels(route=route)
+    in_flight.inc()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except Exception:
+        ERRORS.labels(route=route, status="500").inc()
+        raise
+    finally:
+        in_flight.dec()
+        REQUEST_SECONDS.labels(method=request.method, route=route).observe(time.perf_counter() - start)
+    if response.status_code >= 400:
+        ERRORS.labels(route=route, status=str(response.status_code)).inc()
+    return response
+
 app.mount(
     "/static",
     StaticFiles(directory="/app/api/templates/static"),
@@ -62,13 +229,17 @@ class PredictionRequest(BaseModel):
     ticker: str
     start_date: str  # YYYY-MM-DD
     end_date: str    # YYYY-MM-DD
+    include_plot: bool = True  # False: o gráfico fica disponível em plot_url
+    horizon: int = 1  # dias previstos à frente (autoregressivo)
 
     model_config = {
         "json_schema_extra": {
             "example": {
                 "ticker": "AAPL",  # usa .SA como fallback automático se for brasileira
                 "start_date": "2023-01-01",
-                "end_date": "2024-01-01"
+                "end_date": "2024-01-01",
+                "include_plot": True,
+                "horizon": 5
             }
         }
     }
@@ -83,25 +254,79 @@ class PredictionResponse(BaseModel):
     price_change_pct: float
     metrics: dict
     data_points: int
-    plot: str
+    plot: Optional[str] = None
+    plot_url: Optional[str] = None
+    forecast: Optional[List[float]] = None
+    forecast_stats: Optional[dict] = None
+
+class BatchPredictionRequest(BaseModel):
+    tickers: List[str]
+    start_date: str  # YYYY-MM-DD
+    end_date: str    # YYYY-MM-DD
+    include_plot: bool = False
+    horizon: int = 1
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "tickers": ["PETR4", "VALE3", "ITUB4"],
+                "start_date": "2023-01-01",
+                "end_date": "2024-01-01",
+                "include_plot": False,
+                "horizon": 5
+            }
+        }
+    }
+
+class BatchPredictionResponse(BaseModel):
+    count: int
+    results: List[PredictionResponse]
+    errors: Dict[str, str]
+
+class SessionRequest(BaseModel):
+    ticker: str
+    start_date: str  # YYYY-MM-DD: histórico que define a normalização
+    end_date: str    # YYYY-MM-DD
+
+class SessionAppendRequest(BaseModel):
+    closes: List[float]
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {"closes": [38.12, 38.40]}
+        }
+    }
+
+class SessionResponse(BaseModel):
+    ticker: str
+    last_close: float
+    next_price: float
+    price_change: float
+    price_change_pct: float
+    window: List[float]
+    data_min: float
+    data_max: float
+    closes_seen: int
+    updated_at: float
 
 # ==================== ENDPOINTS ====================
 @app.get("/", response_class=HTMLResponse)
 def root(request: Request):
     return templates.TemplateResponse(
+        request,
         "index.html",
         {"request": request}
     )
 
 @app.get("/dashboard", response_class=HTMLResponse)
-def dashboard(request: Request):
+async def dashboard(request: Request):
+    # matplotlib só é importado quando o dashboard é aberto
+    from .dashboard_utils import get_dashboard_data, render_dashboard_charts
+    
     try:
-        data = get_dashboard_data()
-        
-        chart_ticker_distribution = create_ticker_distribution_chart(data)
-        chart_daily_predictions = create_daily_predictions_chart(data)
-        chart_execution_time = create_execution_time_chart(data)
-        chart_r2_distribution = create_r2_distribution_chart(data)
+        data = await stages["io"].run(get_dashboard_data)
+        # Cache miss: os quatro gráficos são renderizados em paralelo no pool de processos
+        charts = await render_dashboard_charts(data, chart_cache, stages["render"].run)
         
         total = data["total_predictions"]
         success_rate = round((data["successful"] / total * 100), 1) if total > 0 else 0
@@ -113,17 +338,21 @@ def dashboard(request: Request):
             "failed": data["failed"],
             "success_rate": success_rate,
             "recent_logs": data["logs"][:10],
-            "chart_ticker_distribution": chart_ticker_distribution,
-            "chart_daily_predictions": chart_daily_predictions,
-            "chart_execution_time": chart_execution_time,
-            "chart_r2_distribution": chart_r2_distribution
+            **charts
         }
         
         return templates.TemplateResponse(
+            request,
             "dashboard.html",
             context
         )
         
+    except StageOverloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         print(f"Error generating dashboard: {e}")
         raise HTTPException(
@@ -131,102 +360,459 @@ def dashboard(request: Request):
             detail=f"Error generating dashboard: {str(e)}"
         )
 
-# @app.get("/health")
-# def health():
-#     """Health check endpoint"""
-#     return {
-#         "status": "ok",
-#         "model_loaded": model is not None,
-#         "scaler_loaded": scaler is not None
-#     }
+@app.get("/health/live")
+def health_live():
+    """Liveness: the process is up and the event loop answers"""
+    return {"status": "ok", "uptime_seconds": round(time.time() - STARTED_AT, 1)}
+
+@app.get("/health/ready")
+def health_ready():
+    """Readiness: model loaded and warmed; 503 while loading or after a failed load"""
+    active = registry.current()  # também observa ativações feitas por outros workers
+    body = {
+        "status": registry.state,
+        "model_loaded": active is not None,
+        "scaler_loaded": active is not None and active.scaler is not None,
+        "warmed": registry.state == "ready",
+        "model_version": active.version if active else None,
+        "error": registry.error,
+        "uptime_seconds": round(time.time() - STARTED_AT, 1)
+    }
+    if registry.state != "ready":
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+# Compatibilidade com healthchecks antigos
+app.add_api_route("/health", health_ready, methods=["GET"])
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint (latency, errors, stage timings, caches, pools)"""
+    body, content_type = metrics_response()
+    return Response(content=body, media_type=content_type)
+
+def submit_log(stages: Optional[Dict[str, float]] = None, **kwargs):
+    """Queue a log entry (``stages`` defaults to the request breakdown); uploaded in the background"""
+    if not logger:
+        return
+    try:
+        with span("log_write"):
+            logger.log_prediction(stages=request_spans() if stages is None else stages, **kwargs)
+    except Exception as log_err:
+        print(f"⚠️  Falha ao registrar log de {kwargs.get('ticker')}: {log_err}")
+
+
+def check_horizon(horizon: int):
+    if not 1 <= horizon <= MAX_HORIZON:
+        raise HTTPException(status_code=400, detail=f"horizon deve estar entre 1 e {MAX_HORIZON}")
+
 
 @app.post("/api/predict", response_model=PredictionResponse)
-def predict(request: PredictionRequest):
-    if model is None or scaler is None:
-        raise HTTPException(status_code=500, detail="Model not loaded")
+async def predict(request: PredictionRequest):
+    active = active_model()
     
+    ticker = request.ticker.upper()
+    start_time = time.time()
     try:
         if request.start_date >= request.end_date:
             raise HTTPException(
                 status_code=400,
                 detail="Data inicial deve ser anterior à data final"
             )
+        check_horizon(request.horizon)
         
-        start_time = time.time()
-        result = predict_stock(
-            ticker=request.ticker.upper(),
-            start_date=request.start_date,
-            end_date=request.end_date,
-            model=model,
-            scaler=scaler
+        result, (y_true, y_pred) = await get_prediction(
+            active, ticker, request.start_date, request.end_date, request.horizon
+        )
+        pid = register_plot(
+            ticker, request.start_date, request.end_date, (y_true, y_pred), active.version, request.horizon
         )
+        result["plot_url"] = f"/api/plot/{pid}"
+        if request.include_plot:
+            png = plot_images.get(pid)
+            if png is None:
+                with span("plot"):
+                    png = await stages["render"].run(
+                        predictions().generate_plot_png, y_true, y_pred, ticker, request.start_date, request.end_date
+                    )
+                plot_images.set(pid, png)
+            result["plot"] = f"data:image/png;base64,{base64.b64encode(png).decode()}"
         duration = time.time() - start_time
         
-        if logger:
-            try:
-                log_info = logger.log_prediction(
-                    ticker=request.ticker.upper(),
-                    start_date=request.start_date,
-                    end_date=request.end_date,
-                    result=result,
-                    duration=duration,
-                    success=True
-                )
-            except Exception as log_err:
-                log_err
+        submit_log(
+            ticker=ticker,
+            start_date=request.start_date,
+            end_date=request.end_date,
+            result=result,
+            duration=duration,
+            success=True
+        )
                 
         return PredictionResponse(**result)
     
-    except ValueError as e:
-        if logger:
-            try:
-                logger.log_prediction(
-                    ticker=request.ticker.upper(),
-                    start_date=request.start_date,
-                    end_date=request.end_date,
-                    result={},
-                    duration=time.time() - start_time if 'start_time' in locals() else 0,
-                    success=False,
-                    error=str(e)
-                )
-            except Exception as log_err:
-                log_err
+    except HTTPException:
+        raise
+    except StageOverloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except (ValueError, RuntimeError) as e:
+        submit_log(
+            ticker=ticker,
+            start_date=request.start_date,
+            end_date=request.end_date,
+            result={},
+            duration=time.time() - start_time,
+            success=False,
+            error=str(e)
+        )
         raise HTTPException(status_code=400, detail=str(e))
-    except RuntimeError as e:
-        if logger:
-            try:
-                logger.log_prediction(
-                    ticker=request.ticker.upper(),
-                    start_date=request.start_date,
-                    end_date=request.end_date,
-                    result={},
-                    duration=time.time() - start_time if 'start_time' in locals() else 0,
-                    success=False,
-                    error=str(e)
+    except Exception as e:
+        submit_log(
+            ticker=ticker,
+            start_date=request.start_date,
+            end_date=request.end_date,
+            result={},
+            duration=time.time() - start_time,
+            success=False,
+            error=str(e)
+        )
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+def stream_line(event: str, started: float, **data) -> bytes:
+    """One NDJSON line of ``/api/predict/stream``"""
+    payload = {"event": event, "elapsed": round(time.time() - started, 3), **data}
+    return (json.dumps(payload, ensure_ascii=False) + "\n").encode()
+
+
+async def prediction_events(active, ticker: str, request: PredictionRequest, key: tuple, entry, df, started: float):
+    """Events of one streamed prediction, from a cached ``entry`` or from the downloaded ``df``"""
+    pu = predictions()
+    
+    def line(event: str, **data) -> bytes:
+        return stream_line(event, started, **data)
+    
+    try:
+        if entry is not None:
+            result, series = dict(entry[0]), entry[1]
+            yield line("stage", stage="cache")
+            yield line("next_price", **{k: result[k] for k in ("last_close", "next_price", "price_change", "price_change_pct")})
+            yield line("metrics", metrics=result["metrics"], data_points=result["data_points"])
+            y_true, y_pred = series
+            for start in range(0, len(y_pred), pu.STREAM_CHUNK_SIZE):
+                end = start + pu.STREAM_CHUNK_SIZE
+                yield line("series", **pu.series_event(start, y_true[start:end], y_pred[start:end]))
+        else:
+            yield line("stage", stage="download")
+            # run_prediction emite da thread do estágio cpu; a fila entrega os eventos na ordem ao loop
+            loop = asyncio.get_running_loop()
+            events = asyncio.Queue()
+            task = asyncio.ensure_future(stages["cpu"].run(
+                pu.run_prediction, df, ticker, request.start_date, request.end_date, active.model, request.horizon,
+                lambda name, data: loop.call_soon_threadsafe(events.put_nowait, (name, data))
+            ))
+            task.add_done_callback(lambda _: events.put_nowait(None))
+            while (item := await events.get()) is not None:
+                yield line(item[0], **item[1])
+            result, series = cache_result(key, *await task)
+            result = dict(result)
+        
+        pid = register_plot(ticker, request.start_date, request.end_date, series, active.version, request.horizon)
+        result["plot_url"] = f"/api/plot/{pid}"
+        yield line("result", result=result)
+        if request.include_plot:
+            png = plot_images.get(pid)
+            if png is None:
+                with span("plot"):
+                    png = await stages["render"].run(
+                        pu.generate_plot_png, *series, ticker, request.start_date, request.end_date
+                    )
+                plot_images.set(pid, png)
+            yield line("plot", plot=f"data:image/png;base64,{base64.b64encode(png).decode()}")
+        submit_log(
+            ticker=ticker,
+            start_date=request.start_date,
+            end_date=request.end_date,
+            result=result,
+            duration=time.time() - started,
+            success=True
+        )
+        yield line("done")
+    except StageOverloaded as e:
+        yield line("error", status=503, detail=str(e))
+    except Exception as e:
+        status = 400 if isinstance(e, (ValueError, RuntimeError)) else 500
+        submit_log(
+            ticker=ticker,
+            start_date=request.start_date,
+            end_date=request.end_date,
+            result={},
+            duration=time.time() - started,
+            success=False,
+            error=str(e)
+        )
+        yield line("error", status=status, detail=str(e) if status == 400 else f"Internal server error: {str(e)}")
+
+
+@app.post("/api/predict/stream")
+async def predict_stream(request: PredictionRequest):
+    """
+    ``/api/predict`` as a stream of NDJSON events
+
+    ``stage`` (download or cache, scaling, windowing, inference), then
+    ``next_price``, ``series`` chunks of ``(y_true, y_pred)`` while the
+    inference runs, ``metrics``, ``result`` (the ``/api/predict`` body
+    without the plot), ``plot`` (with ``include_plot``) and ``done``.
+
+    Validation and download errors are regular HTTP errors; the response
+    starts once the closes are in. Later failures arrive as an ``error``
+    event.
+    """
+    active = active_model()
+    
+    ticker = request.ticker.upper()
+    start_time = time.time()
+    if request.start_date >= request.end_date:
+        raise HTTPException(
+            status_code=400,
+            detail="Data inicial deve ser anterior à data final"
+        )
+    check_horizon(request.horizon)
+    
+    key = result_key(ticker, request.start_date, request.end_date, request.horizon, active.version)
+    entry = result_cache.get(key) if result_cache is not None else None
+    df = None
+    if entry is None:
+        try:
+            df = await stages["io"].run(predictions().load_stock_data, ticker, request.start_date, request.end_date)
+        except StageOverloaded as e:
+            raise HTTPException(
+                status_code=503,
+                detail=str(e),
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        except (ValueError, RuntimeError) as e:
+            submit_log(
+                ticker=ticker,
+                start_date=request.start_date,
+                end_date=request.end_date,
+                result={},
+                duration=time.time() - start_time,
+                success=False,
+                error=str(e)
+            )
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    return StreamingResponse(
+        prediction_events(active, ticker, request, key, entry, df, start_time),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/predict/batch", response_model=BatchPredictionResponse)
+async def predict_batch(request: BatchPredictionRequest):
+    active = active_model()
+    
+    tickers = list(dict.fromkeys(t.strip().upper() for t in request.tickers if t.strip()))
+    if not tickers:
+        raise HTTPException(status_code=400, detail="Informe ao menos um ticker")
+    if len(tickers) > MAX_BATCH_TICKERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo de {MAX_BATCH_TICKERS} tickers por requisição"
+        )
+    if request.start_date >= request.end_date:
+        raise HTTPException(
+            status_code=400,
+            detail="Data inicial deve ser anterior à data final"
+        )
+    check_horizon(request.horizon)
+    
+    start_time = time.time()
+    try:
+        cached = {}
+        if result_cache is not None:
+            for ticker in tickers:
+                entry = result_cache.get(
+                    result_key(ticker, request.start_date, request.end_date, request.horizon, active.version)
                 )
-            except Exception as log_err:
-                log_err
+                if entry is not None:
+                    cached[ticker] = entry
+        
+        # Só os tickers fora do cache vão para download + inferência
+        computed, errors, series = [], {}, {}
+        missing = [t for t in tickers if t not in cached]
+        if missing:
+            frames = await stages["io"].run(
+                predictions().load_stocks_data, missing, request.start_date, request.end_date
+            )
+            computed, errors, series = await stages["cpu"].run(
+                predictions().run_batch_prediction,
+                frames, request.start_date, request.end_date, active.model, request.horizon
+            )
+        for result in computed:
+            key = result_key(result["ticker"], request.start_date, request.end_date, request.horizon, active.version)
+            cached[result["ticker"]] = cache_result(key, result, series[result["ticker"]])
+        results = [dict(cached[t][0]) for t in tickers if t in cached]
+        series = {t: cached[t][1] for t in cached}
+        
+        pids = [
+            register_plot(
+                r["ticker"], request.start_date, request.end_date, series[r["ticker"]], active.version, request.horizon
+            )
+            for r in results
+        ]
+        for result, pid in zip(results, pids):
+            result["plot_url"] = f"/api/plot/{pid}"
+        if request.include_plot:
+            with span("plot"):
+                plots = await asyncio.gather(*[
+                    stages["render"].run(
+                        predictions().generate_plot_png,
+                        *series[r["ticker"]], r["ticker"], request.start_date, request.end_date
+                    )
+                    for r in results
+                ])
+            for result, pid, png in zip(results, pids, plots):
+                plot_images.set(pid, png)
+                result["plot"] = f"data:image/png;base64,{base64.b64encode(png).decode()}"
+    except StageOverloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except (ValueError, RuntimeError) as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        e
-
-        if logger:
-            try:
-                logger.log_prediction(
-                    ticker=request.ticker.upper(),
-                    start_date=request.start_date,
-                    end_date=request.end_date,
-                    result={},
-                    duration=time.time() - start_time if 'start_time' in locals() else 0,
-                    success=False,
-                    error=str(e)
-                )
-            except Exception as log_err:
-                log_err
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    duration = time.time() - start_time
+    
+    # Tempo e etapas do lote rateados entre os tickers para não distorcer o dashboard
+    per_ticker = duration / len(tickers)
+    stages_per_ticker = {name: round(seconds / len(tickers), 4) for name, seconds in request_spans().items()}
+    for result in results:
+        submit_log(
+            ticker=result["ticker"],
+            start_date=request.start_date,
+            end_date=request.end_date,
+            result=result,
+            duration=per_ticker,
+            success=True,
+            stages=stages_per_ticker,
+            batch_size=len(tickers)
+        )
+    for ticker, error in errors.items():
+        submit_log(
+            ticker=ticker,
+            start_date=request.start_date,
+            end_date=request.end_date,
+            result={},
+            duration=per_ticker,
+            success=False,
+            error=error,
+            stages=stages_per_ticker,
+            batch_size=len(tickers)
+        )
+    
+    return BatchPredictionResponse(
+        count=len(results),
+        results=[PredictionResponse(**r) for r in results],
+        errors=errors
+    )
+
+@app.get("/api/plot/{plot_id}")
+async def get_plot(plot_id: str):
+    png = plot_images.get(plot_id)
+    if png is None:
+        spec = plot_specs.get(plot_id)
+        if spec is None:
+            raise HTTPException(status_code=404, detail="Gráfico não encontrado ou expirado")
+        ticker, start_date, end_date, horizon, model_version = spec
+        
+        try:
+            series = plot_series.get(plot_id)
+            if series is None:
+                # Só re-gera com o modelo que emitiu o id; após uma troca o gráfico não existe mais
+                active = active_model()
+                if active.version != model_version:
+                    raise HTTPException(
+                        status_code=410,
+                        detail=f"Gráfico gerado pelo modelo {model_version}, que não está mais ativo"
+                    )
+                _, series = await get_prediction(active, ticker, start_date, end_date, horizon)
+                plot_series.set(plot_id, series)
+            with span("plot"):
+                png = await stages["render"].run(predictions().generate_plot_png, *series, ticker, start_date, end_date)
+        except StageOverloaded as e:
+            raise HTTPException(
+                status_code=503,
+                detail=str(e),
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        except (ValueError, RuntimeError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        plot_images.set(plot_id, png)
+    
+    return Response(
+        content=png,
+        media_type="image/png",
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
+
+@app.post("/api/sessions", response_model=SessionResponse)
+async def create_session(request: SessionRequest):
+    """Seed (or reset) the rolling window of a ticker from its history"""
+    active = active_model()
+    if request.start_date >= request.end_date:
+        raise HTTPException(status_code=400, detail="Data inicial deve ser anterior à data final")
+    
+    ticker = request.ticker.strip().upper()
+    try:
+        df = await stages["io"].run(predictions().load_stock_data, ticker, request.start_date, request.end_date)
+        session = await stages["cpu"].run(sessions.create, ticker, df["Close"].to_numpy(), active.model)
+    except StageOverloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except (ValueError, RuntimeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return SessionResponse(**session.to_dict())
+
+@app.get("/api/sessions/{ticker}", response_model=SessionResponse)
+def get_session(ticker: str):
+    session = sessions.get(ticker.strip().upper())
+    if session is None:
+        raise HTTPException(status_code=404, detail="Sessão não encontrada ou expirada")
+    return SessionResponse(**session.to_dict())
+
+@app.post("/api/sessions/{ticker}/closes", response_model=SessionResponse)
+async def append_session_closes(ticker: str, request: SessionAppendRequest):
+    """Push new closes into the window and return the updated next_price"""
+    active = active_model()
+    if not request.closes:
+        raise HTTPException(status_code=400, detail="Informe ao menos um fechamento")
+    
+    try:
+        session = await stages["cpu"].run(sessions.append, ticker.strip().upper(), request.closes, active.model)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Sessão não encontrada ou expirada")
+    except StageOverloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    return SessionResponse(**session.to_dict())
 
 @app.get("/api/info")
 def info():
+    active = registry.current()
     return {
         "model_name": "Stock LSTM Predictor",
         "architecture": "LSTM com 2 camadas",
@@ -235,9 +821,99 @@ def info():
         "input_size": 1,
         "target_market": "Global - Ações de qualquer mercado (IBOV, NYSE, NASDAQ, etc.)",
         "supported_tickers": "Brasileiras (.SA), Americanas (MSFT, AAPL), e outras",
+        "model_version": active.version if active else None,
+        "inference_backend": active.model.backend if active else None,
+        "inference": active.model.info() if active else None,
         "version": "1.0.0"
     }
 
+# ==================== MODEL ADMIN ====================
+def check_admin(token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints disabled (ADMIN_TOKEN not set)")
+    if token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@app.get("/api/models")
+def list_models():
+    active = registry.current()
+    return {
+        "active": active.info() if active else None,
+        "versions": registry.versions()
+    }
+
+@app.post("/api/admin/models/{version}/activate")
+async def activate_model(version: str, x_admin_token: Optional[str] = Header(None)):
+    """Load, verify and warm up ``version``, then swap it in without downtime"""
+    check_admin(x_admin_token)
+    try:
+        loaded = await stages["io"].run(registry.activate, version)
+    except StageOverloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error activating model: {str(e)}")
+    return loaded.info()
+
+# ==================== FORECASTS ====================
+def forecast_table():
+    table = forecasts.current()
+    if not len(table):
+        raise HTTPException(status_code=503, detail="Previsões do universo ainda não calculadas")
+    return table
+
+@app.get("/api/forecasts")
+def list_forecasts():
+    """Precomputed next-day forecasts of the whole universe, ranked by expected change"""
+    table = forecast_table()
+    return {**table.meta, "count": len(table), "forecasts": [table.rows[t] for t in table.ranked]}
+
+@app.get("/api/forecasts/screener")
+def forecast_screener(limit: int = 20, order: str = "desc", min_change_pct: Optional[float] = None):
+    """Tickers with the largest expected rise (``order=desc``) or fall (``order=asc``)"""
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order deve ser 'asc' ou 'desc'")
+    table = forecast_table()
+    rows = table.screener(limit=max(1, min(limit, len(table))), order=order, min_change_pct=min_change_pct)
+    return {
+        "computed_at": table.meta.get("computed_at"),
+        "model_version": table.meta.get("model_version"),
+        "count": len(rows),
+        "forecasts": rows
+    }
+
+@app.get("/api/forecasts/{ticker}")
+def get_forecast(ticker: str):
+    table = forecast_table()
+    ticker = ticker.strip().upper()
+    row = table.get(ticker) or table.get(f"{ticker}.SA")
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"Sem previsão pré-calculada para {ticker}")
+    return {**row, "computed_at": table.meta.get("computed_at"), "model_version": table.meta.get("model_version")}
+
+@app.post("/api/admin/forecasts/refresh")
+async def refresh_forecasts(x_admin_token: Optional[str] = Header(None)):
+    """Recompute the universe table now (same work as the daily schedule)"""
+    check_admin(x_admin_token)
+    try:
+        table = await stages["io"].run(forecasts.refresh, compute_universe_forecasts)
+    except StageOverloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    if table is None:
+        if forecasts.error:
+            raise HTTPException(status_code=500, detail=f"Error computing forecasts: {forecasts.error}")
+        raise HTTPException(status_code=409, detail="Outro processo já está calculando as previsões")
+    return {**table.meta, "count": len(table)}
+
 @app.get("/api/logs/recent")
 def get_recent_logs(limit: int = 10):
     try:
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with optional time-to-live
+
+    Args:
+        maxsize: Maximum number of entries kept; the least recently used
+            entry is evicted first
+        ttl: Seconds an entry stays valid (None = never expires)
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires_at = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+            return default if item is _MISSING else item[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            return item is not _MISSING and (item[1] is None or item[1] > time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache:
+    """
+    LRU+TTL cache stored in a SQLite file, shared by every worker process
+
+    Same interface as ``LRUCache``; values are pickled.
+    """
+
+    def __init__(self, path: str, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB, expires_at REAL, accessed_at REAL)"
+        )
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (repr(key),)
+            ).fetchone()
+            if row is not None and (row[1] is None or row[1] > now):
+                self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, repr(key)))
+                self.hits += 1
+                return pickle.loads(row[0])
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (repr(key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), expires_at, now)
+            )
+            self._conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,)
+            )
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        value = self.get(key, _MISSING)
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (repr(key),))
+        return default if value is _MISSING else value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at FROM cache WHERE key = ?", (repr(key),)
+            ).fetchone()
+        return row is not None and (row[0] is None or row[0] > time.time())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent async computations of the same key
+
+    The first caller starts the computation; callers arriving while it is
+    in flight await the same task instead of starting new work.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, "asyncio.Future"] = {}
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, coro_fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: um cliente que desconecta não cancela a computação dos demais
+        return await asyncio.shield(task)
+
+
+def create_result_cache():
+    """
+    Build the prediction result cache selected by ``RESULT_CACHE_BACKEND``
+
+    - memory (default): per-process LRU, enough for a single worker
+    - sqlite: file at ``RESULT_CACHE_PATH`` shared by all uvicorn workers
+    - none: disabled
+    """
+    backend = os.getenv("RESULT_CACHE_BACKEND", "memory").lower()
+    maxsize = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+    ttl = float(os.getenv("RESULT_CACHE_TTL", "900"))
+    if backend == "none":
+        return None
+    if backend == "sqlite":
+        return SQLiteCache(os.getenv("RESULT_CACHE_PATH", "/app/cache/results.sqlite"), maxsize, ttl)
+    return LRUCache(maxsize, ttl)
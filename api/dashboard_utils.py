@@ -1,7 +1,6 @@
+import asyncio
+import hashlib
 import json
-import os
-import boto3
-from botocore.exceptions import ClientError
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend
 import matplotlib.pyplot as plt
@@ -11,22 +10,19 @@ import io
 import base64
 from typing import Dict, List, Any
 import numpy as np
-
-
-def get_s3_client():
-    return boto3.client(
-        's3',
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        region_name=os.getenv("AWS_REGION", "us-east-1")
-    )
+from .rollup_utils import get_rollup_index
 
 
 def get_dashboard_data() -> Dict[str, Any]:
-    s3_bucket = os.getenv("S3_BUCKET_NAME")
-    s3_prefix = os.getenv("S3_LOG_PREFIX", "logs/")
-    
-    if not s3_bucket:
+    """
+    Dashboard aggregates read from the materialized rollup
+
+    Costs one rollup read plus the log objects written since its last
+    update, regardless of how many predictions were ever logged.
+    """
+    try:
+        index = get_rollup_index()
+    except ValueError:
         return {
             "total_predictions": 0,
             "successful": 0,
@@ -35,80 +31,8 @@ def get_dashboard_data() -> Dict[str, Any]:
         }
     
     try:
-        s3_client = get_s3_client()
-        
-        response = s3_client.list_objects_v2(
-            Bucket=s3_bucket,
-            Prefix=s3_prefix
-        )
-        
-        logs = []
-        successful = 0
-        failed = 0
-        tickers_count = {}
-        daily_predictions = {}
-        execution_times = []
-        r2_scores = []
-        prediction_changes = []
-        
-        if 'Contents' not in response:
-            return {
-                "total_predictions": 0,
-                "successful": 0,
-                "failed": 0,
-                "logs": []
-            }
-        
-        for obj in response['Contents']:
-            try:
-                log_response = s3_client.get_object(
-                    Bucket=s3_bucket,
-                    Key=obj['Key']
-                )
-                log_data = json.loads(log_response['Body'].read().decode('utf-8'))
-                logs.append(log_data)
-                
-                if log_data["execution"]["success"]:
-                    successful += 1
-                    
-                    if "result" in log_data and log_data["result"]:
-                        r2 = log_data["result"].get("metrics", {}).get("R2")
-                        if r2 is not None:
-                            r2_scores.append(r2)
-                        
-                        change_pct = log_data["result"].get("price_change_pct")
-                        if change_pct is not None:
-                            prediction_changes.append(change_pct)
-                else:
-                    failed += 1
-                
-                ticker = log_data["request"]["ticker"]
-                tickers_count[ticker] = tickers_count.get(ticker, 0) + 1
-                
-                timestamp = log_data["timestamp"]
-                day = timestamp.split("T")[0]
-                daily_predictions[day] = daily_predictions.get(day, 0) + 1
-                
-                exec_time = log_data["execution"]["duration_seconds"]
-                execution_times.append(exec_time)
-            
-            except Exception as e:
-                # print(f"⚠️  Error processing log {obj['Key']}: {e}")
-                e
-        
-        return {
-            "total_predictions": len(logs),
-            "successful": successful,
-            "failed": failed,
-            "logs": sorted(logs, key=lambda x: x["timestamp"], reverse=True),
-            "tickers_count": tickers_count,
-            "daily_predictions": daily_predictions,
-            "execution_times": execution_times,
-            "r2_scores": r2_scores,
-            "prediction_changes": prediction_changes
-        }
-    
-    except ClientError as e:
+        return index.refresh().dashboard_data()
+    except Exception as e:
         print(f"❌ Error reading logs from S3: {e}")
         return {
             "total_predictions": 0,
@@ -169,7 +93,7 @@ def create_daily_predictions_chart(data: Dict[str, Any]) -> str:
     ax.grid(True, alpha=0.3)
     
     ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m'))
-    ax.xaxis.set_major_locator(mdates.DayLocator(interval=max(1, len(dates)//10)))
+    ax.xaxis.set_major_locator(mdates.DayLocator(interval=max(1, (dates[-1] - dates[0]).days // 10)))
     plt.xticks(rotation=45)
     
     plt.tight_layout()
@@ -187,7 +111,7 @@ def create_execution_time_chart(data: Dict[str, Any]) -> str:
     
     n, bins, patches = ax.hist(exec_times, bins=20, color='#667eea', alpha=0.7, edgecolor='black')
     
-    cm = plt.cm.get_cmap('viridis')
+    cm = matplotlib.colormaps['viridis']
     bin_centers = 0.5 * (bins[:-1] + bins[1:])
     col = bin_centers - min(bin_centers)
     col /= max(col)
@@ -240,3 +164,41 @@ def fig_to_base64(fig) -> str:
     img_base64 = base64.b64encode(buf.read()).decode('utf-8')
     plt.close(fig)
     return f"data:image/png;base64,{img_base64}"
+
+
+# ==================== CHART CACHE ====================
+CHART_BUILDERS = {
+    "chart_ticker_distribution": create_ticker_distribution_chart,
+    "chart_daily_predictions": create_daily_predictions_chart,
+    "chart_execution_time": create_execution_time_chart,
+    "chart_r2_distribution": create_r2_distribution_chart
+}
+
+
+def chart_data_version(data: Dict[str, Any]) -> str:
+    """Version of the data behind the charts (rollup watermark, or a content hash)"""
+    if data.get("version"):
+        return data["version"]
+    payload = json.dumps(
+        {key: data.get(key) for key in ("tickers_count", "daily_predictions", "execution_times", "r2_scores")},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+async def render_dashboard_charts(data: Dict[str, Any], cache, run) -> Dict[str, str]:
+    """
+    Return the four dashboard charts, rendering them only on a cache miss
+
+    ``cache`` maps the data version to the rendered charts; ``run(builder,
+    data)`` is awaited for every chart (e.g. the render stage's ``run``),
+    so on a miss the four render concurrently.
+    """
+    version = chart_data_version(data)
+    charts = cache.get(version)
+    if charts is None:
+        rendered = await asyncio.gather(*[run(builder, data) for builder in CHART_BUILDERS.values()])
+        charts = dict(zip(CHART_BUILDERS, rendered))
+        cache.set(version, charts)
+    return charts
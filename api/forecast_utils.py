@@ -0,0 +1,338 @@
+"""
+Precomputed next-day forecasts for the ticker universe
+
+After the market closes, every ticker in ``FORECAST_UNIVERSE`` (default:
+``data/ibov_tickers.csv``) is predicted in one ``run_batch_prediction``
+pass and the results go to a compact table (``FORECAST_TABLE_PATH``, one
+NPZ of columns). The API keeps the table in memory, indexed by ticker and
+pre-sorted by expected change, so ``/api/forecasts`` answers without
+touching the model. Workers reload it when the file changes.
+
+Refresh either inside the service (``FORECAST_SCHEDULE=18:30``, weekdays,
+``FORECAST_TIMEZONE``) or from cron with the CLI. With several workers
+only the one holding the table lock computes.
+
+Uso:
+    python -m api.forecast_utils run                      # recalcula e grava a tabela
+    python -m api.forecast_utils run --tickers PETR4.SA,VALE3.SA
+    python -m api.forecast_utils show --top 10
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+FORECAST_TABLE_PATH = os.getenv("FORECAST_TABLE_PATH", "/app/cache/forecasts.npz")
+FORECAST_UNIVERSE = os.getenv(
+    "FORECAST_UNIVERSE", str(Path(__file__).resolve().parent.parent / "data" / "ibov_tickers.csv")
+)
+# Histórico usado para a normalização de cada ticker (mesmo papel de start_date na API)
+FORECAST_LOOKBACK_DAYS = int(os.getenv("FORECAST_LOOKBACK_DAYS", "730"))
+FORECAST_SCHEDULE = os.getenv("FORECAST_SCHEDULE", "off")
+FORECAST_TIMEZONE = os.getenv("FORECAST_TIMEZONE", "America/Sao_Paulo")
+FORECAST_RELOAD_SECONDS = float(os.getenv("FORECAST_RELOAD_SECONDS", "5"))
+# Fração mínima do universo com previsão para substituir a tabela anterior
+FORECAST_MIN_COVERAGE = float(os.getenv("FORECAST_MIN_COVERAGE", "0.5"))
+# Espera após um refresh agendado que falhou; dobra a cada falha seguida até o máximo
+FORECAST_RETRY_SECONDS = float(os.getenv("FORECAST_RETRY_SECONDS", "300"))
+FORECAST_RETRY_MAX_SECONDS = float(os.getenv("FORECAST_RETRY_MAX_SECONDS", "3600"))
+
+COLUMNS = ("last_close", "next_price", "price_change", "price_change_pct", "MAPE", "R2")
+
+
+class ForecastTable:
+    """
+    Forecast rows keyed by ticker, plus the tickers ranked by expected change
+
+    Stored as an NPZ of columns (tickers, as-of dates and float32 values)
+    with the run metadata; written atomically.
+    """
+
+    def __init__(self, rows: Optional[Dict[str, Dict[str, Any]]] = None, meta: Optional[Dict[str, Any]] = None):
+        self.rows = rows or {}
+        self.meta = meta or {}
+        self.ranked = sorted(self.rows, key=lambda t: self.rows[t]["price_change_pct"], reverse=True)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def get(self, ticker: str) -> Optional[Dict[str, Any]]:
+        return self.rows.get(ticker)
+
+    def screener(self, limit: int = 20, order: str = "desc", min_change_pct: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Top ``limit`` rows by expected change (``asc`` = biggest expected falls first)"""
+        tickers = self.ranked if order == "desc" else list(reversed(self.ranked))
+        rows = []
+        for ticker in tickers:
+            row = self.rows[ticker]
+            if min_change_pct is not None and abs(row["price_change_pct"]) < min_change_pct:
+                continue
+            rows.append(row)
+            if len(rows) >= limit:
+                break
+        return rows
+
+    @classmethod
+    def from_results(cls, results: List[Dict[str, Any]], as_of: Dict[str, str], meta: Dict[str, Any]) -> "ForecastTable":
+        rows = {}
+        for result in results:
+            ticker = result["ticker"]
+            rows[ticker] = {
+                "ticker": ticker,
+                "as_of": as_of[ticker],
+                **{k: result[k] for k in COLUMNS[:4]},
+                "MAPE": result["metrics"]["MAPE"],
+                "R2": result["metrics"]["R2"]
+            }
+        return cls(rows, meta)
+
+    def save(self, path: str) -> None:
+        tickers = list(self.rows)
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                ticker=np.array(tickers, dtype=str),
+                as_of=np.array([self.rows[t]["as_of"] for t in tickers], dtype="datetime64[D]"),
+                values=np.array([[self.rows[t][c] for c in COLUMNS] for t in tickers], dtype=np.float32).reshape(-1, len(COLUMNS)),
+                meta=np.array(json.dumps(self.meta, ensure_ascii=False))
+            )
+        os.replace(tmp, target)
+
+    @classmethod
+    def load(cls, path: str) -> "ForecastTable":
+        with np.load(path) as data:
+            rows = {}
+            for ticker, as_of, values in zip(data["ticker"], data["as_of"], data["values"]):
+                rows[str(ticker)] = {
+                    "ticker": str(ticker),
+                    "as_of": str(as_of),
+                    **{c: round(float(v), 4 if c == "R2" else 2) for c, v in zip(COLUMNS, values)}
+                }
+            meta = json.loads(str(data["meta"]))
+        return cls(rows, meta)
+
+
+# ==================== COMPUTATION ====================
+def compute_forecasts(
+    model,
+    model_version: str,
+    tickers: Optional[List[str]] = None,
+    lookback_days: int = FORECAST_LOOKBACK_DAYS
+) -> ForecastTable:
+    """Predict the next close of every ticker in one batched pass"""
+    from src.backtest import read_universe
+
+    from . import prediction_utils
+
+    tickers = tickers or read_universe(FORECAST_UNIVERSE)
+    # Dia do pregão no fuso do mercado (o agendador e is_stale usam o mesmo), não o do host
+    end = datetime.now(market_timezone()).date() + timedelta(days=1)
+    start = end - timedelta(days=lookback_days)
+    started = time.perf_counter()
+
+    frames = prediction_utils.load_stocks_data(tickers, str(start), str(end))
+    results, errors, _ = prediction_utils.run_batch_prediction(frames, str(start), str(end), model)
+    as_of = {t: str(frames[t].index[-1].date()) for t in frames if not isinstance(frames[t], Exception)}
+
+    meta = {
+        "computed_at": datetime.now(timezone.utc).isoformat(),
+        "model_version": model_version,
+        "start_date": str(start),
+        "end_date": str(end),
+        "tickers": len(tickers),
+        "errors": errors,
+        "seconds": round(time.perf_counter() - started, 2)
+    }
+    return ForecastTable.from_results(results, as_of, meta)
+
+
+def refresh_table(path: str, compute: Callable[[], ForecastTable]) -> Optional[ForecastTable]:
+    """
+    Compute and save the table unless another process is already doing it
+
+    Returns the new table, or ``None`` when the lock was taken. A run that
+    covers less than ``FORECAST_MIN_COVERAGE`` of the universe (provider
+    down, bad universe) raises ``RuntimeError`` and leaves the saved table
+    untouched.
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(f"{path}.lock", "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        table = compute()
+        expected = table.meta.get("tickers") or len(table)
+        if len(table) == 0 or len(table) < FORECAST_MIN_COVERAGE * expected:
+            errors = table.meta.get("errors") or {}
+            sample = "; ".join(f"{t}: {e}" for t, e in list(errors.items())[:3])
+            raise RuntimeError(
+                f"Previsões para só {len(table)} de {expected} tickers; tabela anterior mantida"
+                + (f" ({sample})" if sample else "")
+            )
+        table.save(path)
+    print(f"✅ Previsões do universo gravadas: {len(table)} tickers ({table.meta.get('seconds')}s)")
+    return table
+
+
+# ==================== SERVICE ====================
+def market_timezone():
+    try:
+        from zoneinfo import ZoneInfo
+
+        return ZoneInfo(FORECAST_TIMEZONE)
+    except Exception:
+        # Imagens sem tzdata: horário de Brasília fixo
+        return timezone(timedelta(hours=-3))
+
+
+def last_slot(now: datetime, at: str) -> datetime:
+    """Most recent weekday ``at`` (HH:MM) not after ``now``"""
+    hour, minute = (int(x) for x in at.split(":"))
+    slot = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if slot > now:
+        slot -= timedelta(days=1)
+    while slot.weekday() >= 5:
+        slot -= timedelta(days=1)
+    return slot
+
+
+class ForecastService:
+    """
+    In-memory forecast table for the API, with the optional daily refresh
+
+    Args:
+        path: Table file shared by every worker
+        schedule: ``HH:MM`` in ``FORECAST_TIMEZONE``, or ``off``
+
+    ``compute`` callables passed to ``refresh``/``start`` build a fresh
+    table with the model being served.
+    """
+
+    def __init__(self, path: str = FORECAST_TABLE_PATH, schedule: str = FORECAST_SCHEDULE):
+        self.path = path
+        self.schedule = None if schedule.lower() in ("", "off", "0", "false") else schedule
+        self.table = ForecastTable()
+        self.error: Optional[str] = None
+        # Falhas seguidas do refresh e instante (monotônico) da próxima tentativa
+        self.failures = 0
+        self.retry_at = 0.0
+        self._mtime = 0.0
+        self._checked = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def current(self) -> ForecastTable:
+        """Table to serve; reloaded when another process rewrote the file"""
+        now = time.monotonic()
+        if now - self._checked >= FORECAST_RELOAD_SECONDS:
+            self._checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if mtime != self._mtime:
+                    self.table = ForecastTable.load(self.path)
+                    self._mtime = mtime
+            except OSError:
+                pass
+            except Exception as e:
+                print(f"⚠️  Tabela de previsões ilegível ({e}). Mantendo a anterior.")
+        return self.table
+
+    def is_stale(self, now: Optional[datetime] = None) -> bool:
+        computed_at = self.current().meta.get("computed_at")
+        if not computed_at or not self.schedule:
+            return not computed_at
+        now = now or datetime.now(market_timezone())
+        return datetime.fromisoformat(computed_at) < last_slot(now, self.schedule)
+
+    def refresh(self, compute: Callable[[], ForecastTable]) -> Optional[ForecastTable]:
+        try:
+            table = refresh_table(self.path, compute)
+            self.error = None
+            self.failures = 0
+            self.retry_at = 0.0
+        except Exception as e:
+            self.error = str(e)
+            self.failures += 1
+            delay = min(FORECAST_RETRY_SECONDS * 2 ** (self.failures - 1), FORECAST_RETRY_MAX_SECONDS)
+            self.retry_at = time.monotonic() + delay
+            print(f"❌ Falha ao calcular previsões do universo: {e} (nova tentativa em {delay:.0f}s)")
+            return None
+        if table is not None:
+            self.table = table
+            self._mtime = os.stat(self.path).st_mtime
+        return table
+
+    def start(self, compute: Callable[[], ForecastTable], ready: Callable[[], bool]) -> None:
+        """
+        Daily refresh thread (no-op with ``FORECAST_SCHEDULE=off``)
+
+        A failed refresh is retried after ``FORECAST_RETRY_SECONDS``,
+        doubling per consecutive failure up to ``FORECAST_RETRY_MAX_SECONDS``.
+        """
+        if not self.schedule or self._thread is not None:
+            return
+
+        def run():
+            while not self._stop.is_set():
+                if ready() and time.monotonic() >= self.retry_at and self.is_stale():
+                    self.refresh(compute)
+                self._stop.wait(60)
+
+        self._thread = threading.Thread(target=run, name="forecast-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Precompute next-day forecasts for the ticker universe")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="Compute and store the forecast table (for cron)")
+    run.add_argument("--tickers", help="Comma-separated tickers or a CSV with a 'codigo' column")
+    run.add_argument("--lookback-days", type=int, default=FORECAST_LOOKBACK_DAYS)
+    show = sub.add_parser("show", help="Print the ranked table")
+    show.add_argument("--top", type=int, default=20)
+    parser.add_argument("--table", default=FORECAST_TABLE_PATH)
+    args = parser.parse_args()
+
+    if args.command == "show":
+        table = ForecastTable.load(args.table)
+        print(f"{table.meta.get('computed_at')}  modelo {table.meta.get('model_version')}")
+        for row in table.screener(limit=args.top):
+            print(f"  {row['ticker']:10} {row['last_close']:10.2f} -> {row['next_price']:10.2f}  {row['price_change_pct']:+6.2f}%")
+        return
+
+    from src.backtest import read_universe
+
+    from .registry_utils import ModelRegistry
+
+    active = ModelRegistry().load_active()
+    tickers = read_universe(args.tickers) if args.tickers else None
+    try:
+        table = refresh_table(
+            args.table, lambda: compute_forecasts(active.model, active.version, tickers, args.lookback_days)
+        )
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+    if table is None:
+        print("⚠️  Outro processo já está calculando as previsões")
+
+
+if __name__ == "__main__":
+    main()
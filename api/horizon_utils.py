@@ -0,0 +1,94 @@
+"""
+Multi-step autoregressive forecasts
+
+Each step feeds the last ``seq_length`` values of every series (observed
+closes followed by earlier predictions) to the model in one batched
+forward pass, so a k-day forecast for N tickers costs k calls, not k×N.
+
+Uso:
+    python -m api.horizon_utils profile --series 100 --horizons 1,5,20,60
+"""
+
+import os
+import resource
+import time
+from typing import Any, Dict, Tuple
+
+
+# Maior horizonte aceito pela API (cada passo é um forward pass)
+MAX_HORIZON = int(os.getenv("MAX_HORIZON", "60"))
+
+
+def rollout(model, windows, horizon: int) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Roll ``model`` forward ``horizon`` steps for every row of ``windows``
+
+    Args:
+        model: Callable mapping ``(N, L, 1)`` to ``(N, 1)`` scaled values
+        windows: ``(N, L)`` scaled float32 input windows
+        horizon: Number of future steps
+
+    Returns:
+        ``(N, horizon)`` scaled predictions and a stats dict with the
+        latency and the bytes held by the rollout buffer.
+    """
+    import torch
+
+    n, length = windows.shape
+    start = time.perf_counter()
+    # Janela deslizante sobre um único buffer: nenhuma cópia por passo além da entrada do LSTM
+    path = torch.empty((n, length + horizon), dtype=torch.float32)
+    path[:, :length] = windows
+    with torch.no_grad():
+        for step in range(horizon):
+            path[:, length + step] = model(path[:, step:step + length].unsqueeze(-1)).reshape(-1)
+    seconds = time.perf_counter() - start
+
+    stats = {
+        "horizon": horizon,
+        "series": n,
+        "forward_calls": horizon,
+        "seconds": round(seconds, 4),
+        "buffer_bytes": path.element_size() * path.nelement()
+    }
+    return path[:, length:], stats
+
+
+def profile_horizons(model, n_series: int, horizons, seq_length: int = 50) -> list:
+    """Latency and memory of ``rollout`` for each horizon (ascending)"""
+    from .inference_utils import synthetic_windows
+
+    windows = synthetic_windows(n_series, seq_length).squeeze(-1)
+    report = []
+    for horizon in sorted(horizons):
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        _, stats = rollout(model, windows, horizon)
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        stats["seconds_per_step"] = round(stats["seconds"] / horizon, 5)
+        # ru_maxrss em KiB no Linux; cresce só quando o pico anterior é superado
+        stats["peak_rss_growth_bytes"] = (rss_after - rss_before) * 1024
+        report.append(stats)
+    return report
+
+
+def main():
+    import argparse
+    import json
+
+    from .inference_utils import load_inference_model
+    from src.model_utils import load_model
+
+    parser = argparse.ArgumentParser(description="Profile multi-step rollouts per horizon length")
+    parser.add_argument("command", choices=["profile"])
+    parser.add_argument("--model", default="/app/models/stock_lstm.pt")
+    parser.add_argument("--series", type=int, default=100, help="Tickers/scenarios rolled out together")
+    parser.add_argument("--horizons", default="1,5,20,60")
+    args = parser.parse_args()
+
+    model = load_inference_model(load_model(args.model))
+    horizons = [int(h) for h in args.horizons.split(",")]
+    print(json.dumps(profile_horizons(model, args.series, horizons), indent=2))
+
+
+if __name__ == "__main__":
+    main()
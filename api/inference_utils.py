@@ -0,0 +1,212 @@
+"""
+Optimized inference backends for StockLSTM
+
+INFERENCE_BACKEND selects how the loaded model is served:
+
+- eager: float32 module under ``torch.no_grad()`` (reference)
+- inference_mode: same module under ``torch.inference_mode()``
+- quantized: dynamic int8 quantization of the LSTM and Linear layers
+- torchscript: scripted and frozen module
+- compile: ``torch.compile`` (needs a working C++ toolchain)
+
+Every backend is checked against eager on synthetic windows when loaded;
+if it fails to build or drifts beyond the tolerance, eager is used instead.
+
+Uso:
+    python -m api.inference_utils check --model /app/models/stock_lstm.pt
+"""
+
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+
+INFERENCE_BACKENDS = ("eager", "inference_mode", "quantized", "torchscript", "compile")
+
+# Diferença máxima aceita (escala 0-1 do MinMaxScaler) em relação ao eager
+DEFAULT_TOLERANCES = {
+    "eager": 0.0,
+    "inference_mode": 1e-6,
+    "quantized": 5e-2,  # int8: ~2% da amplitude da janela nos testes
+    "torchscript": 1e-5,
+    "compile": 1e-4,
+}
+
+
+class InferenceModel:
+    """
+    Callable wrapper around a prepared module
+
+    ``model(X)`` runs the module under the backend's grad mode, so callers
+    keep using it like the plain ``StockLSTM``.
+    """
+
+    def __init__(self, module: Callable, backend: str, grad_mode: Callable = torch.no_grad):
+        self.module = module
+        self.backend = backend
+        self.fallback_reason: Optional[str] = None
+        self.max_abs_error: Optional[float] = None
+        self._grad_mode = grad_mode
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        with self._grad_mode():
+            return self.module(x)
+
+    def eval(self) -> "InferenceModel":
+        return self
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "fallback_reason": self.fallback_reason,
+            "max_abs_error": self.max_abs_error,
+            "num_threads": torch.get_num_threads()
+        }
+
+
+def configure_threads() -> None:
+    """Apply TORCH_NUM_THREADS / TORCH_INTEROP_THREADS if set"""
+    num_threads = os.getenv("TORCH_NUM_THREADS")
+    if num_threads:
+        torch.set_num_threads(int(num_threads))
+    interop_threads = os.getenv("TORCH_INTEROP_THREADS")
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(int(interop_threads))
+        except RuntimeError as e:
+            # Só pode ser definido antes de qualquer trabalho paralelo
+            print(f"⚠️  TORCH_INTEROP_THREADS ignorado: {e}")
+
+
+def build_backend(model: nn.Module, backend: str) -> InferenceModel:
+    """
+    Prepare ``model`` for the given backend
+
+    eager, inference_mode and compile share the module's parameters (no
+    copy of mmapped weights); quantized and torchscript build new modules.
+    """
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}'. Options: {', '.join(INFERENCE_BACKENDS)}")
+
+    module = model.eval()
+    if backend == "eager":
+        return InferenceModel(module, backend, torch.no_grad)
+    if backend == "inference_mode":
+        return InferenceModel(module, backend, torch.inference_mode)
+    if backend == "quantized":
+        quantized = torch.ao.quantization.quantize_dynamic(module, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+        return InferenceModel(quantized, backend, torch.inference_mode)
+    if backend == "torchscript":
+        scripted = torch.jit.freeze(torch.jit.script(module))
+        return InferenceModel(scripted, backend, torch.no_grad)
+    compiled = torch.compile(module, dynamic=True)
+    return InferenceModel(compiled, backend, torch.no_grad)
+
+
+def synthetic_windows(n: int = 256, seq_length: int = 50, seed: int = 0) -> torch.Tensor:
+    """Random-walk price windows scaled to [0, 1], shaped ``(n, seq_length, 1)``"""
+    rng = np.random.default_rng(seed)
+    walks = np.cumsum(rng.normal(0, 1, (n, seq_length)), axis=1)
+    low = walks.min(axis=1, keepdims=True)
+    high = walks.max(axis=1, keepdims=True)
+    scaled = (walks - low) / np.maximum(high - low, 1e-8)
+    return torch.from_numpy(scaled.astype(np.float32)).unsqueeze(-1)
+
+
+def max_abs_error(reference: Callable, candidate: Callable, windows: torch.Tensor) -> float:
+    with torch.no_grad():
+        expected = reference(windows).numpy()
+        actual = candidate(windows).numpy()
+    return float(np.max(np.abs(expected - actual)))
+
+
+def tolerance_for(backend: str) -> float:
+    override = os.getenv("INFERENCE_TOLERANCE")
+    return float(override) if override else DEFAULT_TOLERANCES[backend]
+
+
+def load_inference_model(model: nn.Module, backend: Optional[str] = None) -> InferenceModel:
+    """
+    Wrap ``model`` in the backend from ``INFERENCE_BACKEND`` (default eager)
+
+    The backend is verified against eager before use; on error or drift
+    beyond its tolerance the eager backend is returned with
+    ``fallback_reason`` set.
+    """
+    configure_threads()
+    backend = (backend or os.getenv("INFERENCE_BACKEND", "eager")).lower()
+    reference = build_backend(model, "eager")
+    if backend == "eager":
+        reference.max_abs_error = 0.0
+        return reference
+
+    try:
+        candidate = build_backend(model, backend)
+        error = max_abs_error(reference, candidate, synthetic_windows())
+    except Exception as e:
+        reference.fallback_reason = f"{backend}: {e}"
+        print(f"⚠️  Backend de inferência '{backend}' indisponível, usando eager: {e}")
+        return reference
+
+    tolerance = tolerance_for(backend)
+    if error > tolerance:
+        reference.fallback_reason = f"{backend}: max abs error {error:.2e} > {tolerance:.0e}"
+        print(f"⚠️  Backend '{backend}' divergiu do eager ({error:.2e} > {tolerance:.0e}), usando eager")
+        return reference
+
+    candidate.max_abs_error = error
+    print(f"✅ Backend de inferência: {backend} (erro máx. {error:.2e})")
+    return candidate
+
+
+def check_backends(model: nn.Module, n_windows: int = 4096, repeats: int = 5) -> Dict[str, Dict[str, Any]]:
+    """Compare every backend against eager: max abs error and mean forward time"""
+    windows = synthetic_windows(n_windows)
+    reference = build_backend(model, "eager")
+    report = {}
+    for backend in INFERENCE_BACKENDS:
+        try:
+            candidate = build_backend(model, backend)
+            error = max_abs_error(reference, candidate, windows)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                candidate(windows)
+            seconds = (time.perf_counter() - start) / repeats
+            report[backend] = {
+                "ok": error <= tolerance_for(backend),
+                "max_abs_error": error,
+                "tolerance": tolerance_for(backend),
+                "seconds_per_forward": round(seconds, 4)
+            }
+        except Exception as e:
+            report[backend] = {"ok": False, "error": str(e)}
+    return report
+
+
+def main():
+    import argparse
+    import json
+
+    from src.model_utils import load_model
+
+    parser = argparse.ArgumentParser(description="Check inference backends against eager")
+    parser.add_argument("command", choices=["check"])
+    parser.add_argument("--model", default="/app/models/stock_lstm.pt")
+    parser.add_argument("--windows", type=int, default=4096, help="Synthetic windows per forward")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    configure_threads()
+    model = load_model(args.model)
+    report = check_backends(model, args.windows, args.repeats)
+    print(json.dumps(report, indent=2))
+    if not all(r["ok"] for r in report.values() if "error" not in r):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
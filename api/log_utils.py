@@ -1,10 +1,62 @@
+import atexit
+import fcntl
 import json
 import os
-from datetime import datetime
-from typing import Dict, Any, Optional, List
-import boto3
-from botocore.exceptions import ClientError
+import queue
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
+from typing import Deque, Dict, Any, Optional, List
 import numpy as np
+from .metrics_utils import span
+from .storage_utils import get_object_store, encode_log_batch, decode_log_object
+from .rollup_utils import RollupIndex
+from .sketch_utils import LogStats
+
+
+STATS_PREFIX = os.getenv("STATS_PREFIX", "stats/")
+# Identidade estável do host nas chaves de estatísticas (padrão: hostname)
+STATS_INSTANCE = os.getenv("STATS_INSTANCE") or socket.gethostname()
+STATS_MAX_SLOTS = 64
+RECENT_LOGS_BUFFER = int(os.getenv("RECENT_LOGS_BUFFER", "500"))
+# Dias percorridos na leitura a frio quando ainda não há rollup
+RECENT_LOGS_LOOKBACK_DAYS = int(os.getenv("RECENT_LOGS_LOOKBACK_DAYS", "31"))
+
+
+_slot_lock = None
+
+
+def claim_instance_id() -> str:
+    """
+    Stable stats key of this worker: ``<STATS_INSTANCE>-<slot>``
+
+    The slot is the lowest one not held by another worker of this host
+    (a lock file kept open for the process lifetime), so a restarted
+    worker takes over the key of the one it replaces and the number of
+    stats objects stays bounded by hosts x workers.
+    """
+    global _slot_lock
+    if _slot_lock is not None:
+        return _slot_lock[1]
+    lock_dir = Path(os.getenv("STATS_SLOT_DIR", tempfile.gettempdir()))
+    name = STATS_INSTANCE.replace("/", "_")
+    for slot in range(STATS_MAX_SLOTS):
+        f = open(lock_dir / f"stock-stats-{name}-{slot}.lock", "w")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            continue
+        _slot_lock = (f, f"{name}-{slot}")
+        return _slot_lock[1]
+    print(f"⚠️  Nenhum slot de estatísticas livre em {lock_dir}; usando chave aleatória")
+    return uuid.uuid4().hex[:12]
 
 
 class NumpyEncoder(json.JSONEncoder):
@@ -19,40 +71,217 @@ class NumpyEncoder(json.JSONEncoder):
         return super().default(obj)
 
 
+class BatchingLogWriter:
+    """
+    Background writer that uploads log entries in compressed batches
+
+    Entries are buffered in memory and flushed as one ``.jsonl.gz`` object
+    when ``max_entries`` is reached or ``flush_interval`` seconds have
+    passed since the first buffered entry. Object keys carry a random
+    suffix, so concurrent writers never overwrite each other. Batches
+    that fail to upload are spooled to ``spool_dir`` and retried later.
+    """
+
+    def __init__(
+        self,
+        store,
+        prefix: str,
+        max_entries: int = 500,
+        flush_interval: float = 30.0,
+        spool_dir: Optional[str] = None,
+        retry_interval: float = 60.0,
+        on_flush=None
+    ):
+        self.store = store
+        self.prefix = prefix
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self.spool_dir = Path(spool_dir) if spool_dir else None
+        self.retry_interval = retry_interval
+        # Callback(key, entries) chamado após cada upload bem-sucedido
+        self.on_flush = on_flush
+        self._queue: "queue.Queue" = queue.Queue()
+        self._flush_requested = threading.Event()
+        self._flushed = threading.Condition()
+        self._stopped = threading.Event()
+        self._last_retry = 0.0
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        self._queue.put(entry)
+
+    def new_key(self) -> str:
+        now = datetime.utcnow()
+        return f"{self.prefix}{now:%Y/%m/%d/%H%M%S}_{uuid.uuid4().hex[:12]}.jsonl.gz"
+
+    def flush(self, timeout: float = 10.0) -> None:
+        """Force an upload of everything buffered so far and wait for it"""
+        with self._flushed:
+            self._flush_requested.set()
+            self._flushed.wait(timeout)
+
+    def close(self, timeout: float = 10.0) -> None:
+        self._stopped.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        buffer: List[Dict[str, Any]] = []
+        first_at = None
+        while True:
+            try:
+                entry = self._queue.get(timeout=0.5)
+                buffer.append(entry)
+                if first_at is None:
+                    first_at = time.monotonic()
+            except queue.Empty:
+                pass
+
+            stopping = self._stopped.is_set()
+            forced = self._flush_requested.is_set()
+            if forced or stopping:
+                # Drena o que já está na fila antes de enviar
+                while True:
+                    try:
+                        buffer.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+            due = first_at is not None and time.monotonic() - first_at >= self.flush_interval
+            if buffer and (len(buffer) >= self.max_entries or due or forced or stopping):
+                self._upload(buffer)
+                buffer = []
+                first_at = None
+
+            if self.spool_dir and time.monotonic() - self._last_retry >= self.retry_interval:
+                self._last_retry = time.monotonic()
+                self._retry_spool()
+
+            if forced:
+                with self._flushed:
+                    self._flush_requested.clear()
+                    self._flushed.notify_all()
+
+            if stopping:
+                return
+
+    def _upload(self, entries: List[Dict[str, Any]]) -> None:
+        body = encode_log_batch(entries, encoder=NumpyEncoder)
+        key = self.new_key()
+        try:
+            with span("log_upload"):
+                self.store.put(key, body, content_type="application/x-ndjson")
+            print(f"📝 {len(entries)} logs enviados: {self.store.uri(key)}")
+            self._notify(key, entries)
+        except Exception as e:
+            print(f"❌ Failed to upload log batch: {e}")
+            self._spool(body)
+
+    def _notify(self, key: str, entries: List[Dict[str, Any]]) -> None:
+        if self.on_flush:
+            try:
+                self.on_flush(key, entries)
+            except Exception as e:
+                print(f"⚠️  on_flush falhou para {key}: {e}")
+
+    def _spool(self, body: bytes) -> None:
+        if not self.spool_dir:
+            print("❌ Sem spool configurado: lote de logs descartado")
+            return
+        try:
+            self.spool_dir.mkdir(parents=True, exist_ok=True)
+            path = self.spool_dir / f"{uuid.uuid4().hex}.jsonl.gz"
+            path.write_bytes(body)
+            print(f"💾 Lote de logs guardado no spool: {path}")
+        except OSError as e:
+            print(f"❌ Falha ao gravar spool de logs: {e}")
+
+    def _retry_spool(self) -> None:
+        if not self.spool_dir.exists():
+            return
+        for path in sorted(self.spool_dir.glob("*.jsonl.gz")):
+            # Renomeia antes de enviar para que outro processo não envie o mesmo arquivo
+            claimed = path.with_name(f"{path.name}.{os.getpid()}.claim")
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            body = claimed.read_bytes()
+            # Nova chave com o horário do envio, mantendo a ordem das chaves no bucket
+            key = self.new_key()
+            try:
+                self.store.put(key, body, content_type="application/x-ndjson")
+            except Exception as e:
+                os.rename(claimed, path)
+                print(f"⚠️  S3 ainda indisponível, spool mantido: {e}")
+                return
+            claimed.unlink()
+            print(f"📝 Lote do spool enviado: {self.store.uri(key)}")
+            self._notify(key, decode_log_object(key, body))
+
+
 class PredictionLogger:
-    def __init__(self):
+    def __init__(self, store=None):
         """
-        Initialize the logger with S3 configuration
+        Initialize the logger and its background batching writer
         
-        All logs are stored in S3 only.
-        Requires environment variables:
-        - S3_BUCKET_NAME: Name of the S3 bucket
-        - AWS_ACCESS_KEY_ID: AWS access key
-        - AWS_SECRET_ACCESS_KEY: AWS secret key
+        Logs go to S3 by default, or to a local directory for tests.
+        Environment variables:
+        - LOG_BACKEND: s3 (default) or file
+        - S3_BUCKET_NAME: Name of the S3 bucket (required for s3)
+        - AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY: AWS credentials
         - AWS_REGION: AWS region (default: us-east-1)
+        - S3_ENDPOINT_URL: S3-compatible endpoint (MinIO, moto), optional
         - S3_LOG_PREFIX: S3 prefix for logs (default: logs/)
+        - LOG_STORE_DIR: root directory for the file backend
+        - LOG_BATCH_SIZE: entries per uploaded object (default: 500)
+        - LOG_FLUSH_INTERVAL: max seconds an entry waits in memory (default: 30)
+        - LOG_SPOOL_DIR: local spool used while S3 is unavailable
+        - RECENT_LOGS_BUFFER: entries kept in memory for recent-log queries (default: 500)
         """
-        # S3 configuration (from environment variables)
-        self.s3_bucket = os.getenv("S3_BUCKET_NAME")
         self.s3_prefix = os.getenv("S3_LOG_PREFIX", "logs/")
-        self.aws_region = os.getenv("AWS_REGION", "us-east-1")
-        
-        if not self.s3_bucket:
-            raise ValueError(
-                "S3_BUCKET_NAME environment variable is required. "
-                "Please configure it before running the application."
-            )
         
         try:
-            self.s3_client = boto3.client(
-                's3',
-                aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-                aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-                region_name=self.aws_region
-            )
-            print(f"✅ S3 Logger initialized with bucket: {self.s3_bucket}")
+            self.store = store or get_object_store()
+        except ValueError:
+            raise
         except Exception as e:
             raise ValueError(f"Failed to initialize S3 client: {e}")
+        
+        self.rollup = RollupIndex(self.store, self.s3_prefix)
+        
+        self.writer = BatchingLogWriter(
+            self.store,
+            self.s3_prefix,
+            max_entries=int(os.getenv("LOG_BATCH_SIZE", "500")),
+            flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL", "30")),
+            spool_dir=os.getenv("LOG_SPOOL_DIR", "/app/cache/log-spool"),
+            on_flush=self._on_flush
+        )
+        # Garante o envio do que estiver em memória ao encerrar o processo
+        atexit.register(self.close)
+        
+        # Estatísticas incrementais deste worker, persistidas a cada lote enviado.
+        # A chave é reaproveitada entre reinícios: continua a partir do que já foi gravado nela.
+        self.instance_id = claim_instance_id()
+        self.stats = self._load_own_stats()
+        self._stats_lock = threading.Lock()
+        
+        # Últimos logs em memória (mais novo primeiro) para /api/logs/recent
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=RECENT_LOGS_BUFFER)
+        self._recent_lock = threading.Lock()
+        self._backfilled = False
+        threading.Thread(target=self._backfill_recent, name="log-backfill", daemon=True).start()
+        print(f"✅ Logger initialized with store: {self.store.uri(self.s3_prefix)}")
+    
+    def close(self):
+        """Flush buffered logs and stop the background writer"""
+        self.writer.close()
+    
+    def _on_flush(self, key: str, entries: List[Dict[str, Any]]):
+        # Mantém o rollup do dashboard e as estatísticas atualizados a cada lote enviado
+        self.rollup.refresh()
+        self.save_stats()
     
     def create_log_entry(
         self,
@@ -62,7 +291,9 @@ class PredictionLogger:
         result: Dict[str, Any],
         duration: float,
         success: bool = True,
-        error: Optional[str] = None
+        error: Optional[str] = None,
+        stages: Optional[Dict[str, float]] = None,
+        batch_size: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         Create a structured log entry
@@ -75,6 +306,8 @@ class PredictionLogger:
             duration: Execution time in seconds
             success: Whether prediction was successful
             error: Error message if failed
+            stages: Seconds spent per pipeline stage (download, inference, ...)
+            batch_size: Tickers in the batch request this entry came from
             
         Returns:
             Structured log dictionary
@@ -93,6 +326,10 @@ class PredictionLogger:
                 "success": success
             }
         }
+        if stages:
+            log_entry["execution"]["stages"] = stages
+        if batch_size:
+            log_entry["execution"]["batch_size"] = batch_size
         
         if success and result:
             log_entry["result"] = {
@@ -116,10 +353,12 @@ class PredictionLogger:
         result: Dict[str, Any],
         duration: float,
         success: bool = True,
-        error: Optional[str] = None
-    ) -> Dict[str, str]:
+        error: Optional[str] = None,
+        stages: Optional[Dict[str, float]] = None,
+        batch_size: Optional[int] = None
+    ) -> Dict[str, Any]:
         """
-        Log a prediction directly to S3
+        Queue a prediction log for the background batching writer
         
         Args:
             ticker: Stock ticker symbol
@@ -129,9 +368,11 @@ class PredictionLogger:
             duration: Execution time in seconds
             success: Whether prediction was successful
             error: Error message if failed
+            stages: Seconds spent per pipeline stage (download, inference, ...)
+            batch_size: Tickers in the batch request this entry came from
             
         Returns:
-            Dictionary with S3 path and timestamp
+            Dictionary with the entry timestamp
         """
         # Create log entry
         log_entry = self.create_log_entry(
@@ -141,127 +382,150 @@ class PredictionLogger:
             result=result,
             duration=duration,
             success=success,
-            error=error
+            error=error,
+            stages=stages,
+            batch_size=batch_size
         )
         
-        # Upload to S3
+        # Enfileira para o writer em segundo plano; não espera o S3
+        self.writer.add(log_entry)
+        with self._recent_lock:
+            self.recent.appendleft(log_entry)
+        with self._stats_lock:
+            self.stats.add(log_entry)
+        
+        return {
+            "queued": True,
+            "timestamp": log_entry["timestamp"]
+        }
+    
+    def list_log_objects(self) -> List[Dict[str, Any]]:
+        """List every log object under the prefix, across all pages"""
+        return list(self.store.list(self.s3_prefix))
+    
+    def read_log_object(self, key: str) -> List[Dict[str, Any]]:
+        return decode_log_object(key, self.store.get(key))
+    
+    def _recent_partitions(self) -> List[str]:
+        """Day partitions (``YYYY/MM/DD``) that may hold logs, newest first"""
+        today = datetime.utcnow().date()
+        days = {f"{today - timedelta(days=i):%Y/%m/%d}" for i in range(2)}
+        
+        rollup_days = self.rollup.load().daily_predictions
+        if rollup_days:
+            days.update(day.replace("-", "/") for day in rollup_days)
+        else:
+            days.update(f"{today - timedelta(days=i):%Y/%m/%d}" for i in range(RECENT_LOGS_LOOKBACK_DAYS))
+        return sorted(days, reverse=True)
+    
+    def read_recent_from_store(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        Read the newest ``limit`` entries straight from the store
+        
+        Walks the day partitions from the newest one and reads objects
+        newest-first, stopping as soon as ``limit`` entries are collected.
+        """
+        logs = []
+        for day in self._recent_partitions():
+            keys = sorted((obj['Key'] for obj in self.store.list(f"{self.s3_prefix}{day}/")), reverse=True)
+            for key in keys:
+                try:
+                    logs.extend(self.read_log_object(key))
+                except Exception as e:
+                    print(f"⚠️  Failed to read log {key}: {e}")
+                    continue
+                if len(logs) >= limit:
+                    break
+            if len(logs) >= limit:
+                break
+        
+        logs.sort(key=lambda x: x["timestamp"], reverse=True)
+        return logs[:limit]
+    
+    def _backfill_recent(self):
         try:
-            timestamp = datetime.utcnow().strftime("%Y/%m/%d/%H%M%S")
-            s3_key = f"{self.s3_prefix}{timestamp}_{ticker}.json"
-            
-            self.s3_client.put_object(
-                Bucket=self.s3_bucket,
-                Key=s3_key,
-                Body=json.dumps(log_entry, ensure_ascii=False, cls=NumpyEncoder),
-                ContentType='application/json'
-            )
-            
-            print(f"📝 Log uploaded to S3: s3://{self.s3_bucket}/{s3_key}")
-            
-            return {
-                "s3_path": f"s3://{self.s3_bucket}/{s3_key}",
-                "s3_key": s3_key,
-                "timestamp": log_entry["timestamp"]
-            }
-        except ClientError as e:
-            print(f"❌ Failed to upload log to S3: {e}")
-            raise
+            stored = self.read_recent_from_store(self.recent.maxlen)
+        except Exception as e:
+            print(f"⚠️  Failed to backfill recent logs: {e}")
+            return
+        with self._recent_lock:
+            # Entradas registradas durante o backfill são mais novas: ficam na frente
+            known = {(e["timestamp"], e["request"]["ticker"]) for e in self.recent}
+            for entry in stored:
+                if len(self.recent) >= self.recent.maxlen:
+                    break
+                if (entry["timestamp"], entry["request"]["ticker"]) not in known:
+                    self.recent.append(entry)
+            self._backfilled = True
     
     def get_recent_logs(self, limit: int = 10) -> List[Dict[str, Any]]:
         """
-        Get recent log files from S3
+        Get recent log entries, most recent first
+        
+        Served from the in-memory ring buffer; only falls back to the
+        store when the buffer cannot answer (larger limit, or still
+        backfilling).
         
         Args:
             limit: Maximum number of logs to return
             
         Returns:
-            List of log entries from S3
+            List of log entries, most recent first
         """
+        with self._recent_lock:
+            if limit <= len(self.recent) or (self._backfilled and len(self.recent) < self.recent.maxlen):
+                return list(islice(self.recent, limit))
+        
         try:
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.s3_bucket,
-                Prefix=self.s3_prefix,
-                MaxKeys=limit
-            )
-            
-            logs = []
-            
-            if 'Contents' not in response:
-                return logs
-            
-            # Sort by last modified, most recent first
-            objects = sorted(response['Contents'], key=lambda x: x['LastModified'], reverse=True)
-            
-            for obj in objects[:limit]:
-                try:
-                    response = self.s3_client.get_object(
-                        Bucket=self.s3_bucket,
-                        Key=obj['Key']
-                    )
-                    content = json.loads(response['Body'].read().decode('utf-8'))
-                    logs.append(content)
-                except Exception as e:
-                    print(f"⚠️  Failed to read log {obj['Key']}: {e}")
-                    continue
-            
-            return logs
-            
-        except ClientError as e:
+            return self.read_recent_from_store(limit)
+        except Exception as e:
             print(f"❌ Failed to retrieve logs from S3: {e}")
             return []
     
+    def stats_key(self) -> str:
+        return f"{STATS_PREFIX}{self.instance_id}.json"
+    
+    def _load_own_stats(self) -> LogStats:
+        key = self.stats_key()
+        try:
+            if not any(obj["Key"] == key for obj in self.store.list(key)):
+                return LogStats()
+            return LogStats.from_dict(json.loads(self.store.get(key)))
+        except Exception as e:
+            # Sem ler o arquivo anterior não dá para continuar nele: usa uma chave nova em vez de sobrescrevê-lo
+            print(f"⚠️  Failed to load stats {key}: {e}")
+            self.instance_id = uuid.uuid4().hex[:12]
+            return LogStats()
+    
+    def save_stats(self) -> None:
+        """Persist this process' statistics so other workers can merge them"""
+        with self._stats_lock:
+            body = json.dumps(self.stats.to_dict()).encode("utf-8")
+        self.store.put(self.stats_key(), body)
+    
     def get_stats(self) -> Dict[str, Any]:
         """
-        Get statistics about logged predictions from S3
+        Get statistics about logged predictions
+        
+        Merges the statistics persisted by every worker with this
+        process' in-memory ones; no log object is read.
         
         Returns:
-            Statistics dictionary
+            Statistics dictionary, including p50/p95/p99 execution time
         """
+        merged = LogStats()
         try:
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.s3_bucket,
-                Prefix=self.s3_prefix
-            )
-            
-            total_predictions = 0
-            successful = 0
-            failed = 0
-            tickers = set()
-            
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    total_predictions += 1
-                    try:
-                        log_response = self.s3_client.get_object(
-                            Bucket=self.s3_bucket,
-                            Key=obj['Key']
-                        )
-                        log_data = json.loads(log_response['Body'].read().decode('utf-8'))
-                        
-                        if log_data["execution"]["success"]:
-                            successful += 1
-                        else:
-                            failed += 1
-                        
-                        tickers.add(log_data["request"]["ticker"])
-                    except Exception as e:
-                        print(f"⚠️  Failed to parse log {obj['Key']}: {e}")
-                        continue
-            
-            return {
-                "total_predictions": total_predictions,
-                "successful": successful,
-                "failed": failed,
-                "unique_tickers": len(tickers),
-                "tickers": sorted(list(tickers))
-            }
-            
-        except ClientError as e:
+            for obj in self.store.list(STATS_PREFIX):
+                if obj['Key'] == self.stats_key():
+                    continue
+                try:
+                    merged.merge(LogStats.from_dict(json.loads(self.store.get(obj['Key']))))
+                except Exception as e:
+                    print(f"⚠️  Failed to parse stats {obj['Key']}: {e}")
+                    continue
+        except Exception as e:
             print(f"❌ Failed to retrieve stats from S3: {e}")
-            return {
-                "total_predictions": 0,
-                "successful": 0,
-                "failed": 0,
-                "unique_tickers": 0,
-                "tickers": []
-            }
+        
+        with self._stats_lock:
+            merged.merge(self.stats)
+        return merged.summary()
@@ -0,0 +1,123 @@
+"""
+Per-stage timing and Prometheus metrics
+
+``span(name)`` times one stage of the hot path (download, scaling,
+windowing, inference, metrics, plot, log_write). Each span feeds the
+``stock_api_stage_seconds`` histogram and, inside a request, is added to
+that request's stage breakdown (``request_spans()``), which goes into the
+``execution`` block of the log entry.
+
+With several uvicorn workers set ``PROMETHEUS_MULTIPROC_DIR`` so /metrics
+aggregates every process.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+
+# Do download do Yahoo (segundos) ao forward de um lote pequeno (milissegundos)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REQUEST_SECONDS = Histogram(
+    "stock_api_request_seconds", "HTTP request latency", ["method", "route"], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "stock_api_requests_in_flight", "HTTP requests being served", ["route"], multiprocess_mode="livesum"
+)
+ERRORS = Counter("stock_api_errors_total", "HTTP responses with status >= 400", ["route", "status"])
+STAGE_SECONDS = Histogram(
+    "stock_api_stage_seconds", "Time spent in each pipeline stage", ["stage"], buckets=LATENCY_BUCKETS
+)
+STAGE_QUEUE_SECONDS = Histogram(
+    "stock_api_stage_queue_seconds", "Time tasks wait for a pipeline worker", ["pool"], buckets=LATENCY_BUCKETS
+)
+
+_spans: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_spans", default=None)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time a stage; also recorded in the current request's breakdown"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage=name).observe(elapsed)
+        spans = _spans.get()
+        if spans is not None:
+            spans[name] = spans.get(name, 0.0) + elapsed
+
+
+def start_request_spans() -> Dict[str, float]:
+    """Start a fresh stage breakdown for the current request"""
+    spans: Dict[str, float] = {}
+    _spans.set(spans)
+    return spans
+
+
+def request_spans() -> Dict[str, float]:
+    """Stage breakdown of the current request, in seconds (rounded for logging)"""
+    return {name: round(seconds, 4) for name, seconds in (_spans.get() or {}).items()}
+
+
+class StatsCollector:
+    """
+    Exposes counters kept by other objects at scrape time
+
+    - caches: anything with ``hits``/``misses`` (LRUCache, SQLiteCache)
+    - pools: ``PipelineStage.pending``
+    - gauges: any zero-argument callable (e.g. single-flight in flight)
+    """
+
+    def __init__(self):
+        self.caches = {}
+        self.pools = {}
+        self.gauges = {}
+
+    def collect(self):
+        hits = CounterMetricFamily("stock_api_cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("stock_api_cache_misses", "Cache misses", labels=["cache"])
+        for name, cache in list(self.caches.items()):
+            hits.add_metric([name], cache.hits)
+            misses.add_metric([name], cache.misses)
+        yield hits
+        yield misses
+
+        pending = GaugeMetricFamily("stock_api_pool_pending", "Tasks running or queued per pool", labels=["pool"])
+        for name, pool in list(self.pools.items()):
+            pending.add_metric([name], pool.pending)
+        yield pending
+
+        for name, (description, fn) in list(self.gauges.items()):
+            yield GaugeMetricFamily(f"stock_api_{name}", description, value=fn())
+
+
+collector = StatsCollector()
+REGISTRY.register(collector)
+
+
+def metrics_response() -> tuple:
+    """``(body, content_type)`` for the /metrics endpoint"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(collector)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,126 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict
+
+from .metrics_utils import STAGE_QUEUE_SECONDS
+
+
+class StageOverloaded(Exception):
+    """Raised when a pipeline stage has no free worker nor queue slot"""
+
+    def __init__(self, stage: str, retry_after: int = 1):
+        super().__init__(f"Serviço sobrecarregado (etapa '{stage}'). Tente novamente em instantes.")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class PipelineStage:
+    """
+    Executor with a hard limit on queued work
+
+    At most ``max_workers + queue_limit`` tasks can be pending at once.
+    Beyond that ``submit`` fails immediately with ``StageOverloaded``
+    instead of letting requests pile up until they time out.
+    """
+
+    def __init__(self, name: str, executor_factory: Callable, max_workers: int, queue_limit: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.queue_limit = queue_limit
+        self._executor_factory = executor_factory
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_workers + queue_limit)
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    @property
+    def executor(self):
+        # Criado sob demanda: o pool de processos só sobe no primeiro uso
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = self._executor_factory(self.max_workers)
+        return self._executor
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _release(self, _future=None):
+        with self._pending_lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise StageOverloaded(self.name)
+        with self._pending_lock:
+            self._pending += 1
+        try:
+            if isinstance(self.executor, ProcessPoolExecutor):
+                future = self.executor.submit(fn, *args, **kwargs)
+            else:
+                # Threads herdam o contexto da requisição (spans de request_spans())
+                ctx = contextvars.copy_context()
+                future = self.executor.submit(ctx.run, self._timed, time.perf_counter(), fn, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _timed(self, queued_at: float, fn, *args, **kwargs):
+        STAGE_QUEUE_SECONDS.labels(pool=self.name).observe(time.perf_counter() - queued_at)
+        return fn(*args, **kwargs)
+
+    async def run(self, fn, *args, **kwargs):
+        """Submit ``fn`` and await its result from the event loop"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+def create_stages() -> Dict[str, PipelineStage]:
+    """
+    Build the prediction pipeline stages
+
+    - io: data download and log upload (threads, network bound)
+    - cpu: scaling, inference and metrics (threads, torch releases the GIL)
+    - render: matplotlib plots (processes, matplotlib holds the GIL)
+
+    Sizes come from ``<STAGE>_WORKERS`` / ``<STAGE>_QUEUE_LIMIT`` env vars.
+    """
+    cpu_count = os.cpu_count() or 1
+
+    def env_int(name: str, default: int) -> int:
+        return int(os.getenv(name, str(default)))
+
+    return {
+        "io": PipelineStage(
+            "io",
+            lambda n: ThreadPoolExecutor(max_workers=n, thread_name_prefix="io"),
+            env_int("IO_WORKERS", 16),
+            env_int("IO_QUEUE_LIMIT", 64)
+        ),
+        "cpu": PipelineStage(
+            "cpu",
+            lambda n: ThreadPoolExecutor(max_workers=n, thread_name_prefix="cpu"),
+            env_int("CPU_WORKERS", cpu_count),
+            env_int("CPU_QUEUE_LIMIT", 4 * cpu_count)
+        ),
+        "render": PipelineStage(
+            "render",
+            lambda n: ProcessPoolExecutor(max_workers=n),
+            env_int("RENDER_WORKERS", max(1, cpu_count // 2)),
+            # Comporta ao menos os 4 gráficos do dashboard de uma vez
+            env_int("RENDER_QUEUE_LIMIT", max(8, 2 * cpu_count))
+        ),
+    }
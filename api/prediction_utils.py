@@ -1,87 +1,176 @@
 import torch
-import torch.nn as nn
-import joblib
 import numpy as np
-import yfinance as yf
+from numpy.lib.stride_tricks import sliding_window_view
 from sklearn.preprocessing import MinMaxScaler
 import matplotlib.pyplot as plt
 import matplotlib
 matplotlib.use('Agg')
 import io
+import os
 import base64
-
-# ==================== MODEL DEFINITION ====================
-class StockLSTM(nn.Module):
-    def __init__(self, input_size=1, hidden_size=64, num_layers=2):
-        super().__init__()
-        self.lstm = nn.LSTM(input_size, hidden_size, num_layers, batch_first=True)
-        self.fc = nn.Linear(hidden_size, 1)
-
-    def forward(self, x):
-        out, _ = self.lstm(x)
-        out = self.fc(out[:, -1, :])
-        return out
-
-
-# ==================== LOAD MODEL ====================
-def load_model_and_scaler(model_path: str, scaler_path: str):
-    model = StockLSTM(input_size=1, hidden_size=64, num_layers=2)
-    model.load_state_dict(torch.load(model_path, weights_only=True))
-    model.eval()
-    
-    scaler = joblib.load(scaler_path)
-    
-    return model, scaler
-
+import hashlib
+from .horizon_utils import rollout
+from .metrics_utils import span
+from .price_utils import PriceCache, get_price_cache
 
 # ==================== DATA LOADING ====================
-def load_stock_data(ticker: str, start: str, end: str):
-    """Download stock data from Yahoo Finance"""
+def load_stock_data(ticker: str, start: str, end: str, cache: PriceCache = None):
+    """Load stock closes, served from the local price cache when possible"""
     # Aceita qualquer ticker (internacional ou brasileiro)
     # Se não tiver sufixo e parecer ser brasileiro (apenas letras + números), adiciona .SA
     # Caso contrário, usa como está (MSFT, AAPL, etc.)
+    cache = cache or get_price_cache()
     yf_ticker = ticker
     
+    # Se o fallback .SA já foi resolvido antes, evita consultar o ticker sem sufixo de novo
+    if "." not in ticker and not cache.contains(ticker) and cache.contains(f"{ticker}.SA"):
+        yf_ticker = f"{ticker}.SA"
+    
     # Tenta primeiro com o ticker original
     try:
-        df = yf.download(yf_ticker, start=start, end=end, auto_adjust=False)[["Close"]]
+        close = cache.get(yf_ticker, start, end)
         
         # Se não retornar dados e não tiver ponto, tenta adicionar .SA para ações brasileiras
-        if (df is None or df.empty) and "." not in ticker:
+        if close.empty and "." not in yf_ticker:
             print(f"⚠️  Ticker '{ticker}' não retornou dados. Tentando '{ticker}.SA'...")
             yf_ticker = f"{ticker}.SA"
-            df = yf.download(yf_ticker, start=start, end=end, auto_adjust=False)[["Close"]]
+            close = cache.get(yf_ticker, start, end)
     except Exception as e:
         # Se falhar e não tiver ponto, tenta com .SA como fallback
         if "." not in ticker:
             print(f"⚠️  Erro com '{ticker}'. Tentando '{ticker}.SA'...")
             yf_ticker = f"{ticker}.SA"
             try:
-                df = yf.download(yf_ticker, start=start, end=end, auto_adjust=False)[["Close"]]
+                close = cache.get(yf_ticker, start, end)
             except Exception as e2:
                 raise RuntimeError(f"Failed to download data for both {ticker} and {yf_ticker}: {e2}")
         else:
             raise RuntimeError(f"Failed to download data for {yf_ticker}: {e}")
     
-    if df is None or df.empty:
+    if close.empty:
         raise RuntimeError(f"No data returned for {yf_ticker}. Verifique se o ticker está correto.")
     
-    df.dropna(inplace=True)
-    df.columns = [col[0] if isinstance(col, tuple) else col for col in df.columns]
-    return df
+    return close.to_frame("Close")
 
 
 # ==================== SEQUENCE CREATION ====================
 def create_sequences(data, seq_length=50):
-    x, y = [], []
-    for i in range(len(data) - seq_length):
-        x.append(data[i : i + seq_length])
-        y.append(data[i + seq_length])
-    return np.array(x), np.array(y)
+    """
+    Build (N - seq_length, seq_length, features) windows and their targets
+
+    Both arrays are strided views of ``data``; nothing is copied.
+    """
+    data = np.asarray(data)
+    if len(data) <= seq_length:
+        return np.empty((0, seq_length) + data.shape[1:], dtype=data.dtype), data[:0]
+    windows = sliding_window_view(data[:-1], seq_length, axis=0)
+    return np.moveaxis(windows, -1, 1), data[seq_length:]
+
+
+def sequence_tensors(data, seq_length=50):
+    """
+    Same as ``create_sequences`` but as float32 tensor views
+
+    ``data`` is converted to float32 once (no copy if it already is) and
+    the windows are an ``unfold`` view over that single buffer.
+    """
+    series = torch.from_numpy(np.ascontiguousarray(data, dtype=np.float32))
+    if series.ndim == 1:
+        series = series.unsqueeze(-1)
+    if len(series) <= seq_length:
+        return series.new_empty((0, seq_length, series.shape[1])), series[:0]
+    X = series[:-1].unfold(0, seq_length, 1).transpose(1, 2)
+    return X, series[seq_length:]
+
+
+def forward_chunks(model, parts, out: np.ndarray, chunk_size: int, on_chunk=None) -> np.ndarray:
+    """
+    Run ``model`` over the windows of every tensor in ``parts``, in order
+
+    At most ``chunk_size`` windows go through each forward pass (a chunk
+    may span two parts) and the predictions are written into ``out``, a
+    preallocated float32 buffer with one slot per window. ``on_chunk(offset,
+    size)`` is called after each pass.
+    """
+    target = torch.from_numpy(out)
+    offset = 0
+    batch, size = [], 0
+    
+    def flush():
+        nonlocal offset, batch, size
+        target[offset:offset + size] = model(batch[0] if len(batch) == 1 else torch.cat(batch)).reshape(-1)
+        if on_chunk is not None:
+            on_chunk(offset, size)
+        offset += size
+        batch, size = [], 0
+    
+    for X in parts:
+        start = 0
+        while start < len(X):
+            take = min(chunk_size - size, len(X) - start)
+            batch.append(X[start:start + take])
+            size += take
+            start += take
+            if size == chunk_size:
+                flush()
+    if size:
+        flush()
+    return out
+
+
+# ==================== MEMORY BUDGET ====================
+# Orçamento de memória estimado por requisição (MB); define o tamanho dos lotes de inferência.
+# É uma estimativa (POINT_BYTES e window_bytes), não um limite medido das alocações.
+MAX_REQUEST_MEMORY_MB = int(os.getenv("MAX_REQUEST_MEMORY_MB", "128"))
+# Bytes que crescem com o intervalo, por dia: fechamento, índice de datas, escala e previsão
+POINT_BYTES = 32
+# Maior lote de inferência: acima disso o forward não fica mais rápido
+MAX_CHUNK_SIZE = 4096
+# Menor lote de inferência aceito antes de recusar a requisição
+MIN_CHUNK_SIZE = 16
+# Janelas por evento "series" no /api/predict/stream
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "256"))
+
+
+def window_bytes(model, seq_length: int = 50) -> int:
+    """
+    Activation memory of one window in a forward pass
+
+    Gates (4 x hidden) plus outputs of one LSTM layer for every step, in
+    float32. Measured peak with hidden 64 is ~40 KB; this estimates 64 KB.
+    """
+    module = getattr(model, "module", model)
+    hidden = getattr(getattr(module, "lstm", None), "hidden_size", None) or 64
+    return seq_length * 5 * hidden * 4
+
+
+def inference_chunk_size(model, points: int, seq_length: int = 50) -> int:
+    """
+    Windows per forward pass that keep a request's estimated memory under ``MAX_REQUEST_MEMORY_MB``
+
+    ``points`` is the number of closes in the request. The estimate is
+    ``points * POINT_BYTES`` plus ``window_bytes`` per window in flight;
+    allocations are not measured. Raises ``ValueError`` when the range
+    alone leaves no room for a useful chunk.
+    """
+    budget = MAX_REQUEST_MEMORY_MB * 2 ** 20 - points * POINT_BYTES
+    per_window = window_bytes(model, seq_length)
+    if budget < per_window * MIN_CHUNK_SIZE:
+        needed = (points * POINT_BYTES + per_window * MIN_CHUNK_SIZE) / 2 ** 20
+        raise ValueError(
+            f"Intervalo longo demais: ~{needed:.1f} MB estimados excedem o orçamento de {MAX_REQUEST_MEMORY_MB} MB por requisição"
+        )
+    return int(min(MAX_CHUNK_SIZE, budget // per_window))
 
 
 # ==================== PLOTTING ====================
-def generate_plot_base64(y_true, y_pred, ticker: str, start_date: str, end_date: str) -> str:
+def plot_id(ticker: str, start_date: str, end_date: str, model_version: str, horizon: int = 1) -> str:
+    """Stable identifier of a prediction plot"""
+    key = f"{ticker}|{start_date}|{end_date}|{horizon}|{model_version}"
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+def generate_plot_png(y_true, y_pred, ticker: str, start_date: str, end_date: str) -> bytes:
     fig, ax = plt.subplots(figsize=(14, 6))
     
     ax.plot(y_true, label='Preço Real', color='#1f77b4', linewidth=2.5, alpha=0.8)
@@ -94,17 +183,168 @@ def generate_plot_base64(y_true, y_pred, ticker: str, start_date: str, end_date:
     ax.legend(fontsize=11, loc='best')
     ax.grid(True, alpha=0.3)
     
-    # Save to base64
     buffer = io.BytesIO()
     plt.savefig(buffer, format='png', dpi=100, bbox_inches='tight')
-    buffer.seek(0)
-    image_base64 = base64.b64encode(buffer.read()).decode()
     plt.close()
     
-    return image_base64
+    return buffer.getvalue()
+
+
+def generate_plot_base64(y_true, y_pred, ticker: str, start_date: str, end_date: str) -> str:
+    return base64.b64encode(generate_plot_png(y_true, y_pred, ticker, start_date, end_date)).decode()
+
+
+# ==================== METRICS ====================
+def compute_metrics(y_true, y_pred) -> dict:
+    mse = float(np.mean((y_true - y_pred) ** 2))
+    mae = float(np.mean(np.abs(y_true - y_pred)))
+    rmse = float(np.sqrt(mse))
+    mape = float(np.mean(np.abs((y_true - y_pred) / np.clip(y_true, 1e-8, None))) * 100)
+    ss_res = np.sum((y_true - y_pred) ** 2)
+    ss_tot = np.sum((y_true - np.mean(y_true)) ** 2)
+    r2 = float(1 - ss_res / ss_tot) if ss_tot > 0 else float("nan")
+    
+    return {
+        "MSE": round(mse, 6),
+        "MAE": round(mae, 6),
+        "RMSE": round(rmse, 6),
+        "MAPE": round(mape, 2),
+        "R2": round(r2, 4)
+    }
+
+
+def price_fields(last_close: float, pred_next_price: float) -> dict:
+    price_change = pred_next_price - last_close
+    price_change_pct = (price_change / last_close) * 100
+    
+    return {
+        "last_close": round(last_close, 2),
+        "next_price": round(float(pred_next_price), 2),
+        "price_change": round(float(price_change), 2),
+        "price_change_pct": round(float(price_change_pct), 2)
+    }
+
+
+def series_event(start: int, y_true, y_pred) -> dict:
+    """Payload of one ``series`` stream event (prices rounded to cents)"""
+    return {
+        "start": start,
+        "y_true": np.round(np.asarray(y_true, dtype=np.float64), 2).tolist(),
+        "y_pred": np.round(np.asarray(y_pred, dtype=np.float64), 2).tolist()
+    }
+
+
+def build_result(
+    ticker: str,
+    start_date: str,
+    end_date: str,
+    last_close: float,
+    pred_next_price: float,
+    metrics: dict,
+    data_points: int,
+    plot: str = None
+) -> dict:
+    return {
+        "ticker": ticker,
+        "start_date": start_date,
+        "end_date": end_date,
+        **price_fields(last_close, pred_next_price),
+        "metrics": metrics,
+        "data_points": data_points,
+        "plot": plot
+    }
+
+
+def attach_forecast(result: dict, forecast_scaled, scaler, stats: dict) -> dict:
+    """Add the multi-step price path (``forecast``) and its rollout stats to a result"""
+    prices = scaler.inverse_transform(np.asarray(forecast_scaled, dtype=np.float64).reshape(-1, 1)).ravel()
+    result["forecast"] = [round(float(p), 2) for p in prices]
+    result["forecast_stats"] = stats
+    return result
+
+
+def to_prices(scaled: np.ndarray, scaler: MinMaxScaler) -> np.ndarray:
+    """Undo the MinMaxScaler in place (keeps float32, no copy)"""
+    scaled -= scaler.min_[0]
+    scaled /= scaler.scale_[0]
+    return scaled
 
 
 # ==================== PREDICTION ====================
+def run_prediction(df, ticker: str, start_date: str, end_date: str, model, horizon: int = 1, on_event=None):
+    """
+    CPU stage of the pipeline: scaling, windowing, inference and metrics
+
+    Returns the result dict (without plot) and the ``(y_true, y_pred)``
+    float32 price series the plot is rendered from. With ``horizon > 1``
+    the result also carries the ``forecast`` path for the next days.
+
+    Everything stays float32: the windows are views over the scaled
+    closes, and inference runs in chunks sized by ``inference_chunk_size``
+    into one preallocated buffer, so memory does not grow with the
+    number of windows in flight.
+
+    ``on_event(name, data)``, when given, is called (from this thread) as
+    the work progresses: ``stage`` after each step, ``next_price`` after
+    the first chunk, ``series`` for every chunk of ``STREAM_CHUNK_SIZE``
+    windows and ``metrics`` at the end.
+    """
+    emit = on_event or (lambda name, data: None)
+    closes = df["Close"].to_numpy(dtype=np.float32)
+    if len(closes) <= 50:
+        raise ValueError("Dados insuficientes para criar sequências (mínimo 51 dias)")
+    chunk_size = inference_chunk_size(model, len(closes))
+    if on_event is not None:
+        chunk_size = min(chunk_size, STREAM_CHUNK_SIZE)
+    
+    with span("scaling"):
+        scaler_new = MinMaxScaler()
+        scaled_data = scaler_new.fit_transform(closes.reshape(-1, 1))
+    emit("stage", {"stage": "scaling"})
+    
+    with span("windowing"):
+        X_t, y_t = sequence_tensors(scaled_data, seq_length=50)
+        last_seq = torch.from_numpy(scaled_data[-50:]).unsqueeze(0)
+    emit("stage", {"stage": "windowing"})
+    
+    def on_chunk(offset, size):
+        prices = to_prices(y_pred[offset:offset + size].copy(), scaler_new)
+        if offset == 0:
+            emit("next_price", price_fields(float(closes[-1]), float(prices[0])))
+            prices, offset, size = prices[1:], 1, size - 1
+        if size:
+            emit("series", series_event(offset - 1, closes[49 + offset:49 + offset + size], prices))
+    
+    # Previsão do próximo dia na primeira posição (sai no primeiro lote), depois uma por janela de avaliação
+    y_pred = np.empty(len(X_t) + 1, dtype=np.float32)
+    model.eval()
+    with span("inference"), torch.no_grad():
+        forward_chunks(model, [last_seq, X_t], y_pred, chunk_size, on_chunk if on_event is not None else None)
+    emit("stage", {"stage": "inference"})
+    
+    with span("metrics"):
+        metrics = compute_metrics(y_t.numpy().ravel(), y_pred[1:])
+    emit("metrics", {"metrics": metrics, "data_points": len(X_t)})
+    
+    with span("scaling"):
+        to_prices(y_pred, scaler_new)
+    
+    result = build_result(
+        ticker,
+        start_date,
+        end_date,
+        float(closes[-1]),
+        float(y_pred[0]),
+        metrics,
+        len(X_t)
+    )
+    if horizon > 1:
+        with span("inference"):
+            forecast, stats = rollout(model, last_seq.squeeze(-1), horizon)
+        attach_forecast(result, forecast[0].numpy(), scaler_new, stats)
+    return result, (closes[50:], y_pred[1:])
+
+
 def predict_stock(
     ticker: str,
     start_date: str,
@@ -114,67 +354,128 @@ def predict_stock(
 ) -> dict:
 
     df = load_stock_data(ticker, start_date, end_date)
-    df.reset_index(inplace=True)
+    result, (y_true, y_pred) = run_prediction(df, ticker, start_date, end_date, model)
     
-    scaler_new = MinMaxScaler()
-    scaled_data = scaler_new.fit_transform(df[["Close"]])
+    plot_image = generate_plot_base64(y_true, y_pred, ticker, start_date, end_date)
+    result["plot"] = f"data:image/png;base64,{plot_image}"
     
-    X, y = create_sequences(scaled_data, seq_length=50)
+    return result
+
+
+# ==================== BATCH PREDICTION ====================
+def load_stocks_data(tickers, start: str, end: str, cache: PriceCache = None) -> dict:
+    """
+    Load closes for several tickers with one multi-ticker fetch per gap
+
+    Applies the same ``.SA`` fallback as ``load_stock_data``. Returns a
+    dict mapping each ticker to its DataFrame or to a ``RuntimeError``.
+    """
+    cache = cache or get_price_cache()
+    symbols = {}
+    for ticker in tickers:
+        symbols[ticker] = ticker
+        if "." not in ticker and not cache.contains(ticker) and cache.contains(f"{ticker}.SA"):
+            symbols[ticker] = f"{ticker}.SA"
     
-    if len(X) == 0:
-        raise ValueError("Dados insuficientes para criar sequências (mínimo 51 dias)")
+    try:
+        closes = cache.get_many(list(symbols.values()), start, end)
+    except Exception as e:
+        raise RuntimeError(f"Failed to download data for {', '.join(tickers)}: {e}")
     
-    X_t = torch.tensor(X, dtype=torch.float32)
-    y_t = torch.tensor(y, dtype=torch.float32)
+    fallback = [t for t in tickers if closes[symbols[t]].empty and "." not in symbols[t]]
+    if fallback:
+        try:
+            closes.update(cache.get_many([f"{t}.SA" for t in fallback], start, end))
+            for ticker in fallback:
+                symbols[ticker] = f"{ticker}.SA"
+        except Exception as e:
+            print(f"⚠️  Fallback .SA falhou para {', '.join(fallback)}: {e}")
     
-    model.eval()
-    with torch.no_grad():
-        y_pred = model(X_t).numpy()
-        y_true = y_t.numpy()
+    frames = {}
+    for ticker in tickers:
+        close = closes.get(symbols[ticker])
+        if close is None or close.empty:
+            frames[ticker] = RuntimeError(
+                f"No data returned for {symbols[ticker]}. Verifique se o ticker está correto."
+            )
+        else:
+            frames[ticker] = close.to_frame("Close")
+    return frames
+
+
+def run_batch_prediction(frames: dict, start_date: str, end_date: str, model, horizon: int = 1):
+    """
+    CPU stage of the batch pipeline: every ticker's windows in shared chunks
+
+    Every ticker is scaled on its own range, then the evaluation windows
+    and next-day windows of all tickers run through the model in chunks
+    of ``inference_chunk_size`` windows (small tickers share one forward
+    pass) written into one float32 buffer. Returns
+    ``(results, errors, series)`` where ``series`` maps each ticker to the
+    ``(y_true, y_pred)`` prices used for its plot. With ``horizon > 1``
+    the forecast paths of all tickers are rolled out together, one
+    forward pass per step.
+    """
+    prepared = []
+    errors = {}
+    points = sum(len(df) for df in frames.values() if not isinstance(df, Exception))
+    chunk_size = inference_chunk_size(model, points)
+    for ticker, df in frames.items():
+        if isinstance(df, Exception):
+            errors[ticker] = str(df)
+            continue
+        
+        closes = df["Close"].to_numpy(dtype=np.float32)
+        if len(closes) <= 50:
+            errors[ticker] = "Dados insuficientes para criar sequências (mínimo 51 dias)"
+            continue
+        with span("scaling"):
+            scaler_new = MinMaxScaler()
+            scaled_data = scaler_new.fit_transform(closes.reshape(-1, 1))
+        with span("windowing"):
+            X, y = sequence_tensors(scaled_data, seq_length=50)
+        prepared.append((ticker, closes, scaler_new, scaled_data, X, y))
     
-    y_pred_inv = scaler_new.inverse_transform(y_pred)
-    y_true_inv = scaler_new.inverse_transform(y_true)
+    if not prepared:
+        return [], errors, {}
     
-    mse = float(np.mean((y_true - y_pred) ** 2))
-    mae = float(np.mean(np.abs(y_true - y_pred)))
-    rmse = float(np.sqrt(mse))
-    mape = float(np.mean(np.abs((y_true - y_pred) / np.clip(y_true, 1e-8, None))) * 100)
-    ss_res = np.sum((y_true - y_pred) ** 2)
-    ss_tot = np.sum((y_true - np.mean(y_true)) ** 2)
-    r2 = float(1 - ss_res / ss_tot) if ss_tot > 0 else float("nan")
+    # Janelas de avaliação de todos os tickers seguidas das últimas janelas (previsão do próximo dia)
+    last_windows = torch.stack([torch.from_numpy(scaled_data[-50:]) for *_, scaled_data, _, _ in prepared])
+    next_offset = sum(len(X) for *_, X, _ in prepared)
+    y_pred_all = np.empty(next_offset + len(prepared), dtype=np.float32)
     
-    with torch.no_grad():
-        last_seq = torch.tensor(scaled_data[-50:], dtype=torch.float32).unsqueeze(0)
-        pred_next_scaled = model(last_seq).numpy()
-        pred_next_price = scaler_new.inverse_transform(pred_next_scaled)[0][0]
+    model.eval()
+    with span("inference"), torch.no_grad():
+        forward_chunks(model, [X for *_, X, _ in prepared] + [last_windows], y_pred_all, chunk_size)
     
-    plot_image = generate_plot_base64(
-        y_true_inv.squeeze().tolist(),
-        y_pred_inv.squeeze().tolist(),
-        ticker,
-        start_date,
-        end_date
-    )
+    offset = 0
+    results = []
+    series = {}
+    for i, (ticker, closes, scaler_new, _, X, y) in enumerate(prepared):
+        y_pred = y_pred_all[offset:offset + len(X)]
+        offset += len(X)
+        
+        with span("metrics"):
+            metrics = compute_metrics(y.numpy().ravel(), y_pred)
+        with span("scaling"):
+            to_prices(y_pred, scaler_new)
+            pred_next_price = float(to_prices(y_pred_all[next_offset + i:next_offset + i + 1], scaler_new)[0])
+            series[ticker] = (closes[50:], y_pred)
+        
+        results.append(build_result(
+            ticker,
+            start_date,
+            end_date,
+            float(closes[-1]),
+            pred_next_price,
+            metrics,
+            len(X)
+        ))
     
-    last_close = float(df["Close"].iloc[-1])
-    price_change = pred_next_price - last_close
-    price_change_pct = (price_change / last_close) * 100
+    if horizon > 1:
+        with span("inference"):
+            forecasts, stats = rollout(model, last_windows.squeeze(-1), horizon)
+        for result, forecast, (_, _, scaler_new, *_) in zip(results, forecasts.numpy(), prepared):
+            attach_forecast(result, forecast, scaler_new, stats)
     
-    return {
-        "ticker": ticker,
-        "start_date": start_date,
-        "end_date": end_date,
-        "last_close": round(last_close, 2),
-        "next_price": round(pred_next_price, 2),
-        "price_change": round(price_change, 2),
-        "price_change_pct": round(price_change_pct, 2),
-        "metrics": {
-            "MSE": round(mse, 6),
-            "MAE": round(mae, 6),
-            "RMSE": round(rmse, 6),
-            "MAPE": round(mape, 2),
-            "R2": round(r2, 4)
-        },
-        "data_points": len(X),
-        "plot": f"data:image/png;base64,{plot_image}"
-    }
+    return results, errors, series
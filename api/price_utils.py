@@ -0,0 +1,341 @@
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .metrics_utils import collector, span
+
+
+# ==================== PRICE PROVIDERS ====================
+class YahooPriceProvider:
+    """Fetch daily closes from Yahoo Finance"""
+
+    def fetch(self, symbol: str, start: str, end: str) -> pd.Series:
+        import yfinance as yf
+
+        df = yf.download(symbol, start=start, end=end, auto_adjust=False, progress=False)
+        if df is None or df.empty:
+            return _empty_series()
+
+        close = df["Close"]
+        # yfinance devolve colunas MultiIndex (Price, Ticker) mesmo para um único ticker
+        if isinstance(close, pd.DataFrame):
+            close = close.iloc[:, 0]
+        return _normalize_series(close)
+
+    def fetch_many(self, symbols: List[str], start: str, end: str) -> Dict[str, pd.Series]:
+        import yfinance as yf
+
+        if len(symbols) == 1:
+            return {symbols[0]: self.fetch(symbols[0], start, end)}
+
+        df = yf.download(symbols, start=start, end=end, auto_adjust=False, progress=False)
+        if df is None or df.empty:
+            return {symbol: _empty_series() for symbol in symbols}
+
+        close = df["Close"]
+        return {
+            symbol: _normalize_series(close[symbol]) if symbol in close.columns else _empty_series()
+            for symbol in symbols
+        }
+
+
+class FixturePriceProvider:
+    """
+    Serve closes from local data, for offline tests and benchmarks
+
+    Data comes either from an in-memory mapping ``{symbol: pd.Series}`` or
+    from ``<directory>/<SYMBOL>.csv`` files with ``Date`` and ``Close``
+    columns. Every fetch is recorded in ``calls``.
+    """
+
+    def __init__(self, directory: Optional[str] = None, series: Optional[Dict[str, pd.Series]] = None):
+        self.directory = Path(directory) if directory else None
+        self.series = {k: _normalize_series(v) for k, v in (series or {}).items()}
+        self.calls = []
+
+    def _load(self, symbol: str) -> pd.Series:
+        if symbol in self.series:
+            return self.series[symbol]
+        if self.directory is not None:
+            csv_file = self.directory / f"{symbol}.csv"
+            if csv_file.exists():
+                df = pd.read_csv(csv_file, parse_dates=["Date"], index_col="Date")
+                self.series[symbol] = _normalize_series(df["Close"])
+                return self.series[symbol]
+        return _empty_series()
+
+    def fetch(self, symbol: str, start: str, end: str) -> pd.Series:
+        self.calls.append((symbol, start, end))
+        close = self._load(symbol)
+        return close[(close.index >= pd.Timestamp(start)) & (close.index < pd.Timestamp(end))]
+
+    def fetch_many(self, symbols: List[str], start: str, end: str) -> Dict[str, pd.Series]:
+        return {symbol: self.fetch(symbol, start, end) for symbol in symbols}
+
+
+def _empty_series() -> pd.Series:
+    return pd.Series([], index=pd.DatetimeIndex([], name="Date"), dtype="float32", name="Close")
+
+
+def _normalize_series(close: pd.Series) -> pd.Series:
+    close = close.dropna()
+    index = pd.DatetimeIndex(close.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    # float32 desde o download: mesmo dtype do store e do modelo
+    return pd.Series(
+        close.to_numpy(dtype="float32"),
+        index=index.normalize().rename("Date"),
+        name="Close"
+    ).sort_index()
+
+
+# ==================== PRICE CACHE ====================
+class PriceCache:
+    """
+    Persistent per-ticker cache of daily closes
+
+    Each symbol is stored as ``<cache_dir>/<SYMBOL>.npz`` holding the dates,
+    the float32 closes and the ``[start, end)`` date range already fetched from the
+    provider. A request only downloads the head/tail gaps outside that range
+    and serves the rest from disk. Today's bar is never marked as covered,
+    so it is refreshed on the next request.
+
+    Past ranges the provider answered with no bars (holidays at the tail,
+    days before the first listing at the head) are not covered either,
+    since an empty answer can also be a network error. They are kept as
+    ``probed`` ranges instead and skipped until the next day, so each one
+    is retried at most once a day.
+    """
+
+    def __init__(self, cache_dir: str, provider=None):
+        self.cache_dir = Path(cache_dir)
+        self.provider = provider or YahooPriceProvider()
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        # Faixas passadas que voltaram vazias hoje, por símbolo: (início, fim, dia da consulta)
+        self._probed: Dict[str, list] = {}
+        # Pedidos atendidos só do disco / que precisaram baixar alguma lacuna
+        self.hits = 0
+        self.misses = 0
+
+    def _lock(self, symbol: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(symbol, threading.Lock())
+
+    def _count(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def _path(self, symbol: str) -> Path:
+        return self.cache_dir / f"{symbol.replace('/', '_')}.npz"
+
+    def contains(self, symbol: str) -> bool:
+        return self._path(symbol).exists()
+
+    def read(self, symbol: str):
+        """Return ``(close, covered)`` stored for ``symbol`` or ``(None, None)``"""
+        path = self._path(symbol)
+        if not path.exists():
+            return None, None
+        try:
+            with np.load(path) as data:
+                close = pd.Series(
+                    data["close"],
+                    index=pd.DatetimeIndex(data["dates"].astype("datetime64[ns]"), name="Date"),
+                    name="Close"
+                )
+                covered = (data["covered"][0], data["covered"][1])
+                probed = data["probed"] if "probed" in data.files else np.empty((0, 3), dtype="datetime64[D]")
+            self._probed[symbol] = [tuple(row) for row in probed]
+            return close, covered
+        except Exception as e:
+            print(f"⚠️  Cache corrompido para {symbol} ({e}). Ignorando.")
+            return None, None
+
+    def write(self, symbol: str, close: pd.Series, covered) -> None:
+        """Atomically replace the stored data for ``symbol``"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(symbol)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                dates=close.index.to_numpy().astype("datetime64[D]"),
+                close=close.to_numpy(dtype=np.float32),
+                covered=np.array(covered, dtype="datetime64[D]"),
+                probed=np.array(self._probes_today(symbol), dtype="datetime64[D]").reshape(-1, 3)
+            )
+        os.replace(tmp_path, path)
+
+    def _probes_today(self, symbol: str) -> list:
+        today = np.datetime64("today", "D")
+        return [probe for probe in self._probed.get(symbol, []) if probe[2] == today]
+
+    def missing_ranges(self, covered, start: str, end: str, symbol: Optional[str] = None):
+        """
+        Date ranges of ``[start, end)`` not yet fetched, as ``(start, end)`` strings
+
+        With ``symbol``, the part of a gap already answered empty today
+        (after its ``read``) is skipped.
+        """
+        start_day = np.datetime64(start, "D")
+        end_day = np.datetime64(end, "D")
+        if covered is None:
+            return [(str(start_day), str(end_day))]
+
+        gaps = []
+        covered_start, covered_end = covered
+        if start_day < covered_start:
+            gaps.append((start_day, covered_start))
+        if end_day > covered_end:
+            gaps.append((covered_end, end_day))
+
+        probes = sorted(self._probes_today(symbol)) if symbol is not None else []
+        pending = []
+        for gap_start, gap_end in gaps:
+            for probe_start, probe_end, _ in probes:
+                if probe_start <= gap_start < probe_end:
+                    gap_start = probe_end
+            if gap_start < gap_end:
+                pending.append((str(gap_start), str(gap_end)))
+        return pending
+
+    def merge(self, symbol: str, close, covered, fetched: pd.Series, start: str, end: str):
+        """
+        Merge closes fetched for ``[start, end)`` into ``close`` and persist them
+
+        ``covered`` only grows over what the provider actually answered: an
+        empty fetch over a range with weekdays leaves the range pending
+        (yfinance returns an empty frame on network and rate-limit errors)
+        and records its past part as probed for today, and the covered end
+        never passes the day after the last close returned.
+        """
+        if close is None and fetched.empty:
+            # Ticker desconhecido: não grava cache negativo
+            return close, covered
+
+        fetch_start = np.datetime64(start, "D")
+        fetch_end = min(np.datetime64(end, "D"), np.datetime64("today", "D"))
+        if fetched.empty:
+            if weekdays(fetch_start, fetch_end) > 0:
+                today = np.datetime64("today", "D")
+                self._probed[symbol] = self._probes_today(symbol) + [(fetch_start, fetch_end, today)]
+                try:
+                    self.write(symbol, close, covered)
+                except OSError as e:
+                    print(f"⚠️  Falha ao gravar cache de {symbol}: {e}")
+                return close, covered
+        else:
+            fetch_end = min(fetch_end, np.datetime64(fetched.index[-1].date(), "D") + 1)
+        if covered is None:
+            covered = (fetch_start, max(fetch_end, fetch_start))
+        else:
+            covered = (min(covered[0], fetch_start), max(covered[1], fetch_end))
+
+        if close is None or close.empty:
+            close = fetched
+        elif not fetched.empty:
+            close = pd.concat([close, fetched])
+            close = close[~close.index.duplicated(keep="last")].sort_index()
+
+        try:
+            self.write(symbol, close, covered)
+        except OSError as e:
+            print(f"⚠️  Falha ao gravar cache de {symbol}: {e}")
+        return close, covered
+
+    def get(self, symbol: str, start: str, end: str) -> pd.Series:
+        """Return closes of ``symbol`` in ``[start, end)``, fetching only the missing gaps"""
+        with self._lock(symbol):
+            close, covered = self.read(symbol)
+            gaps = self.missing_ranges(covered, start, end, symbol)
+            self._count(len(gaps) == 0)
+            for gap_start, gap_end in gaps:
+                with span("download"):
+                    fetched = self.provider.fetch(symbol, gap_start, gap_end)
+                close, covered = self.merge(symbol, close, covered, fetched, gap_start, gap_end)
+
+        return _slice(close, start, end)
+
+    def get_many(self, symbols: List[str], start: str, end: str) -> Dict[str, pd.Series]:
+        """
+        Return closes for several symbols in ``[start, end)``
+
+        Symbols missing the same date range are fetched together with a
+        single multi-ticker ``fetch_many`` call.
+        """
+        symbols = list(dict.fromkeys(symbols))
+        locks = [self._lock(symbol) for symbol in sorted(symbols)]
+        for lock in locks:
+            lock.acquire()
+        try:
+            stored = {symbol: self.read(symbol) for symbol in symbols}
+
+            pending: Dict[tuple, List[str]] = {}
+            for symbol, (_, covered) in stored.items():
+                gaps = self.missing_ranges(covered, start, end, symbol)
+                self._count(len(gaps) == 0)
+                for gap in gaps:
+                    pending.setdefault(gap, []).append(symbol)
+
+            for (gap_start, gap_end), gap_symbols in sorted(pending.items()):
+                with span("download"):
+                    fetched = self.provider.fetch_many(gap_symbols, gap_start, gap_end)
+                for symbol in gap_symbols:
+                    close, covered = stored[symbol]
+                    stored[symbol] = self.merge(
+                        symbol, close, covered, fetched.get(symbol, _empty_series()), gap_start, gap_end
+                    )
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+        return {symbol: _slice(close, start, end) for symbol, (close, _) in stored.items()}
+
+
+def weekdays(start, end) -> int:
+    """Weekdays in ``[start, end)``: upper bound on the trading sessions of a gap"""
+    start, end = np.datetime64(start, "D"), np.datetime64(end, "D")
+    return int(np.busday_count(start, end)) if end > start else 0
+
+
+def _slice(close: Optional[pd.Series], start: str, end: str) -> pd.Series:
+    if close is None:
+        return _empty_series()
+    return close[(close.index >= pd.Timestamp(start)) & (close.index < pd.Timestamp(end))]
+
+
+# ==================== DEFAULT CACHE ====================
+PRICE_CACHE_DIR = os.getenv("PRICE_CACHE_DIR", "/app/cache/prices")
+
+_price_cache: Optional[PriceCache] = None
+
+
+def get_price_provider():
+    """Build the provider selected by ``PRICE_PROVIDER`` (yahoo or fixture)"""
+    if os.getenv("PRICE_PROVIDER", "yahoo").lower() == "fixture":
+        return FixturePriceProvider(os.getenv("PRICE_FIXTURE_DIR", "/app/data/fixtures"))
+    return YahooPriceProvider()
+
+
+def get_price_cache() -> PriceCache:
+    if _price_cache is None:
+        configure_price_cache(PriceCache(PRICE_CACHE_DIR, get_price_provider()))
+    return _price_cache
+
+
+def configure_price_cache(cache: Optional[PriceCache]) -> None:
+    """Replace the process-wide cache (e.g. with a fixture-backed one)"""
+    global _price_cache
+    _price_cache = cache
+    if cache is None:
+        collector.caches.pop("prices", None)
+    else:
+        collector.caches["prices"] = cache
@@ -0,0 +1,310 @@
+"""
+Versioned model registry with hot swap
+
+Layout under ``MODEL_REGISTRY_DIR``::
+
+    <version>/model.pt        state dict (loaded memory-mapped)
+    <version>/scaler.joblib
+    <version>/config.json     architecture, sha256 checksum, created_at
+    ACTIVE                    version served by every worker
+
+Activating a version loads and warms it up next to the current one, then
+swaps a single reference: requests already running finish on the old
+model, new requests get the new one. Other workers notice the ``ACTIVE``
+pointer change within ``REGISTRY_POLL_SECONDS``.
+
+Without any registered version, the legacy ``/app/models`` artifacts are
+served (version = checksum of the weights).
+
+Uso:
+    python -m api.registry_utils register --model models/stock_lstm.pt --scaler models/scaler.joblib --activate
+    python -m api.registry_utils list
+    python -m api.registry_utils activate <version>
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "/app/models/registry")
+LEGACY_MODEL_PATH = "/app/models/stock_lstm.pt"
+LEGACY_SCALER_PATH = "/app/models/scaler.joblib"
+REGISTRY_POLL_SECONDS = float(os.getenv("REGISTRY_POLL_SECONDS", "5"))
+
+DEFAULT_CONFIG = {
+    "architecture": "StockLSTM",
+    "input_size": 1,
+    "hidden_size": 64,
+    "num_layers": 2,
+    "sequence_length": 50
+}
+
+
+def file_checksum(path: str, length: int = 12) -> str:
+    """Short SHA-256 of an artifact file, used as model version"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:length]
+
+
+class LoadedModel:
+    """A warmed-up model version ready to serve"""
+
+    def __init__(self, version: str, model, scaler, config: Dict[str, Any], path: str):
+        self.version = version
+        self.model = model
+        self.scaler = scaler
+        self.config = config
+        self.path = path
+        self.loaded_at = time.time()
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "path": self.path,
+            "config": self.config,
+            "inference": self.model.info(),
+            "loaded_at": self.loaded_at
+        }
+
+
+class ModelRegistry:
+    """
+    Model versions on disk and the one currently served
+
+    Args:
+        root: Registry directory
+        legacy_model: Weights served when the registry is empty
+        legacy_scaler: Scaler served when the registry is empty
+    """
+
+    def __init__(
+        self,
+        root: str = MODEL_REGISTRY_DIR,
+        legacy_model: str = LEGACY_MODEL_PATH,
+        legacy_scaler: str = LEGACY_SCALER_PATH
+    ):
+        self.root = Path(root)
+        self.legacy_model = legacy_model
+        self.legacy_scaler = legacy_scaler
+        self.active: Optional[LoadedModel] = None
+        # idle -> loading -> ready | failed (carga inicial)
+        self.state = "idle"
+        self.error: Optional[str] = None
+        self._swap_lock = threading.Lock()
+        self._pointer_checked = 0.0
+        self._failed_version: Optional[str] = None
+
+    # ---------- versions on disk ----------
+    def versions(self) -> List[Dict[str, Any]]:
+        if not self.root.exists():
+            return []
+        active = self.active.version if self.active else None
+        versions = []
+        for config_path in sorted(self.root.glob("*/config.json")):
+            config = json.loads(config_path.read_text())
+            version = config_path.parent.name
+            versions.append({"version": version, "active": version == active, **config})
+        return versions
+
+    def register(
+        self,
+        model_path: str,
+        scaler_path: str,
+        version: Optional[str] = None,
+        config: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Copy artifacts into a new version directory (written atomically)"""
+        checksum = file_checksum(model_path, length=64)
+        version = version or checksum[:12]
+        target = self.root / version
+        if target.exists():
+            raise ValueError(f"Model version '{version}' already registered")
+
+        tmp = self.root / f".{version}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        shutil.copyfile(model_path, tmp / "model.pt")
+        shutil.copyfile(scaler_path, tmp / "scaler.joblib")
+        (tmp / "config.json").write_text(json.dumps({
+            **DEFAULT_CONFIG,
+            **(config or {}),
+            "checksum": checksum,
+            "created_at": datetime.utcnow().isoformat() + "Z"
+        }, indent=2))
+        os.replace(tmp, target)
+        return version
+
+    # ---------- loading ----------
+    def load(self, version: Optional[str] = None) -> LoadedModel:
+        """Load (memory-mapped), verify and warm up a version; ``None`` = legacy artifacts"""
+        # torch/joblib só são importados aqui, fora do caminho de import da API
+        import joblib
+
+        from src.model_utils import load_model
+        from .inference_utils import load_inference_model, synthetic_windows
+
+        if version is None:
+            model_path, scaler_path = self.legacy_model, self.legacy_scaler
+            config = dict(DEFAULT_CONFIG)
+            version = file_checksum(model_path)
+        else:
+            directory = self.root / version
+            if not (directory / "config.json").exists():
+                raise ValueError(f"Model version '{version}' not found")
+            model_path, scaler_path = str(directory / "model.pt"), str(directory / "scaler.joblib")
+            config = json.loads((directory / "config.json").read_text())
+            if file_checksum(model_path, length=64) != config.get("checksum"):
+                raise ValueError(f"Checksum mismatch for model version '{version}'")
+            if config.get("sequence_length", 50) != 50:
+                raise ValueError("Only sequence_length=50 is supported by the API")
+
+        module = load_model(
+            model_path,
+            input_size=config["input_size"],
+            hidden_size=config["hidden_size"],
+            num_layers=config["num_layers"]
+        )
+        model = load_inference_model(module)
+        # Aquecimento: primeira chamada (alocações, compilação) fora do caminho das requisições
+        model(synthetic_windows(1))
+        model(synthetic_windows(256))
+        return LoadedModel(version, model, joblib.load(scaler_path), config, model_path)
+
+    def activate(self, version: str, persist: bool = True) -> LoadedModel:
+        """Load ``version`` next to the current model and swap it in"""
+        with self._swap_lock:
+            loaded = self.load(version)
+            self.active = loaded
+            self._failed_version = None
+            # Uma troca bem-sucedida recupera de uma carga inicial que falhou
+            self.state = "ready"
+            self.error = None
+            if persist:
+                self.set_active(version)
+        print(f"✅ Modelo ativo: {version}")
+        return loaded
+
+    def load_active(self) -> LoadedModel:
+        """Initial load: ``ACTIVE`` pointer, else newest version, else legacy artifacts"""
+        version = self._read_pointer()
+        if version is None:
+            versions = self.versions()
+            if versions:
+                version = max(versions, key=lambda v: v.get("created_at", ""))["version"]
+        with self._swap_lock:
+            self.active = self.load(version)
+        return self.active
+
+    def load_in_background(self, warmup: Optional[Callable[[LoadedModel], None]] = None) -> threading.Thread:
+        """
+        Run ``load_active`` (then ``warmup``) in a daemon thread
+
+        The process starts serving immediately; ``state`` becomes ``ready``
+        once the model is loaded and warmed, or ``failed`` with ``error``.
+        """
+        def run():
+            self.state = "loading"
+            try:
+                active = self.load_active()
+                if warmup is not None:
+                    warmup(active)
+                self.state = "ready"
+                print(f"✅ Modelo {active.version} carregado e aquecido")
+            except Exception as e:
+                self.error = str(e)
+                self.state = "failed"
+                print(f"Error loading model: {e}")
+
+        self.state = "loading"
+        thread = threading.Thread(target=run, name="model-loader", daemon=True)
+        thread.start()
+        return thread
+
+    def current(self) -> Optional[LoadedModel]:
+        """Model to serve; picks up activations made by other workers"""
+        now = time.monotonic()
+        # Depois de uma carga inicial falha o ponteiro ainda é observado para recuperar
+        watching = self.active is not None or self.state == "failed"
+        if watching and now - self._pointer_checked >= REGISTRY_POLL_SECONDS:
+            self._pointer_checked = now
+            version = self._read_pointer()
+            current = self.active.version if self.active is not None else None
+            if (
+                version is not None
+                and version != current
+                and version != self._failed_version
+                and not self._swap_lock.locked()
+            ):
+                threading.Thread(target=self._sync, args=(version,), daemon=True).start()
+        return self.active
+
+    def _sync(self, version: str) -> None:
+        try:
+            self.activate(version, persist=False)
+        except Exception as e:
+            self._failed_version = version
+            print(f"⚠️  Falha ao ativar modelo {version}: {e}")
+
+    # ---------- ACTIVE pointer ----------
+    def set_active(self, version: str) -> None:
+        """Point ``ACTIVE`` to a registered ``version``; every worker picks it up"""
+        if not (self.root / version / "config.json").exists():
+            raise ValueError(f"Model version '{version}' not found")
+        self._write_pointer(version)
+
+    def _read_pointer(self) -> Optional[str]:
+        try:
+            return (self.root / "ACTIVE").read_text().strip() or None
+        except OSError:
+            return None
+
+    def _write_pointer(self, version: str) -> None:
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp = self.root / f".ACTIVE.{os.getpid()}.tmp"
+            tmp.write_text(version)
+            os.replace(tmp, self.root / "ACTIVE")
+        except OSError as e:
+            print(f"⚠️  Não foi possível gravar o ponteiro ACTIVE: {e}")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the model registry")
+    sub = parser.add_subparsers(dest="command", required=True)
+    register = sub.add_parser("register", help="Add a new model version")
+    register.add_argument("--model", required=True)
+    register.add_argument("--scaler", required=True)
+    register.add_argument("--version")
+    register.add_argument("--activate", action="store_true")
+    sub.add_parser("list", help="List registered versions")
+    activate = sub.add_parser("activate", help="Point ACTIVE to a version (workers reload it)")
+    activate.add_argument("version")
+    args = parser.parse_args()
+
+    registry = ModelRegistry()
+    if args.command == "register":
+        version = registry.register(args.model, args.scaler, args.version)
+        print(f"✅ Versão registrada: {version}")
+        if args.activate:
+            registry.activate(version)  # carrega e valida antes de publicar
+    elif args.command == "activate":
+        registry.activate(args.version)
+        print(f"✅ ACTIVE -> {args.version}")
+    else:
+        print(json.dumps(registry.versions(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
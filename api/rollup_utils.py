@@ -0,0 +1,274 @@
+"""
+Materialized aggregate of the prediction logs used by the dashboard
+
+The rollup is a single JSON object (``ROLLUP_KEY``) with the counters and
+series the dashboard needs. It is kept up to date incrementally: log keys
+are time-ordered (``<prefix>YYYY/MM/DD/HHMMSS_...``), so only objects
+listed after the stored watermark have to be read.
+
+Uso:
+    python -m api.rollup_utils refresh
+    python -m api.rollup_utils rebuild --workers 16
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from .storage_utils import decode_log_object, get_object_store
+
+
+ROLLUP_KEY = os.getenv("ROLLUP_KEY", "rollups/dashboard.json")
+# Tamanho máximo das séries (tempo de execução, R², variação) guardadas no rollup
+ROLLUP_SERIES_LIMIT = int(os.getenv("ROLLUP_SERIES_LIMIT", "5000"))
+ROLLUP_RECENT_LOGS = 50
+# Janela relida a cada atualização para pegar lotes enviados fora de ordem por outros workers
+ROLLUP_LAG_SECONDS = int(os.getenv("ROLLUP_LAG_SECONDS", "300"))
+
+
+def key_timestamp(key: str, prefix: str) -> Optional[datetime]:
+    """Parse the ``YYYY/MM/DD/HHMMSS`` part of a log key"""
+    try:
+        return datetime.strptime(key[len(prefix):len(prefix) + 17], "%Y/%m/%d/%H%M%S")
+    except ValueError:
+        return None
+
+
+class DashboardRollup:
+    """Counters and bounded series aggregated from log entries"""
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None):
+        data = data or {}
+        self.total_predictions = data.get("total_predictions", 0)
+        self.successful = data.get("successful", 0)
+        self.failed = data.get("failed", 0)
+        self.tickers_count: Dict[str, int] = data.get("tickers_count", {})
+        self.daily_predictions: Dict[str, int] = data.get("daily_predictions", {})
+        self.execution_times: List[float] = data.get("execution_times", [])
+        self.r2_scores: List[float] = data.get("r2_scores", [])
+        self.prediction_changes: List[float] = data.get("prediction_changes", [])
+        self.recent_logs: List[Dict[str, Any]] = data.get("recent_logs", [])
+        self.watermark: Optional[str] = data.get("watermark")
+        # Chaves já aplicadas dentro da janela de atraso (evita contar duas vezes)
+        self.recent_keys: List[str] = data.get("recent_keys", [])
+        self.updated_at: Optional[str] = data.get("updated_at")
+
+    def apply(self, entries: List[Dict[str, Any]]) -> None:
+        for log_data in entries:
+            try:
+                self.total_predictions += 1
+                if log_data["execution"]["success"]:
+                    self.successful += 1
+
+                    if "result" in log_data and log_data["result"]:
+                        r2 = log_data["result"].get("metrics", {}).get("R2")
+                        if r2 is not None:
+                            self.r2_scores.append(r2)
+
+                        change_pct = log_data["result"].get("price_change_pct")
+                        if change_pct is not None:
+                            self.prediction_changes.append(change_pct)
+                else:
+                    self.failed += 1
+
+                ticker = log_data["request"]["ticker"]
+                self.tickers_count[ticker] = self.tickers_count.get(ticker, 0) + 1
+
+                day = log_data["timestamp"].split("T")[0]
+                self.daily_predictions[day] = self.daily_predictions.get(day, 0) + 1
+
+                self.execution_times.append(log_data["execution"]["duration_seconds"])
+                self.recent_logs.append(log_data)
+            except (KeyError, TypeError, AttributeError):
+                continue
+
+        del self.execution_times[:-ROLLUP_SERIES_LIMIT]
+        del self.r2_scores[:-ROLLUP_SERIES_LIMIT]
+        del self.prediction_changes[:-ROLLUP_SERIES_LIMIT]
+        self.recent_logs.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+        del self.recent_logs[ROLLUP_RECENT_LOGS:]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+    def dashboard_data(self) -> Dict[str, Any]:
+        """Same shape as the former full-scan ``get_dashboard_data``"""
+        return {
+            "total_predictions": self.total_predictions,
+            "successful": self.successful,
+            "failed": self.failed,
+            "logs": list(self.recent_logs),
+            "tickers_count": dict(self.tickers_count),
+            "daily_predictions": dict(self.daily_predictions),
+            "execution_times": list(self.execution_times),
+            "r2_scores": list(self.r2_scores),
+            "prediction_changes": list(self.prediction_changes),
+            "version": f"{self.watermark}:{self.total_predictions}"
+        }
+
+
+class RollupIndex:
+    """
+    Keeps the persisted ``DashboardRollup`` in sync with the log store
+
+    Args:
+        store: Object store holding the logs and the rollup
+        prefix: Log key prefix
+        rollup_key: Key of the persisted rollup object
+        workers: Parallel ``get`` calls when reading log objects
+    """
+
+    def __init__(self, store, prefix: str, rollup_key: str = ROLLUP_KEY, workers: int = 8):
+        self.store = store
+        self.prefix = prefix
+        self.rollup_key = rollup_key
+        self.workers = workers
+        self._lock = threading.Lock()
+
+    # ---------- persistence ----------
+    def load(self, key: Optional[str] = None) -> DashboardRollup:
+        try:
+            return DashboardRollup(json.loads(self.store.get(key or self.rollup_key)))
+        except Exception:
+            return DashboardRollup()
+
+    def save(self, rollup: DashboardRollup, key: Optional[str] = None) -> None:
+        rollup.updated_at = datetime.utcnow().isoformat() + "Z"
+        body = json.dumps(rollup.to_dict(), ensure_ascii=False).encode("utf-8")
+        self.store.put(key or self.rollup_key, body)
+
+    # ---------- reading logs ----------
+    def _is_log_key(self, key: str) -> bool:
+        return not key.startswith(self.rollup_key) and key_timestamp(key, self.prefix) is not None
+
+    def _read_entries(self, keys: List[str]) -> List[List[Dict[str, Any]]]:
+        def read(key):
+            try:
+                return decode_log_object(key, self.store.get(key))
+            except Exception as e:
+                print(f"⚠️  Error processing log {key}: {e}")
+                return []
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(read, keys))
+
+    def _apply_keys(self, rollup: DashboardRollup, keys: List[str]) -> None:
+        for key, entries in zip(keys, self._read_entries(keys)):
+            rollup.apply(entries)
+        if keys:
+            rollup.watermark = max([keys[-1], rollup.watermark or ""])
+
+    # ---------- incremental update ----------
+    def refresh(self) -> DashboardRollup:
+        """Fold log objects written since the watermark into the rollup"""
+        with self._lock:
+            rollup = self.load()
+            if rollup.watermark is None and rollup.total_predictions == 0:
+                # Nenhum rollup ainda: percorre tudo uma vez
+                return self._rebuild_locked()
+
+            start_after = None
+            wm_time = key_timestamp(rollup.watermark or "", self.prefix)
+            if wm_time is not None:
+                start_after = f"{self.prefix}{wm_time - timedelta(seconds=ROLLUP_LAG_SECONDS):%Y/%m/%d/%H%M%S}"
+
+            seen = set(rollup.recent_keys)
+            new_keys = [
+                obj["Key"] for obj in self.store.list(self.prefix, start_after=start_after)
+                if self._is_log_key(obj["Key"]) and obj["Key"] not in seen
+                and obj["Key"] != rollup.watermark
+            ]
+            if not new_keys:
+                return rollup
+
+            self._apply_keys(rollup, new_keys)
+            self._trim_recent_keys(rollup, new_keys)
+            self.save(rollup)
+            return rollup
+
+    def _trim_recent_keys(self, rollup: DashboardRollup, new_keys: List[str]) -> None:
+        wm_time = key_timestamp(rollup.watermark or "", self.prefix)
+        if wm_time is None:
+            rollup.recent_keys = []
+            return
+        cutoff = f"{self.prefix}{wm_time - timedelta(seconds=ROLLUP_LAG_SECONDS):%Y/%m/%d/%H%M%S}"
+        rollup.recent_keys = sorted(k for k in set(rollup.recent_keys) | set(new_keys) if k >= cutoff)
+
+    # ---------- full rebuild ----------
+    def rebuild(self, chunk_size: int = 500) -> DashboardRollup:
+        """
+        Recompute the rollup from every log object
+
+        Lists all pages and reads objects in parallel. Progress is saved to
+        ``<rollup_key>.rebuild`` every ``chunk_size`` objects, so an
+        interrupted rebuild resumes where it stopped.
+        """
+        with self._lock:
+            return self._rebuild_locked(chunk_size)
+
+    def _rebuild_locked(self, chunk_size: int = 500) -> DashboardRollup:
+        checkpoint_key = f"{self.rollup_key}.rebuild"
+        rollup = self.load(checkpoint_key)
+        if rollup.watermark:
+            print(f"🔁 Retomando rebuild a partir de {rollup.watermark}")
+
+        chunk: List[str] = []
+        for obj in self.store.list(self.prefix, start_after=rollup.watermark):
+            if not self._is_log_key(obj["Key"]):
+                continue
+            chunk.append(obj["Key"])
+            if len(chunk) >= chunk_size:
+                self._apply_keys(rollup, chunk)
+                self.save(rollup, checkpoint_key)
+                print(f"💾 Checkpoint: {rollup.total_predictions} logs até {rollup.watermark}")
+                chunk = []
+        self._apply_keys(rollup, chunk)
+
+        wm_time = key_timestamp(rollup.watermark or "", self.prefix)
+        if wm_time is not None:
+            cutoff = f"{self.prefix}{wm_time - timedelta(seconds=ROLLUP_LAG_SECONDS):%Y/%m/%d/%H%M%S}"
+            rollup.recent_keys = [
+                obj["Key"] for obj in self.store.list(self.prefix, start_after=cutoff)
+                if self._is_log_key(obj["Key"]) and obj["Key"] <= rollup.watermark
+            ]
+
+        self.save(rollup)
+        # Checkpoint vazio marca o rebuild como concluído
+        self.save(DashboardRollup(), checkpoint_key)
+        return rollup
+
+
+_rollup_index: Optional[RollupIndex] = None
+
+
+def get_rollup_index() -> RollupIndex:
+    """Process-wide index over the configured log store (raises ValueError if unconfigured)"""
+    global _rollup_index
+    if _rollup_index is None:
+        _rollup_index = RollupIndex(get_object_store(), os.getenv("S3_LOG_PREFIX", "logs/"))
+    return _rollup_index
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintain the dashboard rollup of prediction logs")
+    parser.add_argument("command", choices=["refresh", "rebuild"])
+    parser.add_argument("--workers", type=int, default=16, help="Parallel object reads")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Objects per checkpoint")
+    args = parser.parse_args()
+
+    index = get_rollup_index()
+    index.workers = args.workers
+    if args.command == "rebuild":
+        rollup = index.rebuild(chunk_size=args.chunk_size)
+    else:
+        rollup = index.refresh()
+    print(f"✅ Rollup com {rollup.total_predictions} logs (watermark: {rollup.watermark})")
+
+
+if __name__ == "__main__":
+    main()
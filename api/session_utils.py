@@ -0,0 +1,161 @@
+"""
+Per-ticker rolling windows for incremental next-day predictions
+
+A session keeps the last ``SEQUENCE_LENGTH`` closes of a ticker in a
+float32 ring buffer, plus the min/max the window is scaled with. Appending
+new closes updates both in place, so a poll costs one 50-step forward pass
+instead of a full download, rescale and evaluation.
+
+With several uvicorn workers the sessions must live in the shared SQLite
+store (``SESSION_STORE_BACKEND=sqlite``); the in-memory default only
+works with a single worker.
+"""
+
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+
+from .cache_utils import LRUCache, SQLiteCache
+
+
+SEQUENCE_LENGTH = 50
+
+
+class TickerSession:
+    """Ring buffer of the latest closes and the scaling range of one ticker"""
+
+    __slots__ = ("ticker", "buffer", "pos", "data_min", "data_max", "closes_seen", "next_price", "updated_at")
+
+    def __init__(self, ticker: str, closes: Iterable[float]):
+        closes = np.asarray(closes, dtype=np.float32).ravel()
+        if len(closes) < SEQUENCE_LENGTH:
+            raise ValueError(f"Dados insuficientes para a sessão (mínimo {SEQUENCE_LENGTH} dias)")
+        self.ticker = ticker
+        self.buffer = closes[-SEQUENCE_LENGTH:].copy()
+        self.pos = 0
+        # Mesmo intervalo que o MinMaxScaler ajustado sobre todo o histórico
+        self.data_min = float(closes.min())
+        self.data_max = float(closes.max())
+        self.closes_seen = len(closes)
+        self.next_price: Optional[float] = None
+        self.updated_at = time.time()
+
+    def append(self, closes: Iterable[float]) -> None:
+        for close in np.asarray(closes, dtype=np.float32).ravel():
+            self.buffer[self.pos] = close
+            self.pos = (self.pos + 1) % SEQUENCE_LENGTH
+            self.data_min = min(self.data_min, float(close))
+            self.data_max = max(self.data_max, float(close))
+            self.closes_seen += 1
+        self.updated_at = time.time()
+
+    @property
+    def last_close(self) -> float:
+        return float(self.buffer[self.pos - 1])
+
+    def window(self) -> np.ndarray:
+        """Closes in chronological order"""
+        return np.concatenate((self.buffer[self.pos:], self.buffer[:self.pos]))
+
+    def predict(self, model) -> float:
+        """Next-day price from one forward pass over the current window"""
+        import torch
+
+        span = (self.data_max - self.data_min) or 1.0
+        scaled = (self.window() - self.data_min) / span
+        x = torch.from_numpy(scaled.astype(np.float32)).view(1, SEQUENCE_LENGTH, 1)
+        with torch.no_grad():
+            pred_scaled = float(model(x).reshape(-1)[0])
+        self.next_price = pred_scaled * span + self.data_min
+        return self.next_price
+
+    def to_dict(self) -> Dict[str, Any]:
+        last_close = self.last_close
+        next_price = round(self.next_price, 2) if self.next_price is not None else None
+        price_change = round(self.next_price - last_close, 2) if self.next_price is not None else None
+        return {
+            "ticker": self.ticker,
+            "last_close": round(last_close, 2),
+            "next_price": next_price,
+            "price_change": price_change,
+            "price_change_pct": round(price_change / last_close * 100, 2) if price_change is not None else None,
+            "window": [round(float(c), 4) for c in self.window()],
+            "data_min": self.data_min,
+            "data_max": self.data_max,
+            "closes_seen": self.closes_seen,
+            "updated_at": self.updated_at
+        }
+
+
+class SessionStore:
+    """
+    LRU store of ``TickerSession`` objects keyed by ticker
+
+    In memory by default, or in a SQLite file at ``path`` shared by every
+    worker process. Appends and predictions on a session are serialized by
+    a store-wide lock (plus a file lock with SQLite, across processes);
+    they are a single small forward pass each.
+    """
+
+    def __init__(self, maxsize: int = 10000, path: Optional[str] = None):
+        self.sessions = SQLiteCache(path, maxsize) if path else LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._lock_path = f"{path}.lock" if path else None
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if self._lock_path is None:
+                yield
+                return
+            with open(self._lock_path, "w") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                yield
+
+    def create(self, ticker: str, closes: Iterable[float], model) -> TickerSession:
+        session = TickerSession(ticker, closes)
+        session.predict(model)
+        self.sessions.set(ticker, session)
+        return session
+
+    def get(self, ticker: str) -> Optional[TickerSession]:
+        return self.sessions.get(ticker)
+
+    def append(self, ticker: str, closes: Iterable[float], model) -> TickerSession:
+        with self._locked():
+            session = self.sessions.get(ticker)
+            if session is None:
+                raise KeyError(ticker)
+            session.append(closes)
+            session.predict(model)
+            # SQLite devolve uma cópia: grava o estado novo de volta
+            self.sessions.set(ticker, session)
+        return session
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+
+_session_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    """
+    Session store selected by ``SESSION_STORE_BACKEND``
+
+    - memory (default): per-process LRU, single uvicorn worker only
+    - sqlite: file at ``SESSION_STORE_PATH`` shared by all workers
+    """
+    global _session_store
+    if _session_store is None:
+        maxsize = int(os.getenv("SESSION_STORE_SIZE", "10000"))
+        if os.getenv("SESSION_STORE_BACKEND", "memory").lower() == "sqlite":
+            _session_store = SessionStore(maxsize, os.getenv("SESSION_STORE_PATH", "/app/cache/sessions.sqlite"))
+        else:
+            _session_store = SessionStore(maxsize)
+    return _session_store
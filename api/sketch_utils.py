@@ -0,0 +1,316 @@
+"""
+Mergeable streaming statistics for the prediction logs
+
+- HyperLogLog: approximate count of distinct tickers
+- DDSketch: quantiles with bounded relative error (latency, R²)
+- LogStats: exact counters plus the sketches above, updated per entry
+
+Every structure is serializable to JSON and can be merged with another
+instance, so per-process statistics add up across workers and replicas.
+"""
+
+import base64
+import hashlib
+import math
+from typing import Any, Dict, Iterable, Optional
+
+
+class HyperLogLog:
+    """HyperLogLog cardinality sketch (``2**p`` one-byte registers)"""
+
+    def __init__(self, p: int = 12, registers: Optional[bytearray] = None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = registers if registers is not None else bytearray(self.m)
+
+    def add(self, value: str) -> None:
+        h = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # Correção para cardinalidades pequenas (linear counting)
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"p": self.p, "registers": base64.b64encode(bytes(self.registers)).decode()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HyperLogLog":
+        return cls(data["p"], bytearray(base64.b64decode(data["registers"])))
+
+
+class DDSketch:
+    """
+    DDSketch quantile sketch with ``relative_accuracy`` error bound
+
+    Values are counted in logarithmic buckets; negative values (e.g. R²
+    of a bad fit) go to a mirrored store.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _key(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, key: int) -> float:
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value: float) -> None:
+        if value is None or math.isnan(value):
+            return
+        if value > 1e-9:
+            key = self._key(value)
+            self.positive[key] = self.positive.get(key, 0) + 1
+        elif value < -1e-9:
+            key = self._key(-value)
+            self.negative[key] = self.negative.get(key, 0) + 1
+        else:
+            self.zero_count += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return min(self._value(key), self.max)
+        return self.max
+
+    def merge(self, other: "DDSketch") -> None:
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge DDSketches with different accuracy")
+        for key, n in other.positive.items():
+            self.positive[key] = self.positive.get(key, 0) + n
+        for key, n in other.negative.items():
+            self.negative[key] = self.negative.get(key, 0) + n
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def summary(self, digits: int = 4) -> Dict[str, Optional[float]]:
+        def r(value):
+            return None if value is None else round(value, digits)
+
+        return {
+            "count": self.count,
+            "mean": r(self.sum / self.count) if self.count else None,
+            "min": r(self.min) if self.count else None,
+            "max": r(self.max) if self.count else None,
+            "p50": r(self.quantile(0.50)),
+            "p95": r(self.quantile(0.95)),
+            "p99": r(self.quantile(0.99))
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "positive": {str(k): v for k, v in self.positive.items()},
+            "negative": {str(k): v for k, v in self.negative.items()},
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DDSketch":
+        sketch = cls(data["relative_accuracy"])
+        sketch.positive = {int(k): v for k, v in data["positive"].items()}
+        sketch.negative = {int(k): v for k, v in data["negative"].items()}
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.sum = data["sum"]
+        if sketch.count:
+            sketch.min = data["min"]
+            sketch.max = data["max"]
+        return sketch
+
+
+class LogStats:
+    """Counters and sketches summarizing prediction log entries"""
+
+    # Acima disso a lista exata de tickers é abandonada e só o HLL responde
+    MAX_EXACT_TICKERS = 2000
+
+    def __init__(self):
+        self.total_predictions = 0
+        self.successful = 0
+        self.failed = 0
+        self.tickers = HyperLogLog()
+        self.ticker_names: Optional[set] = set()
+        self.execution_time = DDSketch()
+        self.r2 = DDSketch()
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        self.total_predictions += 1
+        execution = entry.get("execution", {})
+        if execution.get("success"):
+            self.successful += 1
+            r2 = (entry.get("result") or {}).get("metrics", {}).get("R2")
+            if r2 is not None:
+                self.r2.add(float(r2))
+        else:
+            self.failed += 1
+
+        ticker = entry.get("request", {}).get("ticker")
+        if ticker:
+            self.tickers.add(ticker)
+            if self.ticker_names is not None:
+                self.ticker_names.add(ticker)
+                if len(self.ticker_names) > self.MAX_EXACT_TICKERS:
+                    self.ticker_names = None
+
+        duration = execution.get("duration_seconds")
+        if duration is not None:
+            self.execution_time.add(float(duration))
+
+    def add_all(self, entries: Iterable[Dict[str, Any]]) -> None:
+        for entry in entries:
+            self.add(entry)
+
+    def merge(self, other: "LogStats") -> None:
+        self.total_predictions += other.total_predictions
+        self.successful += other.successful
+        self.failed += other.failed
+        self.tickers.merge(other.tickers)
+        if self.ticker_names is None or other.ticker_names is None:
+            self.ticker_names = None
+        else:
+            self.ticker_names |= other.ticker_names
+            if len(self.ticker_names) > self.MAX_EXACT_TICKERS:
+                self.ticker_names = None
+        self.execution_time.merge(other.execution_time)
+        self.r2.merge(other.r2)
+
+    def summary(self) -> Dict[str, Any]:
+        exact = self.ticker_names is not None
+        return {
+            "total_predictions": self.total_predictions,
+            "successful": self.successful,
+            "failed": self.failed,
+            "unique_tickers": len(self.ticker_names) if exact else self.tickers.count(),
+            "unique_tickers_exact": exact,
+            "tickers": sorted(self.ticker_names) if exact else [],
+            "execution_time_seconds": self.execution_time.summary(digits=3),
+            "r2": self.r2.summary(digits=4)
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total_predictions": self.total_predictions,
+            "successful": self.successful,
+            "failed": self.failed,
+            "tickers": self.tickers.to_dict(),
+            "ticker_names": sorted(self.ticker_names) if self.ticker_names is not None else None,
+            "execution_time": self.execution_time.to_dict(),
+            "r2": self.r2.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LogStats":
+        stats = cls()
+        stats.total_predictions = data["total_predictions"]
+        stats.successful = data["successful"]
+        stats.failed = data["failed"]
+        stats.tickers = HyperLogLog.from_dict(data["tickers"])
+        names = data.get("ticker_names")
+        stats.ticker_names = set(names) if names is not None else None
+        stats.execution_time = DDSketch.from_dict(data["execution_time"])
+        stats.r2 = DDSketch.from_dict(data["r2"])
+        return stats
+
+
+def main():
+    """
+    Seed ``stats/seed.json`` from the logs already in the store (one-off migration)
+
+    Workers count the logs they write in their own ``stats/<instance>.json``,
+    so once they run, only logs older than them may be folded into the seed:
+    pass ``--before`` with the time the stats writer was deployed.
+    """
+    import argparse
+    import json
+    import os
+    from datetime import datetime, timezone
+
+    from .storage_utils import decode_log_object, get_object_store
+
+    parser = argparse.ArgumentParser(description="Build log statistics from existing log objects")
+    parser.add_argument("command", choices=["seed"])
+    parser.add_argument(
+        "--before",
+        help="Only fold logs written before this ISO timestamp (UTC), i.e. before the stats writer was deployed"
+    )
+    args = parser.parse_args()
+
+    store = get_object_store()
+    prefix = os.getenv("S3_LOG_PREFIX", "logs/")
+    stats_prefix = os.getenv("STATS_PREFIX", "stats/")
+    seed_key = f"{stats_prefix}seed.json"
+
+    before = None
+    if args.before:
+        before = datetime.fromisoformat(args.before.replace("Z", "+00:00"))
+        if before.tzinfo is None:
+            before = before.replace(tzinfo=timezone.utc)
+    else:
+        instances = [obj["Key"] for obj in store.list(stats_prefix) if obj["Key"] != seed_key]
+        if instances:
+            print(f"❌ {len(instances)} arquivos de estatísticas de workers em {store.uri(stats_prefix)}: "
+                  "os logs deles já estão contados. Informe --before com o horário do deploy.")
+            raise SystemExit(1)
+
+    stats = LogStats()
+    for obj in store.list(prefix):
+        if before is not None and obj["LastModified"] >= before:
+            continue
+        try:
+            stats.add_all(decode_log_object(obj["Key"], store.get(obj["Key"])))
+        except Exception as e:
+            print(f"⚠️  Failed to parse log {obj['Key']}: {e}")
+    store.put(seed_key, json.dumps(stats.to_dict()).encode("utf-8"))
+    print(f"✅ {stats.total_predictions} logs resumidos em {store.uri(seed_key)}")
+
+
+if __name__ == "__main__":
+    main()
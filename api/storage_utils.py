@@ -0,0 +1,132 @@
+import gzip
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class S3ObjectStore:
+    """Object store backed by an S3 bucket (or an S3-compatible endpoint)"""
+
+    def __init__(self, bucket: str, client=None):
+        self.bucket = bucket
+        self._client = client
+
+    @property
+    def client(self):
+        # boto3 é pesado para importar: o cliente só é criado no primeiro acesso
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client(
+                's3',
+                aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+                region_name=os.getenv("AWS_REGION", "us-east-1"),
+                endpoint_url=os.getenv("S3_ENDPOINT_URL") or None
+            )
+        return self._client
+
+    def uri(self, key: str) -> str:
+        return f"s3://{self.bucket}/{key}"
+
+    def put(self, key: str, body: bytes, content_type: str = "application/json") -> None:
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType=content_type)
+
+    def get(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+    def list(self, prefix: str, start_after: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Yield ``{"Key", "LastModified", "Size"}`` for every object, across all pages"""
+        params = {"Bucket": self.bucket, "Prefix": prefix}
+        if start_after:
+            params["StartAfter"] = start_after
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(**params):
+            for obj in page.get('Contents', []):
+                yield obj
+
+
+class LocalObjectStore:
+    """
+    Filesystem stand-in for S3, used for local runs and tests
+
+    Keys map to paths under ``root``; listing is lexicographic like S3.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def uri(self, key: str) -> str:
+        return f"file://{self.root / key}"
+
+    def put(self, key: str, body: bytes, content_type: str = "application/json") -> None:
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(body)
+        os.replace(tmp_path, path)
+
+    def get(self, key: str) -> bytes:
+        return (self.root / key).read_bytes()
+
+    def list(self, prefix: str, start_after: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        if not self.root.exists():
+            return
+        keys = []
+        for path in self.root.rglob("*"):
+            if not path.is_file() or path.name.startswith("."):
+                continue
+            key = path.relative_to(self.root).as_posix()
+            if key.startswith(prefix) and (start_after is None or key > start_after):
+                keys.append((key, path))
+        for key, path in sorted(keys):
+            stat = path.stat()
+            yield {
+                "Key": key,
+                "LastModified": datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+                "Size": stat.st_size
+            }
+
+
+def get_object_store():
+    """
+    Build the log store from the environment
+
+    - LOG_BACKEND: ``s3`` (default) or ``file``
+    - S3_BUCKET_NAME: bucket used by the s3 backend
+    - LOG_STORE_DIR: root directory used by the file backend
+    """
+    backend = os.getenv("LOG_BACKEND", "s3").lower()
+    if backend == "file":
+        return LocalObjectStore(os.getenv("LOG_STORE_DIR", "/app/cache/log-store"))
+
+    bucket = os.getenv("S3_BUCKET_NAME")
+    if not bucket:
+        raise ValueError(
+            "S3_BUCKET_NAME environment variable is required. "
+            "Please configure it before running the application."
+        )
+    return S3ObjectStore(bucket)
+
+
+def encode_log_batch(entries: List[Dict[str, Any]], encoder=None) -> bytes:
+    """Serialize log entries as gzip-compressed JSON Lines"""
+    lines = "\n".join(json.dumps(e, ensure_ascii=False, cls=encoder) for e in entries)
+    return gzip.compress(lines.encode("utf-8"))
+
+
+def decode_log_object(key: str, body: bytes) -> List[Dict[str, Any]]:
+    """
+    Parse a log object into its entries
+
+    Supports both the batched ``.jsonl.gz`` format and the legacy
+    one-entry-per-object ``.json`` files.
+    """
+    if key.endswith(".gz"):
+        body = gzip.decompress(body)
+    text = body.decode("utf-8")
+    if key.endswith(".json"):
+        return [json.loads(text)]
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
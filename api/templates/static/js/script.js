@@ -43,9 +43,15 @@ async function handlePredict() {
     resultsPanel.classList.add('active');
     loading.classList.add('active');
     resultsContent.style.display = 'none';
+    setLoadingText('⏳ Baixando dados...');
+
+    // Série recebida até agora, desenhada na prévia
+    const state = { yTrue: [], yPred: [] };
+    resetPlot();
 
     try {
-        const response = await fetch('/api/predict', {
+        // Resposta em NDJSON: etapas, próximo preço, série em blocos, métricas e o resultado final
+        const response = await fetch('/api/predict/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -53,7 +59,8 @@ async function handlePredict() {
             body: JSON.stringify({
                 ticker,
                 start_date,
-                end_date
+                end_date,
+                include_plot: false
             })
         });
 
@@ -62,11 +69,9 @@ async function handlePredict() {
             throw new Error(error.detail || 'Erro ao fazer previsão');
         }
 
-        const data = await response.json();
-        displayResults(data);
+        await readEvents(response, (event) => handleEvent(event, state));
 
         loading.classList.remove('active');
-        resultsContent.style.display = 'block';
         successMsg.textContent = '✅ Previsão concluída com sucesso!';
         successMsg.classList.add('active');
 
@@ -77,8 +82,109 @@ async function handlePredict() {
     }
 }
 
-function displayResults(data) {
-    // Update metric cards
+const STAGE_LABELS = {
+    download: '📥 Dados baixados',
+    cache: '⚡ Resultado em cache',
+    scaling: '📏 Dados normalizados',
+    windowing: '🪟 Janelas montadas',
+    inference: '🧠 Inferência concluída'
+};
+
+async function readEvents(response, onEvent) {
+    // Um evento JSON por linha; a última linha pode chegar incompleta
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        for (const line of lines) {
+            if (line.trim()) onEvent(JSON.parse(line));
+        }
+    }
+    if (buffer.trim()) onEvent(JSON.parse(buffer));
+}
+
+function handleEvent(event, state) {
+    switch (event.event) {
+        case 'stage':
+            setLoadingText(`${STAGE_LABELS[event.stage] || event.stage} (${event.elapsed.toFixed(1)}s)...`);
+            break;
+        case 'next_price':
+            displayPrices(event);
+            document.getElementById('resultsContent').style.display = 'block';
+            break;
+        case 'series':
+            state.yTrue.push(...event.y_true);
+            state.yPred.push(...event.y_pred);
+            setLoadingText(`🧠 Prevendo... ${state.yPred.length} dias`);
+            drawPreview(state.yTrue, state.yPred);
+            break;
+        case 'metrics':
+            displayMetrics(event.metrics, event.data_points);
+            break;
+        case 'result':
+            displayResults(event.result);
+            // Gráfico renderizado sob demanda pelo /api/plot/{id}; a prévia fica até ele carregar
+            showPlot(event.result.plot_url);
+            break;
+        case 'error':
+            throw new Error(event.detail || 'Erro ao fazer previsão');
+    }
+}
+
+function setLoadingText(text) {
+    document.getElementById('loadingText').textContent = text;
+}
+
+function resetPlot() {
+    const canvas = document.getElementById('previewCanvas');
+    canvas.getContext('2d').clearRect(0, 0, canvas.width, canvas.height);
+    canvas.style.display = 'inline-block';
+    const plotImage = document.getElementById('plotImage');
+    plotImage.onload = null;
+    plotImage.style.display = 'none';
+    plotImage.src = '';
+}
+
+function showPlot(src) {
+    const plotImage = document.getElementById('plotImage');
+    plotImage.onload = () => {
+        plotImage.style.display = 'inline-block';
+        document.getElementById('previewCanvas').style.display = 'none';
+    };
+    plotImage.src = src;
+}
+
+function drawPreview(yTrue, yPred) {
+    // Mesmas cores do gráfico final (Preço Real / Preço Previsto)
+    const canvas = document.getElementById('previewCanvas');
+    const ctx = canvas.getContext('2d');
+    const pad = 40;
+    let low = Infinity;
+    let high = -Infinity;
+    for (const v of yTrue.concat(yPred)) {
+        low = Math.min(low, v);
+        high = Math.max(high, v);
+    }
+    const x = (i) => pad + (i / Math.max(yTrue.length - 1, 1)) * (canvas.width - 2 * pad);
+    const y = (v) => canvas.height - pad - ((v - low) / ((high - low) || 1)) * (canvas.height - 2 * pad);
+
+    ctx.clearRect(0, 0, canvas.width, canvas.height);
+    ctx.lineWidth = 2.5;
+    for (const [values, color] of [[yTrue, '#1f77b4'], [yPred, '#ff7f0e']]) {
+        ctx.strokeStyle = color;
+        ctx.beginPath();
+        values.forEach((v, i) => (i ? ctx.lineTo(x(i), y(v)) : ctx.moveTo(x(i), y(v))));
+        ctx.stroke();
+    }
+}
+
+function displayPrices(data) {
     document.getElementById('lastClose').textContent = `R$ ${data.last_close.toFixed(2)}`;
     document.getElementById('nextPrice').textContent = `R$ ${data.next_price.toFixed(2)}`;
     
@@ -87,17 +193,22 @@ function displayResults(data) {
     const changePct = data.price_change_pct;
     priceChangeDiv.textContent = `R$ ${change.toFixed(2)} (${changePct.toFixed(2)}%)`;
     priceChangeDiv.classList.toggle('negative', change < 0);
-    
-    document.getElementById('dataPoints').textContent = data.data_points;
-    document.getElementById('r2Score').textContent = data.metrics.R2.toFixed(4);
+}
+
+function displayMetrics(metrics, dataPoints) {
+    document.getElementById('dataPoints').textContent = dataPoints;
+    document.getElementById('r2Score').textContent = metrics.R2.toFixed(4);
 
     // Update detailed metrics
-    document.getElementById('mse').textContent = data.metrics.MSE.toFixed(6);
-    document.getElementById('mae').textContent = data.metrics.MAE.toFixed(6);
-    document.getElementById('rmse').textContent = data.metrics.RMSE.toFixed(6);
+    document.getElementById('mse').textContent = metrics.MSE.toFixed(6);
+    document.getElementById('mae').textContent = metrics.MAE.toFixed(6);
+    document.getElementById('rmse').textContent = metrics.RMSE.toFixed(6);
+}
 
-    // Update plot
-    document.getElementById('plotImage').src = data.plot;
+function displayResults(data) {
+    // Update metric cards
+    displayPrices(data);
+    displayMetrics(data.metrics, data.data_points);
 
     // Update summary text
     const summaryHTML = `
@@ -0,0 +1,429 @@
+"""
+Replay recorded traffic against the API to size the service
+
+Requests come from prediction logs (``PredictionLogger`` entries, plain or
+``.jsonl.gz``, files, directories or the configured log store) or from
+generic JSONL records ``{"method", "path", "body", "timestamp"}``. Prices
+are served by a ``FixturePriceProvider`` with a synthetic series per
+ticker, so nothing touches the network.
+
+Pacing (in-flight requests are always capped by ``--concurrency``):
+
+- default: closed loop, next request as soon as a slot frees up
+- ``--rate R``: open loop at R requests/second
+- ``--speedup X``: recorded timestamps, X times faster
+
+In open loop, latency is measured from the scheduled send time, so time
+spent waiting for a slot counts (no coordinated omission).
+
+Targets: the app in-process (default), a running server (``--url``), or
+``--workers-sweep 1,2,4`` to start uvicorn with each worker count and
+compare throughput and p99.
+
+Uso:
+    python -m benchmarks.replay logs/ --concurrency 16
+    python -m benchmarks.replay --from-store --speedup 60 --out replay.json
+    python -m benchmarks.replay traffic.jsonl --rate 20 --url http://localhost:8000
+    python -m benchmarks.replay logs/ --rate 50 --workers-sweep 1,2,4,8 --p99-budget 2.0
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class ReplayRequest:
+    __slots__ = ("method", "path", "body", "timestamp")
+
+    def __init__(self, method: str, path: str, body: Optional[Dict[str, Any]], timestamp: Optional[float]):
+        self.method = method
+        self.path = path
+        self.body = body
+        self.timestamp = timestamp
+
+    @property
+    def endpoint(self) -> str:
+        return f"{self.method} {self.path.split('?')[0]}"
+
+    def tickers(self) -> List[str]:
+        body = self.body or {}
+        return [t.upper() for t in body.get("tickers", [])] + ([body["ticker"].upper()] if "ticker" in body else [])
+
+
+# ==================== TRAFFIC ====================
+def parse_timestamp(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def to_request(record: Dict[str, Any], include_plot: bool) -> Optional[ReplayRequest]:
+    """Logger entry or generic record -> request (``None`` when unrecognized)"""
+    timestamp = parse_timestamp(record.get("timestamp"))
+    if "path" in record:
+        return ReplayRequest(record.get("method", "GET").upper(), record["path"], record.get("body"), timestamp)
+    request = record.get("request")
+    if isinstance(request, dict) and request.get("ticker"):
+        body = {
+            "ticker": request["ticker"],
+            "start_date": request["start_date"],
+            "end_date": request["end_date"],
+            "include_plot": include_plot
+        }
+        return ReplayRequest("POST", "/api/predict", body, timestamp)
+    return None
+
+
+def read_records(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    from api.storage_utils import decode_log_object
+
+    for source in paths:
+        source_path = Path(source)
+        files = sorted(p for p in source_path.rglob("*.json*") if p.is_file()) if source_path.is_dir() else [source_path]
+        for path in files:
+            try:
+                yield from decode_log_object(path.name, path.read_bytes())
+            except (OSError, ValueError, gzip.BadGzipFile) as e:
+                print(f"⚠️  Ignorando {path}: {e}")
+
+
+def read_store_records() -> Iterator[Dict[str, Any]]:
+    """Every entry in the log store configured by LOG_BACKEND / S3_LOG_PREFIX"""
+    from api.storage_utils import decode_log_object, get_object_store
+
+    store = get_object_store()
+    prefix = os.getenv("S3_LOG_PREFIX", "logs/")
+    for obj in store.list(prefix):
+        yield from decode_log_object(obj["Key"], store.get(obj["Key"]))
+
+
+def load_traffic(records: Iterable[Dict[str, Any]], include_plot: bool, limit: Optional[int] = None) -> List[ReplayRequest]:
+    requests = [r for r in (to_request(rec, include_plot) for rec in records) if r is not None]
+    # Logs são gravados em lotes: a ordem do replay segue o horário das requisições
+    requests.sort(key=lambda r: r.timestamp if r.timestamp is not None else float("inf"))
+    return requests[:limit] if limit else requests
+
+
+def repeat_traffic(requests: List[ReplayRequest], times: int) -> List[ReplayRequest]:
+    """
+    ``requests`` replayed ``times`` times back to back
+
+    Each pass is shifted by the span of the trace plus one mean
+    inter-arrival gap, so ``--speedup`` keeps the recorded shape on every
+    pass instead of firing the repeats all at once.
+    """
+    stamps = [r.timestamp for r in requests if r.timestamp is not None]
+    span = stamps[-1] - stamps[0] if stamps else 0.0
+    period = span + span / max(len(stamps) - 1, 1)
+    repeated = []
+    for i in range(times):
+        shift = i * period
+        repeated.extend(
+            ReplayRequest(r.method, r.path, r.body, r.timestamp + shift if r.timestamp is not None else None)
+            for r in requests
+        )
+    return repeated
+
+
+# ==================== STUB PRICES ====================
+def synthetic_series(tickers: Iterable[str]):
+    """Deterministic random-walk closes (2000 until today) for every ticker"""
+    import pandas as pd
+
+    index = pd.bdate_range("2000-01-01", pd.Timestamp.today().normalize(), name="Date")
+    series = {}
+    for ticker in sorted(set(tickers)):
+        rng = np.random.default_rng(zlib.crc32(ticker.encode()))
+        closes = 50 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, len(index))))
+        series[ticker] = pd.Series(closes, index=index, name="Close")
+    return series
+
+
+def install_stub_prices(tickers: Iterable[str]) -> None:
+    """In-process: serve ``tickers`` from a fixture provider and an empty cache"""
+    from api.price_utils import FixturePriceProvider, PriceCache, configure_price_cache
+
+    provider = FixturePriceProvider(series=synthetic_series(tickers))
+    configure_price_cache(PriceCache(tempfile.mkdtemp(prefix="replay-prices-"), provider))
+
+
+def write_fixture_dir(tickers: Iterable[str]) -> str:
+    """Out of process: ``<dir>/<TICKER>.csv`` files for PRICE_PROVIDER=fixture"""
+    directory = tempfile.mkdtemp(prefix="replay-fixtures-")
+    for ticker, close in synthetic_series(tickers).items():
+        close.to_frame().to_csv(Path(directory) / f"{ticker}.csv")
+    return directory
+
+
+# ==================== REPLAY ====================
+async def replay(
+    requests: List[ReplayRequest],
+    send: Callable,
+    concurrency: int,
+    rate: Optional[float] = None,
+    speedup: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Send ``requests`` through ``send(request) -> status``
+
+    Returns the raw samples ``[(endpoint, status, seconds)]`` and the wall time.
+    """
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(concurrency)
+    samples = []
+    first_ts = next((r.timestamp for r in requests if r.timestamp is not None), None)
+    open_loop = bool(rate) or bool(speedup)
+
+    async def one(request: ReplayRequest, scheduled: float):
+        if open_loop:
+            await slots.acquire()
+        start = scheduled if open_loop else loop.time()
+        try:
+            status = await send(request)
+        except Exception:
+            status = 0  # conexão recusada, timeout...
+        finally:
+            slots.release()
+        samples.append((request.endpoint, status, loop.time() - start))
+
+    started = loop.time()
+    tasks = []
+    for i, request in enumerate(requests):
+        if rate:
+            offset = i / rate
+        elif speedup and first_ts is not None and request.timestamp is not None:
+            offset = (request.timestamp - first_ts) / speedup
+        else:
+            offset = 0.0
+        delay = started + offset - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if not open_loop:
+            # Loop fechado: a vaga é reservada antes de criar a tarefa
+            await slots.acquire()
+        tasks.append(asyncio.create_task(one(request, started + offset)))
+    await asyncio.gather(*tasks)
+    return {"samples": samples, "seconds": loop.time() - started}
+
+
+def summarize(samples: List[tuple], seconds: float) -> Dict[str, Any]:
+    """Throughput, latency percentiles and errors per endpoint (and ``ALL``)"""
+    groups: Dict[str, List[tuple]] = {}
+    for sample in samples:
+        groups.setdefault(sample[0], []).append(sample)
+    groups["ALL"] = samples
+
+    report = {}
+    for endpoint, group in groups.items():
+        latency = np.array([s[2] for s in group])
+        statuses: Dict[str, int] = {}
+        for _, status, _ in group:
+            if not 200 <= status < 400:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+        errors = sum(statuses.values())
+        report[endpoint] = {
+            "requests": len(group),
+            "throughput_rps": round(len(group) / seconds, 2) if seconds else None,
+            "p50_s": round(float(np.percentile(latency, 50)), 4) if len(latency) else None,
+            "p95_s": round(float(np.percentile(latency, 95)), 4) if len(latency) else None,
+            "p99_s": round(float(np.percentile(latency, 99)), 4) if len(latency) else None,
+            "max_s": round(float(latency.max()), 4) if len(latency) else None,
+            "errors": errors,
+            "error_rate": round(errors / len(group), 4) if group else 0.0,
+            "statuses": statuses
+        }
+    return report
+
+
+def print_report(report: Dict[str, Any], title: str) -> None:
+    print(f"\n{title}")
+    print(f"  {'endpoint':32} {'req':>6} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'erros':>7}")
+    for endpoint, r in report.items():
+        print(
+            f"  {endpoint:32} {r['requests']:6d} {r['throughput_rps']:8.2f} {r['p50_s']:8.3f} "
+            f"{r['p95_s']:8.3f} {r['p99_s']:8.3f} {r['error_rate']:7.1%}"
+        )
+
+
+# ==================== TARGETS ====================
+async def run_in_process(requests: List[ReplayRequest], args) -> Dict[str, Any]:
+    """Replay against ``api.app`` through an ASGI transport (lifespan included)"""
+    import httpx
+
+    if args.no_result_cache:
+        os.environ["RESULT_CACHE_BACKEND"] = "none"
+    # Logs do replay não vão para o store de produção
+    scratch = tempfile.mkdtemp(prefix="replay-")
+    for name, value in (("LOG_BACKEND", "file"), ("LOG_STORE_DIR", f"{scratch}/logs"), ("LOG_SPOOL_DIR", f"{scratch}/spool")):
+        os.environ.setdefault(name, value)
+    install_stub_prices(t for r in requests for t in r.tickers())
+    from api.app import app, registry
+
+    async with app.router.lifespan_context(app):
+        while registry.state == "loading":
+            await asyncio.sleep(0.2)
+        if registry.state != "ready":
+            raise SystemExit(f"❌ Modelo não carregou: {registry.error}")
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=args.timeout) as client:
+            return await replay_with_client(client, requests, args)
+
+
+async def replay_with_client(client, requests: List[ReplayRequest], args) -> Dict[str, Any]:
+    async def send(request: ReplayRequest) -> int:
+        response = await client.request(request.method, request.path, json=request.body)
+        return response.status_code
+
+    return await replay(requests, send, args.concurrency, args.rate, args.speedup)
+
+
+async def run_against_url(requests: List[ReplayRequest], args, url: str) -> Dict[str, Any]:
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        return await replay_with_client(client, requests, args)
+
+
+def start_server(workers: int, port: int, fixture_dir: str, no_result_cache: bool) -> subprocess.Popen:
+    """uvicorn with ``workers`` processes, fixture prices and throwaway caches/logs"""
+    scratch = tempfile.mkdtemp(prefix="replay-server-")
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(ROOT),
+        "PRICE_PROVIDER": "fixture",
+        "PRICE_FIXTURE_DIR": fixture_dir,
+        "PRICE_CACHE_DIR": f"{scratch}/prices",
+        "LOG_BACKEND": "file",
+        "LOG_STORE_DIR": f"{scratch}/logs",
+        "LOG_SPOOL_DIR": f"{scratch}/spool",
+        "RESULT_CACHE_BACKEND": "none" if no_result_cache else "memory"
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.app:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+        # Grupo próprio: o encerramento alcança também os processos do pool de render
+        start_new_session=True
+    )
+
+
+def stop_server(server: subprocess.Popen) -> None:
+    try:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        pass
+    except ProcessLookupError:
+        return
+    try:
+        os.killpg(server.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    server.wait()
+
+
+def wait_ready(url: str, server: subprocess.Popen, timeout: float = 180) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"❌ Servidor encerrou com código {server.returncode} antes de ficar pronto")
+        try:
+            if httpx.get(f"{url}/health/ready", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f"❌ Servidor em {url} não ficou pronto em {timeout:.0f}s")
+
+
+def workers_sweep(requests: List[ReplayRequest], args) -> Dict[str, Any]:
+    fixture_dir = write_fixture_dir(t for r in requests for t in r.tickers())
+    url = f"http://127.0.0.1:{args.port}"
+    sweep = {}
+    for workers in [int(w) for w in args.workers_sweep.split(",")]:
+        server = start_server(workers, args.port, fixture_dir, args.no_result_cache)
+        try:
+            wait_ready(url, server)
+            # Com vários workers, /health/ready responde pelo primeiro pronto: aquece todos
+            time.sleep(2)
+            run = asyncio.run(run_against_url(requests, args, url))
+        finally:
+            stop_server(server)
+        sweep[workers] = summarize(run["samples"], run["seconds"])
+        print_report(sweep[workers], f"🧵 {workers} worker(s)")
+
+    print(f"\n  {'workers':>7} {'rps':>8} {'p99':>8} {'erros':>7}")
+    for workers, report in sweep.items():
+        total = report["ALL"]
+        within = "" if args.p99_budget is None or total["p99_s"] <= args.p99_budget else "  ⚠️ acima do orçamento"
+        print(f"  {workers:7d} {total['throughput_rps']:8.2f} {total['p99_s']:8.3f} {total['error_rate']:7.1%}{within}")
+    return {str(workers): report for workers, report in sweep.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded traffic against the API")
+    parser.add_argument("sources", nargs="*", help="JSONL/.jsonl.gz files or directories of logs")
+    parser.add_argument("--from-store", action="store_true", help="Read every log in the configured log store")
+    parser.add_argument("--limit", type=int, help="Replay only the first N requests")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the traffic N times")
+    parser.add_argument("--concurrency", type=int, default=8, help="Max requests in flight")
+    parser.add_argument("--rate", type=float, help="Open loop: requests per second")
+    parser.add_argument("--speedup", type=float, help="Open loop: recorded timing, N times faster")
+    parser.add_argument("--no-plot", action="store_true", help="Replay logged predictions with include_plot=false")
+    parser.add_argument("--no-result-cache", action="store_true", help="Disable the result cache (every request computes)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--url", help="Target a running server instead of the in-process app")
+    parser.add_argument("--workers-sweep", help="Start uvicorn with each worker count (e.g. 1,2,4,8)")
+    parser.add_argument("--port", type=int, default=8765, help="Port used by --workers-sweep")
+    parser.add_argument("--p99-budget", type=float, help="Flag worker counts whose p99 exceeds this (s)")
+    parser.add_argument("--out", help="Write the report JSON here")
+    args = parser.parse_args()
+
+    records = read_store_records() if args.from_store else read_records(args.sources)
+    requests = repeat_traffic(load_traffic(records, include_plot=not args.no_plot, limit=args.limit), args.repeat)
+    if not requests:
+        raise SystemExit("❌ Nenhuma requisição reconhecida nas fontes informadas")
+    mode = f"{args.rate} req/s" if args.rate else f"{args.speedup}x" if args.speedup else "loop fechado"
+    print(f"🔁 {len(requests)} requisições, concorrência {args.concurrency}, {mode}")
+
+    if args.workers_sweep:
+        report = {"workers": workers_sweep(requests, args)}
+    else:
+        if args.url:
+            run = asyncio.run(run_against_url(requests, args, args.url))
+        else:
+            run = asyncio.run(run_in_process(requests, args))
+        report = summarize(run["samples"], run["seconds"])
+        print_report(report, f"⏱️  {run['seconds']:.1f}s")
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
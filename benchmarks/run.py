@@ -0,0 +1,298 @@
+"""
+Offline benchmarks of the prediction pipeline stages
+
+Every input is synthetic and deterministic (seeded random walks served by
+``FixturePriceProvider``), so the suite needs no network nor S3.
+
+Uso:
+    python -m benchmarks.run                                  # mede e compara com benchmarks/baseline.json
+    python -m benchmarks.run --out results.json --threshold 0.3
+    python -m benchmarks.run --save-baseline                  # grava a medição como nova baseline
+    python -m benchmarks.run --quick --only forward,sequences
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+TRADING_DAYS_PER_YEAR = 252
+YEARS = (1, 5, 10, 30)
+BATCH_SIZES = (1, 8, 64, 512)
+DASHBOARD_LOGS = (1000, 10000)
+SEQ_LENGTH = 50
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+
+
+# ==================== SYNTHETIC DATA ====================
+def synthetic_closes(years: int, seed: int = 0):
+    """Geometric random walk of ``years`` trading years, as a Close series"""
+    import pandas as pd
+
+    n = years * TRADING_DAYS_PER_YEAR
+    rng = np.random.default_rng(seed)
+    closes = 50 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, n)))
+    index = pd.bdate_range("1990-01-01", periods=n, name="Date")
+    return pd.Series(closes, index=index, name="Close")
+
+
+def synthetic_log_entries(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = np.random.default_rng(seed)
+    tickers = [f"T{i:03d}" for i in range(200)]
+    entries = []
+    for i in range(n):
+        success = rng.random() > 0.05
+        entry = {
+            "timestamp": f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}T12:00:{i % 60:02d}Z",
+            "request": {"ticker": tickers[i % len(tickers)], "start_date": "2023-01-01", "end_date": "2024-01-01"},
+            "execution": {"duration_seconds": float(rng.gamma(2.0, 0.3)), "success": success}
+        }
+        if success:
+            entry["result"] = {
+                "next_price": 100.0,
+                "price_change_pct": float(rng.normal(0, 2)),
+                "metrics": {"R2": float(rng.uniform(0.5, 0.99))}
+            }
+        entries.append(entry)
+    return entries
+
+
+# ==================== TIMER ====================
+def measure(fn: Callable[[], Any], repeats: int, min_time: float) -> Dict[str, Any]:
+    """Median/min seconds per call; each repeat loops until ``min_time`` has passed"""
+    fn()  # aquecimento
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+
+    samples = [elapsed / number]
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return {
+        "median_s": statistics.median(samples),
+        "min_s": min(samples),
+        "repeats": repeats,
+        "number": number
+    }
+
+
+# ==================== SUITE ====================
+def load_benchmark_model(model_path: Optional[str]):
+    """Trained weights when available; otherwise a seeded random StockLSTM (same cost)"""
+    import torch
+
+    from src.model_utils import StockLSTM, load_model
+
+    if model_path and os.path.exists(model_path):
+        return load_model(model_path)
+    torch.manual_seed(0)
+    return StockLSTM().eval()
+
+
+def build_cases(model_path: Optional[str], quick: bool) -> Dict[str, Callable[[], Callable[[], Any]]]:
+    """
+    Benchmark name -> setup function returning the timed callable
+
+    Setup runs outside the timer, so only the stage itself is measured.
+    """
+    import torch
+    from sklearn.preprocessing import MinMaxScaler
+
+    from api import prediction_utils as pu
+    from api.log_utils import NumpyEncoder
+    from api.price_utils import FixturePriceProvider, PriceCache
+    from api.rollup_utils import DashboardRollup
+    from api.sketch_utils import LogStats
+    from api.storage_utils import encode_log_batch
+
+    model = load_benchmark_model(model_path)
+    years = YEARS[:2] if quick else YEARS
+    closes = {y: synthetic_closes(y, seed=y) for y in YEARS}
+    frames = {y: closes[y].to_frame("Close") for y in YEARS}
+    scaled = {y: MinMaxScaler().fit_transform(frames[y][["Close"]]) for y in YEARS}
+    cases: Dict[str, Callable[[], Callable[[], Any]]] = {}
+
+    for y in years:
+        cases[f"scaling/minmax/{y}y"] = lambda y=y: (lambda: MinMaxScaler().fit_transform(frames[y][["Close"]]))
+        cases[f"sequences/create_sequences/{y}y"] = lambda y=y: (lambda: pu.create_sequences(scaled[y], SEQ_LENGTH))
+        cases[f"sequences/sequence_tensors/{y}y"] = lambda y=y: (lambda: pu.sequence_tensors(scaled[y], SEQ_LENGTH))
+
+        def metrics_case(y=y):
+            n = len(scaled[y]) - SEQ_LENGTH
+            y_true = scaled[y][SEQ_LENGTH:]
+            y_pred = y_true + np.random.default_rng(y).normal(0, 0.01, y_true.shape)
+            return lambda: pu.compute_metrics(y_true[:n], y_pred[:n])
+        cases[f"metrics/compute_metrics/{y}y"] = metrics_case
+
+        def cached_load_case(y=y):
+            # Fonte stub: a primeira leitura popula o cache, as medidas leem do disco
+            provider = FixturePriceProvider(series={"BENCH": closes[y]})
+            cache = PriceCache(tempfile.mkdtemp(prefix="bench-prices-"), provider)
+            start, end = str(closes[y].index[0].date()), str(closes[y].index[-1].date())
+            return lambda: pu.load_stock_data("BENCH", start, end, cache=cache)
+        cases[f"data/load_stock_data_cached/{y}y"] = cached_load_case
+
+        cases[f"pipeline/run_prediction/{y}y"] = lambda y=y: (
+            lambda: pu.run_prediction(frames[y], "BENCH", "1990-01-01", "2020-01-01", model)
+        )
+
+    for n in BATCH_SIZES:
+        def forward_case(n=n):
+            x = torch.from_numpy(
+                np.random.default_rng(n).random((n, SEQ_LENGTH, 1), dtype=np.float32)
+            )
+
+            def run():
+                with torch.no_grad():
+                    return model(x)
+            return run
+        cases[f"forward/stock_lstm/batch_{n}"] = forward_case
+
+    for y in ((1,) if quick else (1, 30)):
+        def plot_case(y=y):
+            _, (y_true, y_pred) = pu.run_prediction(frames[y], "BENCH", "1990-01-01", "2020-01-01", model)
+            return lambda: pu.generate_plot_base64(y_true, y_pred, "BENCH", "1990-01-01", "2020-01-01")
+        cases[f"plot/generate_plot_base64/{y}y"] = plot_case
+
+    def log_entry_case():
+        entry = synthetic_log_entries(1)[0]
+        entry["result"]["metrics"] = {k: np.float64(0.5) for k in ("MSE", "MAE", "RMSE", "MAPE", "R2")}
+        return lambda: json.dumps(entry, ensure_ascii=False, cls=NumpyEncoder)
+    cases["logs/encode_entry"] = log_entry_case
+
+    def log_batch_case():
+        entries = synthetic_log_entries(500)
+        return lambda: encode_log_batch(entries, NumpyEncoder)
+    cases["logs/encode_batch_500"] = log_batch_case
+
+    for n in ((DASHBOARD_LOGS[0],) if quick else DASHBOARD_LOGS):
+        def rollup_case(n=n):
+            entries = synthetic_log_entries(n)
+            return lambda: DashboardRollup().apply(entries)
+        cases[f"dashboard/rollup_apply/{n}"] = rollup_case
+
+        def stats_case(n=n):
+            entries = synthetic_log_entries(n)
+
+            def run():
+                stats = LogStats()
+                stats.add_all(entries)
+                return stats.summary()
+            return run
+        cases[f"dashboard/log_stats/{n}"] = stats_case
+
+    return cases
+
+
+def run_suite(
+    model_path: Optional[str],
+    quick: bool = False,
+    only: Optional[List[str]] = None,
+    repeats: int = 5,
+    min_time: float = 0.2
+) -> Dict[str, Any]:
+    import torch
+
+    results = {}
+    for name, setup in build_cases(model_path, quick).items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        results[name] = measure(setup(), repeats=3 if quick else repeats, min_time=min_time)
+        print(f"  {results[name]['median_s'] * 1e3:10.3f} ms  {name}", flush=True)
+
+    return {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "torch": torch.__version__,
+            "torch_threads": torch.get_num_threads(),
+            "quick": quick
+        },
+        "results": results
+    }
+
+
+# ==================== BASELINE ====================
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """Benchmarks whose median got slower than ``baseline * (1 + threshold)``"""
+    regressions = []
+    for name, result in current["results"].items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            continue
+        ratio = result["median_s"] / reference["median_s"]
+        if ratio > 1 + threshold:
+            regressions.append({
+                "name": name,
+                "baseline_s": reference["median_s"],
+                "current_s": result["median_s"],
+                "ratio": round(ratio, 2)
+            })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the prediction pipeline")
+    parser.add_argument("--out", help="Write results JSON here")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown (0.25 = +25%%)")
+    parser.add_argument("--model", default="models/stock_lstm.pt")
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes and fewer repeats")
+    parser.add_argument("--only", help="Comma-separated name prefixes (e.g. forward,plot)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds per repeat")
+    args = parser.parse_args()
+
+    only = [p.strip() for p in args.only.split(",")] if args.only else None
+    current = run_suite(args.model, args.quick, only, min_time=args.min_time)
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(current, indent=2))
+    if args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(current, indent=2))
+        print(f"✅ Baseline gravada em {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("⚠️  Sem baseline para comparar (use --save-baseline)")
+        return
+    baseline = json.loads(Path(args.baseline).read_text())
+    for key in ("cpu_count", "machine", "torch"):
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"⚠️  Baseline medida com {key}={baseline['meta'].get(key)} (atual: {current['meta'].get(key)})")
+
+    regressions = compare(current, baseline, args.threshold)
+    if not regressions:
+        print(f"✅ Nenhuma regressão acima de {args.threshold:.0%}")
+        return
+    print(f"❌ {len(regressions)} regressões acima de {args.threshold:.0%}:")
+    for r in regressions:
+        print(f"  {r['ratio']:5.2f}x  {r['name']}  ({r['baseline_s'] * 1e3:.3f} ms -> {r['current_s'] * 1e3:.3f} ms)")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,5 @@
 from playwright.sync_api import sync_playwright
 import pandas as pd
-import yfinance as yf 
 import time
 from pathlib import Path
 from playwright.async_api import async_playwright
@@ -75,22 +74,10 @@ def obter_tickers_yfinance() -> list:
 
 # --- EXEMPLO DE USO ---
 if __name__ == "__main__":
-    
-    lista_de_tickers = obter_tickers_yfinance()
-    
-    dados = yf.download(lista_de_tickers, period="10y")
+    # Download em lotes, com retentativas e retomada, para o store local de preços (ver src/ingest.py)
+    import sys
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-    # print(dados.head())
+    from src.ingest import main
 
-    df_long = dados.stack(level=1)
-
-    df_long = df_long.reset_index().rename(columns={'level_1': 'Ticker'}) 
-    
-    # print(len(df_long))
-    
-    # antiga eletrobras ELET3 mudou para AXIA3
-    # print(df_long[df_long['Ticker'] == 'AXIA6.SA'].head())
-    # print(df_long[df_long['Ticker'] == 'AXIA3.SA'].head())
-
-
-    
+    main()
@@ -0,0 +1,295 @@
+"""
+Walk-forward backtest of the LSTM over a ticker universe
+
+Each ticker's history is split into consecutive test folds of ``step``
+days. Every fold is scaled with a MinMaxScaler range computed **only** from
+the closes before the fold starts, and each day in the fold is predicted
+from the previous ``SEQUENCE_LENGTH`` closes. No future close ever reaches
+the scaler, unlike ``predict_stock``, which refits it on the whole range.
+The model weights are fixed; the backtest measures them, it does not retrain.
+
+Closes are read from the local ``PriceCache`` store (``PRICE_CACHE_DIR``),
+so runs are offline. Tickers are spread over a process pool and each
+finished ticker is written to ``<out>/tickers/<TICKER>.json`` right away:
+rerunning with the same ``--out`` and parameters skips them.
+
+Uso:
+    python -m src.backtest --out backtests/ibov                     # universo de data/ibov_tickers.csv
+    python -m src.backtest --tickers PETR4.SA,VALE3.SA --out backtests/teste --workers 2
+    python -m src.backtest --out backtests/ibov --start 2015-01-01 --step 5 --min-train 504
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+SEQUENCE_LENGTH = 50
+METRICS = ("MSE", "MAE", "RMSE", "MAPE", "R2")
+DEFAULT_UNIVERSE = Path(__file__).resolve().parent.parent / "data" / "ibov_tickers.csv"
+
+
+# ==================== UNIVERSE ====================
+def read_universe(source: str) -> List[str]:
+    """Tickers from a CSV (``codigo`` column, B3 codes get ``.SA``) or a comma-separated list"""
+    if source.endswith(".csv"):
+        codes = pd.read_csv(source, dtype=str)["codigo"].dropna().str.strip()
+        return [code if "." in code else f"{code}.SA" for code in codes if code]
+    return [t.strip().upper() for t in source.split(",") if t.strip()]
+
+
+# ==================== WALK-FORWARD ====================
+def walk_forward_windows(closes: np.ndarray, min_train: int, step: int):
+    """
+    Scaled input windows and targets of every fold
+
+    Returns ``(X, y, fold_ranges, fold_index)``: ``X`` is ``(N, SEQUENCE_LENGTH)``
+    scaled with each fold's past-only range, ``y`` the true closes,
+    ``fold_ranges`` the ``(min, max)`` of each fold and ``fold_index`` the
+    fold of every row.
+    """
+    closes = np.asarray(closes, dtype=np.float32)
+    windows, targets, ranges, index = [], [], [], []
+    for fold, start in enumerate(range(max(min_train, SEQUENCE_LENGTH), len(closes), step)):
+        end = min(start + step, len(closes))
+        past = closes[:start]
+        lo, hi = float(past.min()), float(past.max())
+        span = (hi - lo) or 1.0
+        # Janela do dia i = closes[i-50:i]; dias do fold já observados entram na entrada, nunca no scaler
+        fold_windows = np.lib.stride_tricks.sliding_window_view(closes[start - SEQUENCE_LENGTH:end - 1], SEQUENCE_LENGTH)
+        windows.append((fold_windows - lo) / span)
+        targets.append(closes[start:end])
+        ranges.append((lo, hi))
+        index.append(np.full(end - start, fold, dtype=np.int32))
+    if not windows:
+        empty = np.empty((0, SEQUENCE_LENGTH), dtype=np.float32)
+        return empty, np.empty(0, dtype=np.float32), [], np.empty(0, dtype=np.int32)
+    return (
+        np.concatenate(windows).astype(np.float32),
+        np.concatenate(targets),
+        ranges,
+        np.concatenate(index)
+    )
+
+
+def backtest_series(model, closes: np.ndarray, min_train: int, step: int, chunk_size: int = 4096) -> Dict[str, Any]:
+    """Walk-forward predictions and metrics of one close series"""
+    import torch
+
+    from api.prediction_utils import compute_metrics
+
+    X, y_true, ranges, fold_index = walk_forward_windows(closes, min_train, step)
+    if len(X) == 0:
+        raise ValueError(f"Dados insuficientes para o backtest (mínimo {max(min_train, SEQUENCE_LENGTH) + 1} dias)")
+
+    x = torch.from_numpy(X).unsqueeze(-1)
+    with torch.inference_mode():
+        y_scaled = torch.cat([model(x[i:i + chunk_size]) for i in range(0, len(x), chunk_size)]).numpy().ravel()
+
+    lo = np.array([r[0] for r in ranges], dtype=np.float32)[fold_index]
+    span = np.array([(r[1] - r[0]) or 1.0 for r in ranges], dtype=np.float32)[fold_index]
+    y_pred = y_scaled * span + lo
+
+    # Previsão ingênua (fechamento anterior) como referência
+    y_naive = X[:, -1] * span + lo
+    return {
+        "folds": len(ranges),
+        "predictions": int(len(y_true)),
+        "metrics": compute_metrics(y_true, y_pred),
+        "naive_metrics": compute_metrics(y_true, y_naive)
+    }
+
+
+# ==================== WORKERS ====================
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(model_path: str, store_dir: str, threads: int) -> None:
+    import torch
+
+    from api.price_utils import PriceCache
+    from src.model_utils import load_model
+
+    torch.set_num_threads(threads)
+    _worker["model"] = load_model(model_path)
+    _worker["store"] = PriceCache(store_dir)
+
+
+def _run_ticker(ticker: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    close, _ = _worker["store"].read(ticker)
+    if close is None or close.empty:
+        raise ValueError(f"{ticker} não está no store local (rode a ingestão antes)")
+    if params["start"]:
+        close = close[close.index >= pd.Timestamp(params["start"])]
+    if params["end"]:
+        close = close[close.index < pd.Timestamp(params["end"])]
+
+    result = backtest_series(_worker["model"], close.to_numpy(), params["min_train"], params["step"])
+    return {
+        "ticker": ticker,
+        "first_date": str(close.index[0].date()),
+        "last_date": str(close.index[-1].date()),
+        **result
+    }
+
+
+# ==================== RUN ====================
+def run_fingerprint(model_path: str, params: Dict[str, Any]) -> str:
+    """Identifies results that can be reused by a resumed run"""
+    from api.registry_utils import file_checksum
+
+    payload = json.dumps({"model": file_checksum(model_path), **params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def load_done(tickers_dir: Path, fingerprint: str) -> Dict[str, Dict[str, Any]]:
+    done = {}
+    for path in tickers_dir.glob("*.json"):
+        try:
+            result = json.loads(path.read_text())
+        except ValueError:
+            continue
+        if result.get("fingerprint") == fingerprint:
+            done[result["ticker"]] = result
+    return done
+
+
+def write_json(path: Path, data: Any) -> None:
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(json.dumps(data, indent=2))
+    os.replace(tmp, path)
+
+
+def run_backtest(
+    tickers: List[str],
+    model_path: str,
+    store_dir: str,
+    out_dir: str,
+    min_train: int = 252,
+    step: int = 21,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    workers: Optional[int] = None,
+    threads_per_worker: int = 1
+) -> Dict[str, Any]:
+    """
+    Backtest ``tickers`` in a process pool, skipping those already in ``out_dir``
+
+    Returns ``{"results": [...], "errors": {ticker: message}}``.
+    """
+    params = {"min_train": min_train, "step": step, "start": start, "end": end}
+    fingerprint = run_fingerprint(model_path, params)
+    tickers_dir = Path(out_dir) / "tickers"
+    tickers_dir.mkdir(parents=True, exist_ok=True)
+
+    done = load_done(tickers_dir, fingerprint)
+    pending = [t for t in dict.fromkeys(tickers) if t not in done]
+    print(f"📊 {len(tickers)} tickers: {len(done)} já concluídos, {len(pending)} a processar")
+
+    errors: Dict[str, str] = {}
+    if pending:
+        workers = workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(pending)),
+            initializer=_init_worker,
+            initargs=(model_path, store_dir, threads_per_worker)
+        ) as pool:
+            futures = {pool.submit(_run_ticker, ticker, params): ticker for ticker in pending}
+            for future in as_completed(futures):
+                ticker = futures[future]
+                try:
+                    result = {**future.result(), "fingerprint": fingerprint}
+                except Exception as e:
+                    errors[ticker] = str(e)
+                    print(f"⚠️  {ticker}: {e}")
+                    continue
+                write_json(tickers_dir / f"{ticker.replace('/', '_')}.json", result)
+                done[ticker] = result
+                print(f"✅ {ticker}: MAPE {result['metrics']['MAPE']}% ({result['predictions']} previsões)")
+
+    results = [done[t] for t in dict.fromkeys(tickers) if t in done]
+    return {"results": results, "errors": errors}
+
+
+# ==================== TABLES ====================
+def per_ticker_table(results: List[Dict[str, Any]]) -> pd.DataFrame:
+    rows = []
+    for r in results:
+        row = {"ticker": r["ticker"], "first_date": r["first_date"], "last_date": r["last_date"],
+               "folds": r["folds"], "predictions": r["predictions"]}
+        row.update(r["metrics"])
+        row.update({f"naive_{k}": v for k, v in r["naive_metrics"].items()})
+        rows.append(row)
+    return pd.DataFrame(rows, columns=["ticker", "first_date", "last_date", "folds", "predictions",
+                                       *METRICS, *(f"naive_{k}" for k in METRICS)])
+
+
+def aggregate_table(per_ticker: pd.DataFrame) -> pd.DataFrame:
+    """
+    Mean, median and prediction-weighted mean of each metric across tickers
+
+    MSE/MAE/RMSE are in each ticker's price units, so MAPE and R² are the
+    comparable columns.
+    """
+    columns = [*METRICS, *(f"naive_{k}" for k in METRICS)]
+    if per_ticker.empty:
+        return pd.DataFrame(columns=columns)
+    weights = per_ticker["predictions"]
+    return pd.DataFrame({
+        "mean": per_ticker[columns].mean(),
+        "median": per_ticker[columns].median(),
+        "weighted": per_ticker[columns].mul(weights, axis=0).sum() / weights.sum()
+    }).T
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward backtest with past-only scaling")
+    parser.add_argument("--tickers", default=str(DEFAULT_UNIVERSE), help="CSV with a 'codigo' column or comma-separated tickers")
+    parser.add_argument("--model", default="models/stock_lstm.pt")
+    parser.add_argument("--store", default=os.getenv("PRICE_CACHE_DIR", "/app/cache/prices"), help="PriceCache directory")
+    parser.add_argument("--out", required=True, help="Output directory (reused to resume)")
+    parser.add_argument("--min-train", type=int, default=252, help="Days before the first fold")
+    parser.add_argument("--step", type=int, default=21, help="Days per fold (scaler refit interval)")
+    parser.add_argument("--start", help="Ignore closes before this date")
+    parser.add_argument("--end", help="Ignore closes from this date on")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    args = parser.parse_args()
+
+    run = run_backtest(
+        read_universe(args.tickers),
+        args.model,
+        args.store,
+        args.out,
+        min_train=args.min_train,
+        step=args.step,
+        start=args.start,
+        end=args.end,
+        workers=args.workers,
+        threads_per_worker=args.threads_per_worker
+    )
+
+    out = Path(args.out)
+    per_ticker = per_ticker_table(run["results"])
+    aggregate = aggregate_table(per_ticker)
+    per_ticker.to_csv(out / "per_ticker.csv", index=False)
+    aggregate.to_csv(out / "aggregate.csv")
+    write_json(out / "errors.json", run["errors"])
+
+    with pd.option_context("display.width", 200, "display.max_columns", 20):
+        print(per_ticker[["ticker", "predictions", *METRICS]].to_string(index=False))
+        print()
+        print(aggregate[list(METRICS)].round(4).to_string())
+    if run["errors"]:
+        print(f"⚠️  {len(run['errors'])} tickers com erro (ver {out / 'errors.json'})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Resumable download of a ticker universe into the local price store
+
+Tickers are fetched in chunks (one multi-ticker ``fetch_many`` call each)
+by a bounded thread pool. Every call goes through a shared rate limiter
+and failed or empty tickers are retried with exponential backoff. Each
+ticker lands in the ``PriceCache`` store (``<store>/<TICKER>.npz``, float32
+closes) that the API, ``src.backtest`` and ``src.train`` read. Only the
+date ranges not yet covered are downloaded, and ``ingest_manifest.json``
+records the outcome of every ticker, so an interrupted run picks up where
+it stopped.
+
+The provider is the same one the API uses (``PRICE_PROVIDER=yahoo`` or
+``fixture`` with ``PRICE_FIXTURE_DIR``), so the pipeline runs offline.
+
+Uso:
+    python -m src.ingest                                   # universo de data/ibov_tickers.csv, 10 anos
+    python -m src.ingest --tickers PETR4.SA,VALE3.SA --start 2015-01-01
+    python -m src.ingest --concurrency 2 --rate 0.5 --chunk-size 20
+    PRICE_PROVIDER=fixture PRICE_FIXTURE_DIR=data/fixtures python -m src.ingest --store /tmp/prices
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from src.backtest import DEFAULT_UNIVERSE, read_universe
+
+
+MANIFEST_NAME = "ingest_manifest.json"
+# Lacunas com até este número de dias úteis podem vir vazias de verdade (feriados, Carnaval)
+HOLIDAY_WEEKDAYS = 3
+
+
+class RateLimiter:
+    """Token bucket shared by the download threads (``rate`` calls per second)"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Manifest:
+    """Per-ticker ingest status, rewritten atomically after every chunk"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            self.data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            self.data = {"tickers": {}}
+
+    def status(self, ticker: str) -> Optional[str]:
+        return self.data["tickers"].get(ticker, {}).get("status")
+
+    def update(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        now = datetime.utcnow().isoformat() + "Z"
+        with self._lock:
+            for ticker, entry in entries.items():
+                self.data["tickers"][ticker] = {**entry, "updated_at": now}
+            self.data["updated_at"] = now
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f".{self.path.name}.tmp")
+            tmp.write_text(json.dumps(self.data, indent=2))
+            os.replace(tmp, self.path)
+
+
+class Ingestor:
+    """
+    Downloads ``[start, end)`` for many tickers into a ``PriceCache``
+
+    Args:
+        cache: Destination store; its provider is the data source
+        chunk_size: Tickers per ``fetch_many`` call
+        concurrency: Chunks downloaded at once
+        rate: Provider calls per second across all threads (0 = unlimited)
+        retries: Extra attempts for tickers that failed or came back empty
+        backoff: Base delay in seconds, doubled on every attempt (plus jitter)
+    """
+
+    def __init__(
+        self,
+        cache,
+        manifest: Manifest,
+        chunk_size: int = 10,
+        concurrency: int = 4,
+        rate: float = 1.0,
+        retries: int = 3,
+        backoff: float = 2.0
+    ):
+        self.cache = cache
+        self.manifest = manifest
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate, burst=concurrency)
+        self.retries = retries
+        self.backoff = backoff
+
+    def fetch_with_retries(self, symbols: List[str], start: str, end: str, required: Set[str]):
+        """
+        ``(fetched, attempts, errors)`` for one date range
+
+        Symbols in ``required`` have no stored history yet or the range is
+        longer than a holiday span, so an empty answer is retried like an
+        error; for the others it just means no trading days in the gap.
+        """
+        fetched, errors = {}, {}
+        pending = list(symbols)
+        attempt = 0
+        while pending:
+            attempt += 1
+            self.limiter.acquire()
+            try:
+                result = self.cache.provider.fetch_many(pending, start, end)
+                for symbol in pending:
+                    close = result.get(symbol)
+                    errors.pop(symbol, None)
+                    if close is not None and (not close.empty or symbol not in required):
+                        fetched[symbol] = close
+                pending = [s for s in pending if s not in fetched]
+            except Exception as e:
+                errors.update({s: str(e) for s in pending})
+            if pending and attempt <= self.retries:
+                time.sleep(self.backoff * 2 ** (attempt - 1) * (1 + random.random() * 0.25))
+            else:
+                break
+        return fetched, attempt, errors
+
+    def ingest_chunk(self, symbols: List[str], start: str, end: str) -> Dict[str, Dict[str, Any]]:
+        """Download the missing ranges of ``symbols`` and merge them into the store"""
+        from api.price_utils import weekdays
+
+        entries: Dict[str, Dict[str, Any]] = {}
+        pending: Dict[tuple, List[str]] = {}
+        stored = {}
+        for symbol in symbols:
+            close, covered = self.cache.read(symbol)
+            stored[symbol] = (close, covered)
+            gaps = self.cache.missing_ranges(covered, start, end, symbol)
+            if not gaps:
+                entries[symbol] = {"status": "done", "rows": len(close), "attempts": 0}
+            for gap in gaps:
+                pending.setdefault(gap, []).append(symbol)
+
+        for (gap_start, gap_end), gap_symbols in sorted(pending.items()):
+            # Resposta vazia só é aceita sem retentativa para quem já tem histórico e lacunas curtas
+            long_gap = weekdays(gap_start, min(gap_end, str(date.today()))) > HOLIDAY_WEEKDAYS
+            required = {s for s in gap_symbols if long_gap or stored[s][0] is None or stored[s][0].empty}
+            fetched, attempts, errors = self.fetch_with_retries(gap_symbols, gap_start, gap_end, required)
+            for symbol in gap_symbols:
+                close, covered = stored[symbol]
+                if entries.get(symbol, {}).get("status") in ("failed", "empty"):
+                    continue  # outra lacuna do mesmo ticker já falhou
+                if symbol in fetched:
+                    # Lotes não compartilham tickers: nenhuma outra thread grava este arquivo
+                    close, covered = self.cache.merge(symbol, close, covered, fetched[symbol], gap_start, gap_end)
+                    stored[symbol] = (close, covered)
+                    entries[symbol] = {"status": "done", "rows": len(close), "attempts": attempts}
+                elif symbol in errors:
+                    entries[symbol] = {"status": "failed", "error": errors[symbol], "attempts": attempts}
+                elif close is not None and not close.empty:
+                    # Ticker conhecido sem dados numa lacuna longa: falha do provedor, fica pendente
+                    entries[symbol] = {
+                        "status": "failed",
+                        "error": f"resposta vazia para {gap_start} a {gap_end}",
+                        "attempts": attempts
+                    }
+                else:
+                    entries[symbol] = {"status": "empty", "attempts": attempts}
+        return entries
+
+    def run(self, tickers: List[str], start: str, end: str, retry_empty: bool = False) -> Dict[str, int]:
+        """Ingest every ticker; returns how many ended in each status"""
+        tickers = [
+            t for t in dict.fromkeys(tickers)
+            if retry_empty or self.manifest.status(t) != "empty"
+        ]
+        chunks = [tickers[i:i + self.chunk_size] for i in range(0, len(tickers), self.chunk_size)]
+        print(f"📥 {len(tickers)} tickers em {len(chunks)} lotes ({start} a {end})")
+
+        counts: Dict[str, int] = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="ingest") as pool:
+            futures = {pool.submit(self.ingest_chunk, chunk, start, end): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                try:
+                    entries = future.result()
+                except Exception as e:
+                    entries = {t: {"status": "failed", "error": str(e), "attempts": 0} for t in futures[future]}
+                self.manifest.update(entries)
+                for ticker, entry in entries.items():
+                    counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+                    if entry["status"] != "done":
+                        print(f"⚠️  {ticker}: {entry['status']} {entry.get('error', '')}".rstrip())
+                print(f"✅ Lote concluído ({sum(counts.values())}/{len(tickers)})")
+        return counts
+
+
+def main():
+    from api.price_utils import FixturePriceProvider, PriceCache, get_price_provider
+
+    today = date.today()
+    parser = argparse.ArgumentParser(description="Download a ticker universe into the local price store")
+    parser.add_argument("--tickers", default=str(DEFAULT_UNIVERSE), help="CSV with a 'codigo' column or comma-separated tickers")
+    parser.add_argument("--store", default=os.getenv("PRICE_CACHE_DIR", "/app/cache/prices"), help="PriceCache directory")
+    parser.add_argument("--start", default=str(today.replace(year=today.year - 10)), help="Default: 10 years ago")
+    parser.add_argument("--end", default=str(today + timedelta(days=1)), help="Exclusive; default: tomorrow")
+    parser.add_argument("--chunk-size", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=1.0, help="Provider calls per second (0 = unlimited)")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--backoff", type=float, default=2.0, help="Base retry delay in seconds")
+    parser.add_argument("--fixture-dir", help="Read <SYMBOL>.csv files instead of Yahoo Finance")
+    parser.add_argument("--retry-empty", action="store_true", help="Retry tickers that returned no data before")
+    args = parser.parse_args()
+
+    provider = FixturePriceProvider(args.fixture_dir) if args.fixture_dir else get_price_provider()
+    cache = PriceCache(args.store, provider)
+    ingestor = Ingestor(
+        cache,
+        Manifest(Path(args.store) / MANIFEST_NAME),
+        chunk_size=args.chunk_size,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        retries=args.retries,
+        backoff=args.backoff
+    )
+    counts = ingestor.run(read_universe(args.tickers), args.start, args.end, retry_empty=args.retry_empty)
+    print(f"📊 {counts} — manifesto em {Path(args.store) / MANIFEST_NAME}")
+    if counts.get("failed"):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,10 @@ import joblib
 from pathlib import Path
 
 class StockLSTM(nn.Module):
-    def __init__(self, input_size=1, hidden_size=64, num_layers=2):
+    def __init__(self, input_size=1, hidden_size=64, num_layers=2, dropout=0.0):
         super().__init__()
-        self.lstm = nn.LSTM(input_size, hidden_size, num_layers, batch_first=True)
+        # dropout só atua entre camadas do LSTM durante o treino; não altera o state dict
+        self.lstm = nn.LSTM(input_size, hidden_size, num_layers, batch_first=True, dropout=dropout)
         self.fc = nn.Linear(hidden_size, 1)
 
     def forward(self, x):
@@ -15,16 +16,29 @@ class StockLSTM(nn.Module):
         return out
 
 
+def load_model(weights_path, input_size: int = 1, hidden_size: int = 64, num_layers: int = 2) -> StockLSTM:
+    """
+    Build a StockLSTM whose parameters are memory-mapped from ``weights_path``
+
+    The module is created on the meta device (no allocation) and the
+    mmapped tensors are assigned as its parameters, so the weights live in
+    the page cache instead of being copied into process memory.
+    """
+    with torch.device("meta"):
+        model = StockLSTM(input_size=input_size, hidden_size=hidden_size, num_layers=num_layers)
+    state = torch.load(weights_path, map_location="cpu", mmap=True, weights_only=True)
+    model.load_state_dict(state, assign=True)
+    model.eval()
+    return model
+
+
 def load_artifacts(artifacts_dir: str = "artifacts"):
     artifacts_dir = Path(artifacts_dir)
     model_path = artifacts_dir / "stock_lstm.pt"
     scaler_path = artifacts_dir / "scaler.joblib"
     if not model_path.exists() or not scaler_path.exists():
         raise FileNotFoundError("Artifacts not found. Train notebook and save artifacts first.")
-    model = StockLSTM()
-    state = torch.load(model_path, map_location="cpu")
-    model.load_state_dict(state)
-    model.eval()
+    model = load_model(model_path)
     scaler = joblib.load(scaler_path)
     return model, scaler
 
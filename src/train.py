@@ -0,0 +1,318 @@
+"""
+Streaming training of the StockLSTM over a ticker universe
+
+Each ticker's closes are kept as one contiguous float32 array; the
+``WindowDataset`` slices its 50-day windows on demand, so memory holds the
+closes once (not ``N x 50`` windows) plus the batches being prefetched by
+the ``DataLoader`` workers. A window never spans two tickers, and the last
+``--val-fraction`` of every ticker's windows is held out for validation.
+
+Closes come from the local ``PriceCache`` store (``PRICE_CACHE_DIR``). A
+checkpoint is written after every epoch; ``--resume`` continues from it.
+The best epoch is saved as ``stock_lstm.pt`` + ``scaler.joblib``, the same
+artifacts the model registry reads (``--register`` adds them as a version).
+
+Uso:
+    python -m src.train --out artifacts                        # universo de data/ibov_tickers.csv
+    python -m src.train --out artifacts --resume --epochs 150
+    python -m src.train --tickers PETR4.SA,VALE3.SA --out /tmp/run --epochs 5 --register
+"""
+
+import argparse
+import bisect
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+from sklearn.preprocessing import MinMaxScaler
+from torch.utils.data import DataLoader, Dataset
+
+from src.backtest import DEFAULT_UNIVERSE, read_universe
+from src.model_utils import StockLSTM
+
+
+SEQUENCE_LENGTH = 50
+
+
+# ==================== DATA ====================
+def load_series(tickers: Sequence[str], store_dir: str, start: Optional[str], end: Optional[str]) -> Dict[str, np.ndarray]:
+    """Float32 closes per ticker from the local store (tickers too short are skipped)"""
+    from api.price_utils import PriceCache
+
+    store = PriceCache(store_dir)
+    series = {}
+    for ticker in tickers:
+        close, _ = store.read(ticker)
+        if close is None:
+            print(f"⚠️  {ticker} não está no store local. Ignorando.")
+            continue
+        if start:
+            close = close[close.index >= pd.Timestamp(start)]
+        if end:
+            close = close[close.index < pd.Timestamp(end)]
+        closes = close.dropna().to_numpy(dtype=np.float32)
+        if len(closes) <= SEQUENCE_LENGTH + 1:
+            print(f"⚠️  {ticker}: apenas {len(closes)} dias. Ignorando.")
+            continue
+        series[ticker] = closes
+    return series
+
+
+def fit_scalers(series: Dict[str, np.ndarray], scaling: str) -> Tuple[MinMaxScaler, Dict[str, np.ndarray]]:
+    """
+    Scaled copies of every series, plus the scaler saved as artifact
+
+    ``ticker`` scales each ticker on its own range, like the API does per
+    request; ``global`` uses one range for all tickers (notebook recipe).
+    The returned ``MinMaxScaler`` is always the global one (fitted
+    incrementally), which is what ``scaler.joblib`` stores.
+    """
+    scaler = MinMaxScaler()
+    for closes in series.values():
+        scaler.partial_fit(closes.reshape(-1, 1))
+
+    scaled = {}
+    for ticker, closes in series.items():
+        if scaling == "global":
+            lo, span = float(scaler.data_min_[0]), float(scaler.data_range_[0]) or 1.0
+        else:
+            lo, span = float(closes.min()), float(closes.max() - closes.min()) or 1.0
+        scaled[ticker] = ((closes - lo) / span).astype(np.float32)
+    return scaler, scaled
+
+
+class WindowDataset(Dataset):
+    """
+    ``(window, target)`` pairs sliced lazily from per-ticker arrays
+
+    Args:
+        series: Scaled float32 closes, one contiguous array per ticker
+        ranges: ``(first, last)`` target indices used from each array
+            (half-open); targets outside them are never produced
+    """
+
+    def __init__(self, series: List[np.ndarray], ranges: List[Tuple[int, int]]):
+        self.series = [torch.from_numpy(np.ascontiguousarray(s, dtype=np.float32)) for s in series]
+        self.ranges = ranges
+        self.offsets = [0]
+        for first, last in ranges:
+            self.offsets.append(self.offsets[-1] + max(0, last - first))
+
+    def __len__(self) -> int:
+        return self.offsets[-1]
+
+    def __getitem__(self, index: int):
+        k = bisect.bisect_right(self.offsets, index) - 1
+        target = self.ranges[k][0] + index - self.offsets[k]
+        s = self.series[k]
+        return s[target - SEQUENCE_LENGTH:target].unsqueeze(-1), s[target:target + 1]
+
+
+def split_datasets(scaled: Dict[str, np.ndarray], val_fraction: float) -> Tuple[WindowDataset, WindowDataset]:
+    """Chronological split inside each ticker: the last windows go to validation"""
+    arrays, train_ranges, val_ranges = [], [], []
+    for closes in scaled.values():
+        n_windows = len(closes) - SEQUENCE_LENGTH
+        split = SEQUENCE_LENGTH + n_windows - int(n_windows * val_fraction)
+        arrays.append(closes)
+        train_ranges.append((SEQUENCE_LENGTH, split))
+        val_ranges.append((split, len(closes)))
+    return WindowDataset(arrays, train_ranges), WindowDataset(arrays, val_ranges)
+
+
+# ==================== TRAINING ====================
+def run_epoch(model, loader, loss_fn, device, optimizer=None) -> Dict[str, float]:
+    """One pass over ``loader``; trains when ``optimizer`` is given"""
+    model.train(optimizer is not None)
+    sse = sae = 0.0
+    count = 0
+    with torch.set_grad_enabled(optimizer is not None):
+        for x, y in loader:
+            x, y = x.to(device, non_blocking=True), y.to(device, non_blocking=True)
+            pred = model(x)
+            loss = loss_fn(pred, y)
+            if optimizer is not None:
+                optimizer.zero_grad(set_to_none=True)
+                loss.backward()
+                optimizer.step()
+            diff = (pred.detach() - y).float()
+            sse += float((diff ** 2).sum())
+            sae += float(diff.abs().sum())
+            count += len(y)
+    mse = sse / max(count, 1)
+    return {"MSE": mse, "RMSE": mse ** 0.5, "MAE": sae / max(count, 1)}
+
+
+def save_atomic(obj: Any, path: Path) -> None:
+    tmp = path.with_name(f".{path.name}.tmp")
+    torch.save(obj, tmp)
+    os.replace(tmp, path)
+
+
+def train(
+    series: Dict[str, np.ndarray],
+    out_dir: str,
+    epochs: int = 100,
+    batch_size: int = 256,
+    lr: float = 0.01,
+    hidden_size: int = 64,
+    num_layers: int = 2,
+    dropout: float = 0.2,
+    val_fraction: float = 0.2,
+    scaling: str = "ticker",
+    workers: int = 2,
+    resume: bool = False,
+    seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Train and write ``stock_lstm.pt``, ``scaler.joblib``, ``training.json``
+
+    Returns the training summary (config and per-epoch history).
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    checkpoint_path = out / "checkpoint.pt"
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    scaler, scaled = fit_scalers(series, scaling)
+    train_set, val_set = split_datasets(scaled, val_fraction)
+    config = {
+        "architecture": "StockLSTM",
+        "input_size": 1,
+        "hidden_size": hidden_size,
+        "num_layers": num_layers,
+        "sequence_length": SEQUENCE_LENGTH,
+        "dropout": dropout,
+        "scaling": scaling,
+        "tickers": list(series),
+        "train_windows": len(train_set),
+        "val_windows": len(val_set),
+        "batch_size": batch_size,
+        "lr": lr
+    }
+    print(f"📚 {len(series)} tickers: {len(train_set)} janelas de treino, {len(val_set)} de validação")
+
+    torch.manual_seed(seed)
+    model = StockLSTM(hidden_size=hidden_size, num_layers=num_layers, dropout=dropout).to(device)
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+    generator = torch.Generator().manual_seed(seed)
+    history: List[Dict[str, Any]] = []
+    best = {"epoch": -1, "val_MSE": float("inf")}
+    start_epoch = 0
+
+    if resume and checkpoint_path.exists():
+        checkpoint = torch.load(checkpoint_path, map_location=device, weights_only=False)
+        if checkpoint["config"] != config:
+            raise ValueError("Checkpoint foi gerado com outra configuração/dados; use outro --out")
+        model.load_state_dict(checkpoint["model"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        generator.set_state(checkpoint["generator"])
+        torch.set_rng_state(checkpoint["rng"])
+        history, best = checkpoint["history"], checkpoint["best"]
+        start_epoch = checkpoint["epoch"] + 1
+        print(f"🔁 Retomando da época {start_epoch}")
+
+    loader_kwargs = {"batch_size": batch_size, "num_workers": workers, "pin_memory": device.type == "cuda"}
+    if workers > 0:
+        loader_kwargs.update(persistent_workers=True, prefetch_factor=4)
+    train_loader = DataLoader(train_set, shuffle=True, generator=generator, drop_last=False, **loader_kwargs)
+    val_loader = DataLoader(val_set, shuffle=False, **loader_kwargs)
+    loss_fn = nn.MSELoss()
+
+    for epoch in range(start_epoch, epochs):
+        started = time.perf_counter()
+        train_metrics = run_epoch(model, train_loader, loss_fn, device, optimizer)
+        val_metrics = run_epoch(model, val_loader, loss_fn, device) if len(val_set) else {}
+        record = {
+            "epoch": epoch,
+            "seconds": round(time.perf_counter() - started, 2),
+            **{f"train_{k}": v for k, v in train_metrics.items()},
+            **{f"val_{k}": v for k, v in val_metrics.items()}
+        }
+        history.append(record)
+
+        score = val_metrics.get("MSE", train_metrics["MSE"])
+        if score < best["val_MSE"]:
+            best = {"epoch": epoch, "val_MSE": score}
+            save_atomic(model.state_dict(), out / "stock_lstm.pt")
+            joblib.dump(scaler, out / "scaler.joblib")
+        save_atomic({
+            "epoch": epoch,
+            "config": config,
+            "model": model.state_dict(),
+            "optimizer": optimizer.state_dict(),
+            "generator": generator.get_state(),
+            "rng": torch.get_rng_state(),
+            "history": history,
+            "best": best
+        }, checkpoint_path)
+        print(
+            f"Época {epoch}: train MSE {train_metrics['MSE']:.6f}"
+            + (f", val MSE {val_metrics['MSE']:.6f}" if val_metrics else "")
+            + f" ({record['seconds']}s)"
+        )
+
+    summary = {"config": config, "best": best, "history": history}
+    (out / "training.json").write_text(json.dumps(summary, indent=2))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the StockLSTM from the local price store")
+    parser.add_argument("--tickers", default=str(DEFAULT_UNIVERSE), help="CSV with a 'codigo' column or comma-separated tickers")
+    parser.add_argument("--store", default=os.getenv("PRICE_CACHE_DIR", "/app/cache/prices"), help="PriceCache directory")
+    parser.add_argument("--out", default="artifacts", help="Artifacts and checkpoint directory")
+    parser.add_argument("--start", help="Ignore closes before this date")
+    parser.add_argument("--end", help="Ignore closes from this date on")
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--lr", type=float, default=0.01)
+    parser.add_argument("--hidden-size", type=int, default=64)
+    parser.add_argument("--num-layers", type=int, default=2)
+    parser.add_argument("--dropout", type=float, default=0.2)
+    parser.add_argument("--val-fraction", type=float, default=0.2)
+    parser.add_argument("--scaling", choices=("ticker", "global"), default="ticker")
+    parser.add_argument("--workers", type=int, default=2, help="DataLoader worker processes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--resume", action="store_true", help="Continue from <out>/checkpoint.pt")
+    parser.add_argument("--register", action="store_true", help="Register the best model in MODEL_REGISTRY_DIR")
+    args = parser.parse_args()
+
+    series = load_series(read_universe(args.tickers), args.store, args.start, args.end)
+    if not series:
+        raise SystemExit("❌ Nenhum ticker com dados suficientes no store local")
+
+    summary = train(
+        series,
+        args.out,
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        lr=args.lr,
+        hidden_size=args.hidden_size,
+        num_layers=args.num_layers,
+        dropout=args.dropout,
+        val_fraction=args.val_fraction,
+        scaling=args.scaling,
+        workers=args.workers,
+        resume=args.resume,
+        seed=args.seed
+    )
+    print(f"✅ Melhor época {summary['best']['epoch']} (MSE {summary['best']['val_MSE']:.6f}): {args.out}/stock_lstm.pt")
+
+    if args.register:
+        from api.registry_utils import ModelRegistry
+
+        config = {k: summary["config"][k] for k in ("hidden_size", "num_layers", "scaling")}
+        version = ModelRegistry().register(f"{args.out}/stock_lstm.pt", f"{args.out}/scaler.joblib", config=config)
+        print(f"✅ Versão registrada: {version} (ative com python -m api.registry_utils activate {version})")
+
+
+if __name__ == "__main__":
+    main()